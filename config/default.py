@@ -26,15 +26,30 @@ ENHANCEMENTS, OR MODIFICATIONS.
 import logging
 import os
 
+# Per course, activity type configuration is cached for this many seconds. Updates to configuration clear the cache.
+ACTIVITY_TYPE_CACHE_TTL = 300
+
 ADVISORY_LOCK_ID_CANVAS_POLLER = 1000
 ADVISORY_LOCK_ID_WHITEBOARD_HOUSEKEEPING = 2000
 
 API_PREFIX = 'https://example.com/api'
 
+# Per course, user and filters, the total count of the Asset Library is cached for this many seconds.
+ASSET_LIBRARY_TOTAL_CACHE_TTL = 60
+
+# Repeat views of an asset by a user within this many seconds are counted once. Views are recorded in batches, every
+# this many seconds. A batch that fails to record is retried, up to this many attempts in all.
+ASSET_VIEW_DEDUP_WINDOW_SECONDS = 300
+ASSET_VIEW_FLUSH_INTERVAL = 5
+ASSET_VIEW_FLUSH_MAX_ATTEMPTS = 3
+
 AWS_ACCESS_KEY_ID = 'some id'
 AWS_SECRET_ACCESS_KEY = 'some secret'
 AWS_S3_BUCKET_FOR_ASSETS = None
 AWS_S3_REGION = 'us-west-2'
+# S3 client is shared across threads and requests: connections it keeps open, and its age (seconds) when replaced.
+AWS_S3_CLIENT_MAX_AGE = 3600
+AWS_S3_MAX_POOL_CONNECTIONS = 50
 
 # Base directory for the application (one level up from this config file).
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -75,6 +90,12 @@ LOGGING_PROPAGATION_LEVEL = logging.INFO
 
 NODE_EXECUTABLE = '/usr/bin/node'
 
+# Course-wide recalculation of points, after changes to a course's activity configuration, runs in the background:
+# this many users per UPDATE, queue checked every this many seconds, and claims abandoned after this many seconds.
+POINTS_RECALCULATION_BATCH_SIZE = 1000
+POINTS_RECALCULATION_INTERVAL = 5
+POINTS_RECALCULATION_VISIBILITY_TIMEOUT = 600
+
 PREVIEWS_API_KEY = 'someKey'
 # Assign PREVIEWS_CALLBACK_API_PREFIX to override API_PREFIX in context of preview-service callbacks. E.g., if you are
 # running locally (unreachable by preview-service) then use PREVIEWS_CALLBACK_API_PREFIX to point at squiggy-dev.
@@ -90,6 +111,8 @@ REDIS_PORT = 6379
 
 # Where file assets go.
 S3_BUCKET = 'some-bucket'
+# Signed S3 urls are reused within fixed time windows of this many seconds.
+S3_SIGNED_URL_WINDOW_SECONDS = 900
 S3_REGION = 'us-west-2'
 
 # Used to encrypt session cookie.
@@ -100,6 +123,9 @@ SESSION_COOKIE_HTTPONLY = False
 SESSION_COOKIE_SAMESITE = 'None'
 SESSION_COOKIE_SECURE = True
 
+# Socket.io upserts of the same whiteboard element within this window (milliseconds) are collapsed into one db
+# write and one broadcast. Zero disables coalescing.
+SOCKET_IO_COALESCE_WINDOW = 50
 # Flask-SocketIO debug logging is verbose.
 SOCKET_IO_DEBUG_MODE = False
 
@@ -128,8 +154,45 @@ TIMEZONE = 'America/Los_Angeles'
 # This base-URL config should only be non-None in the "local" env where the Vue front-end runs on port 8080.
 VUE_LOCALHOST_BASE_URL = None
 
+# Per user and whiteboard, authorization to update is cached for this many seconds.
+WHITEBOARD_AUTHORIZATION_CACHE_TTL = 30
+# Per whiteboard housekeeping cycle, the whiteboard elements of at most this many assets with a new image get that image.
+WHITEBOARD_ASSET_IMAGE_RECONCILE_BATCH_SIZE = 100
+# Whiteboard elements beyond the viewport are streamed to the client in chunks of this size.
+WHITEBOARD_ELEMENT_CHUNK_SIZE = 50
+# Upper bound of the limit param of a request for whiteboard history (operation log).
+WHITEBOARD_HISTORY_MAX_LIMIT = 500
 WHITEBOARD_HOUSEKEEPING_ACCEPTABLE_MINUTES_SINCE_LAST = 60
+# Number of whiteboard previews generated in parallel. Renders are further limited by WHITEBOARD_RENDER_POOL_SIZE.
+WHITEBOARD_HOUSEKEEPING_WORKERS = 4
+# Who is online, per whiteboard, is tracked in Redis ('redis') or in-process ('local'). None means Redis if configured.
+WHITEBOARD_PRESENCE_BACKEND = None
+# A whiteboard preview is generated once the whiteboard has gone this many seconds without change.
+WHITEBOARD_PREVIEW_QUIET_SECONDS = 10
+# Preview generation is retried, after a delay of this many seconds times attempts, up to max attempts.
+WHITEBOARD_PREVIEW_QUEUE_MAX_ATTEMPTS = 3
+WHITEBOARD_PREVIEW_QUEUE_RETRY_SECONDS = 60
+# A claimed whiteboard not done within this many seconds (e.g., server restart) is claimed again.
+WHITEBOARD_PREVIEW_QUEUE_VISIBILITY_TIMEOUT = 300
+# Whiteboard PNGs are cached, by content hash, on local disk (None means system temp dir) and then S3.
+WHITEBOARD_RENDER_CACHE_DIR = None
+WHITEBOARD_RENDER_CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Whiteboards are rendered as PNG by a pool of long-lived Node processes. Each process is restarted after the maximum
+# number of renders, and pinged before use if idle longer than the health check interval. Seconds, where applicable.
+WHITEBOARD_RENDER_POOL_SIZE = 2
+WHITEBOARD_RENDER_TIMEOUT = 120
+WHITEBOARD_RENDER_WORKER_HEALTH_CHECK_INTERVAL = 60
+WHITEBOARD_RENDER_WORKER_MAX_RENDERS = 100
 WHITEBOARD_SESSION_EXPIRATION_MINUTES = 2
+# Per whiteboard housekeeping cycle, at most this many whiteboards get a snapshot of their operation log.
+WHITEBOARD_SNAPSHOT_COMPACTION_BATCH_SIZE = 50
+# Housekeeping writes a new snapshot of a whiteboard once its operation log has grown this much. Older
+# snapshots, and the operation log behind them, are kept for history and undo.
+WHITEBOARD_SNAPSHOT_INTERVAL = 100
+WHITEBOARD_SNAPSHOTS_RETAINED = 5
+# Live edits (socket.io) are held in memory and saved to the db in batches. The interval is in milliseconds.
+WHITEBOARD_STATE_FLUSH_INTERVAL = 1000
+WHITEBOARD_STATE_WRITE_BEHIND = True
 # The following value is in milliseconds.
 WHITEBOARDS_REFRESH_INTERVAL = 15000
 
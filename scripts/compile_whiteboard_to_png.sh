@@ -10,6 +10,6 @@ npm list | grep fabric || npm install -g fabric
 cd "$(cd -- "$(dirname -- "${BASH_SOURCE[0]}")" &> /dev/null && pwd)/.."
 
 # When deploying to AWS Elastic Beanstalk, this compilation happens in buildspec.yml.
-tsc --resolveJsonModule --esModuleInterop scripts/node_js/save_whiteboard_as_png.ts
+tsc --resolveJsonModule --esModuleInterop scripts/node_js/save_whiteboard_as_png.ts scripts/node_js/whiteboard_render_worker.ts
 
 exit 0
@@ -48,6 +48,8 @@ ALTER TABLE IF EXISTS ONLY public.asset_categories DROP CONSTRAINT IF EXISTS ass
 ALTER TABLE IF EXISTS ONLY public.asset_users DROP CONSTRAINT IF EXISTS asset_users_asset_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.asset_users DROP CONSTRAINT IF EXISTS asset_users_user_id_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.asset_image_queue DROP CONSTRAINT IF EXISTS asset_image_queue_asset_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.asset_whiteboard_elements DROP CONSTRAINT IF EXISTS asset_whiteboard_elements_asset_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.asset_whiteboard_elements DROP CONSTRAINT IF EXISTS asset_whiteboard_elements_element_asset_id_fkey;
 
@@ -69,14 +71,21 @@ ALTER TABLE IF EXISTS ONLY public.courses DROP CONSTRAINT IF EXISTS courses_canv
 ALTER TABLE IF EXISTS ONLY public.canvas_poller_api_keys
   DROP CONSTRAINT IF EXISTS canvas_poller_api_keys_canvas_api_domain_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.points_recalculations DROP CONSTRAINT IF EXISTS points_recalculations_course_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.users DROP CONSTRAINT IF EXISTS users_course_id_fkey;
 
 ALTER TABLE IF EXISTS ONLY public.whiteboard_elements DROP CONSTRAINT IF EXISTS whiteboard_elements_asset_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.whiteboard_elements DROP CONSTRAINT IF EXISTS whiteboard_elements_whiteboard_id_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.whiteboard_operations DROP CONSTRAINT IF EXISTS whiteboard_operations_whiteboard_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.whiteboard_sessions DROP CONSTRAINT IF EXISTS whiteboard_sessions_user_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.whiteboard_sessions DROP CONSTRAINT IF EXISTS whiteboard_sessions_whiteboard_id_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.whiteboard_preview_queue DROP CONSTRAINT IF EXISTS whiteboard_preview_queue_whiteboard_id_fkey;
+ALTER TABLE IF EXISTS ONLY public.whiteboard_snapshots DROP CONSTRAINT IF EXISTS whiteboard_snapshots_whiteboard_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.whiteboard_users DROP CONSTRAINT IF EXISTS whiteboard_users_user_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.whiteboard_users DROP CONSTRAINT IF EXISTS whiteboard_users_whiteboard_id_fkey;
 
@@ -94,6 +103,8 @@ ALTER TABLE IF EXISTS ONLY public.asset_categories DROP CONSTRAINT IF EXISTS ass
 
 ALTER TABLE IF EXISTS ONLY public.asset_users DROP CONSTRAINT IF EXISTS asset_users_pkey;
 
+ALTER TABLE IF EXISTS ONLY public.asset_image_queue DROP CONSTRAINT IF EXISTS asset_image_queue_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.asset_whiteboard_elements DROP CONSTRAINT IF EXISTS asset_whiteboard_elements_pkey;
 
 ALTER TABLE IF EXISTS ONLY public.assets DROP CONSTRAINT IF EXISTS assets_pkey;
@@ -120,11 +131,20 @@ ALTER TABLE IF EXISTS public.course_groups ALTER COLUMN id DROP DEFAULT;
 ALTER TABLE IF EXISTS ONLY public.courses DROP CONSTRAINT IF EXISTS courses_pkey;
 ALTER TABLE IF EXISTS public.courses ALTER COLUMN id DROP DEFAULT;
 
+ALTER TABLE IF EXISTS ONLY public.points_recalculations DROP CONSTRAINT IF EXISTS points_recalculations_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.users DROP CONSTRAINT IF EXISTS users_pkey;
 ALTER TABLE IF EXISTS public.users ALTER COLUMN id DROP DEFAULT;
 
+ALTER TABLE IF EXISTS ONLY public.whiteboard_operations DROP CONSTRAINT IF EXISTS whiteboard_operations_pkey;
+ALTER TABLE IF EXISTS public.whiteboard_operations ALTER COLUMN id DROP DEFAULT;
+
+ALTER TABLE IF EXISTS ONLY public.whiteboard_preview_queue DROP CONSTRAINT IF EXISTS whiteboard_preview_queue_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.whiteboard_sessions DROP CONSTRAINT IF EXISTS whiteboard_sessions_pkey;
 
+ALTER TABLE IF EXISTS ONLY public.whiteboard_snapshots DROP CONSTRAINT IF EXISTS whiteboard_snapshots_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.whiteboard_users DROP CONSTRAINT IF EXISTS whiteboard_users_pkey;
 
 ALTER TABLE IF EXISTS ONLY public.whiteboards DROP CONSTRAINT IF EXISTS whiteboards_pkey;
@@ -144,9 +164,18 @@ DROP INDEX IF EXISTS asset_categories_category_id_idx;
 DROP INDEX IF EXISTS asset_users_asset_id_idx;
 DROP INDEX IF EXISTS asset_users_user_id_idx;
 
+DROP INDEX IF EXISTS assets_search_vector_idx;
+
 DROP INDEX IF EXISTS course_group_memberships_canvas_user_id_idx;
 
+DROP INDEX IF EXISTS whiteboard_elements_bounding_box_idx;
 DROP INDEX IF EXISTS whiteboard_elements_created_at_uuid_whiteboard_id_idx;
+DROP INDEX IF EXISTS whiteboard_elements_uuid_whiteboard_id_idx;
+DROP INDEX IF EXISTS whiteboard_elements_whiteboard_id_z_index_idx;
+DROP INDEX IF EXISTS whiteboard_operations_whiteboard_id_version_idx;
+DROP INDEX IF EXISTS whiteboard_preview_queue_queued_at_idx;
+
+DROP INDEX IF EXISTS whiteboards_title_search_idx;
 
 --
 
@@ -156,6 +185,7 @@ DROP SEQUENCE IF EXISTS public.activity_types_id_seq;
 DROP TABLE IF EXISTS public.activity_types;
 DROP TABLE IF EXISTS public.asset_categories;
 DROP TABLE IF EXISTS public.asset_users;
+DROP TABLE IF EXISTS public.asset_image_queue;
 DROP TABLE IF EXISTS public.asset_whiteboard_elements;
 DROP SEQUENCE IF EXISTS public.assets_id_seq;
 DROP TABLE IF EXISTS public.assets;
@@ -171,17 +201,28 @@ DROP SEQUENCE IF EXISTS public.course_groups_id_seq;
 DROP TABLE IF EXISTS public.course_groups;
 DROP SEQUENCE IF EXISTS public.courses_id_seq;
 DROP TABLE IF EXISTS public.courses;
+DROP TABLE IF EXISTS public.points_recalculations;
 DROP SEQUENCE IF EXISTS public.users_id_seq;
 DROP TABLE IF EXISTS public.users;
 DROP TABLE IF EXISTS public.whiteboard_elements;
 DROP SEQUENCE IF EXISTS public.whiteboard_elements_id_seq;
+DROP TABLE IF EXISTS public.whiteboard_operations;
+DROP SEQUENCE IF EXISTS public.whiteboard_operations_id_seq;
+DROP TABLE IF EXISTS public.whiteboard_preview_queue;
 DROP TABLE IF EXISTS public.whiteboard_sessions;
+DROP TABLE IF EXISTS public.whiteboard_snapshots;
 DROP TABLE IF EXISTS public.whiteboard_users;
 DROP SEQUENCE IF EXISTS public.whiteboards_id_seq;
 DROP TABLE IF EXISTS public.whiteboards;
 
 --
 
+DROP FUNCTION IF EXISTS public.asset_search_vector(integer, text, text);
+DROP FUNCTION IF EXISTS public.assets_search_vector_trigger();
+DROP FUNCTION IF EXISTS public.comments_search_vector_trigger();
+
+--
+
 DROP TYPE IF EXISTS public.enum_activities_object_type;
 DROP TYPE IF EXISTS public.enum_activities_type;
 DROP TYPE IF EXISTS public.enum_assets_type;
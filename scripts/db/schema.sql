@@ -176,6 +176,20 @@ CREATE INDEX asset_users_user_id_idx ON asset_users USING btree (user_id);
 
 --
 
+CREATE TABLE asset_image_queue (
+    asset_id integer NOT NULL,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY asset_image_queue
+    ADD CONSTRAINT asset_image_queue_pkey PRIMARY KEY (asset_id);
+
+CREATE INDEX asset_image_queue_queued_at_idx ON asset_image_queue USING btree (queued_at);
+
+--
+
 CREATE TABLE asset_whiteboard_elements (
     uuid character varying(255) NOT NULL,
     element json NOT NULL,
@@ -195,24 +209,25 @@ CREATE TABLE assets (
     id integer NOT NULL,
     body text,
     canvas_assignment_id integer,
-    comment_count integer DEFAULT 0,
+    comment_count integer DEFAULT 0 NOT NULL,
     course_id integer NOT NULL,
     deleted_at TIMESTAMP WITH TIME ZONE,
     description text,
-    dislikes integer DEFAULT 0,
+    dislikes integer DEFAULT 0 NOT NULL,
     download_url text,
     image_url text,
-    likes integer DEFAULT 0,
+    likes integer DEFAULT 0 NOT NULL,
     mime character varying(255),
     pdf_url text,
     preview_metadata json DEFAULT '"{}"'::json,
     preview_status character varying(255) DEFAULT 'pending'::character varying,
+    search_vector tsvector,
     source character varying(255),
     thumbnail_url text,
     title character varying(255),
     type enum_assets_type NOT NULL,
     url text,
-    views integer DEFAULT 0,
+    views integer DEFAULT 0 NOT NULL,
     visible boolean DEFAULT true NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     created_by integer NOT NULL,
@@ -231,6 +246,8 @@ ALTER TABLE ONLY assets ALTER COLUMN id SET DEFAULT nextval('assets_id_seq'::reg
 ALTER TABLE ONLY assets
     ADD CONSTRAINT assets_pkey PRIMARY KEY (id);
 
+CREATE INDEX assets_search_vector_idx ON assets USING gin (search_vector);
+
 --
 
 CREATE TABLE background_jobs (
@@ -401,6 +418,23 @@ CREATE INDEX courses_last_polled_idx ON courses USING btree (last_polled);
 
 --
 
+CREATE TABLE points_recalculations (
+    course_id integer NOT NULL,
+    status character varying(255) DEFAULT 'queued'::character varying NOT NULL,
+    users_total integer,
+    users_updated integer DEFAULT 0 NOT NULL,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY points_recalculations
+    ADD CONSTRAINT points_recalculations_pkey PRIMARY KEY (course_id);
+
+--
+
 CREATE TABLE users (
     id integer NOT NULL,
     bookmarklet_token character varying(32) NOT NULL,
@@ -441,7 +475,12 @@ CREATE TABLE whiteboard_elements (
     element json NOT NULL,
     whiteboard_id integer NOT NULL,
     asset_id integer,
-    z_index integer NOT NULL,
+    z_index double precision NOT NULL,
+    version bigint DEFAULT 0 NOT NULL,
+    min_x double precision,
+    min_y double precision,
+    max_x double precision,
+    max_y double precision,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
 );
@@ -456,19 +495,65 @@ ALTER SEQUENCE whiteboard_elements_id_seq OWNED BY whiteboard_elements.id;
 ALTER TABLE ONLY whiteboard_elements ALTER COLUMN id SET DEFAULT nextval('whiteboard_elements_id_seq'::regclass);
 
 CREATE UNIQUE INDEX whiteboard_elements_created_at_uuid_whiteboard_id_idx ON whiteboard_elements USING btree (uuid, whiteboard_id, created_at);
+CREATE UNIQUE INDEX whiteboard_elements_uuid_whiteboard_id_idx ON whiteboard_elements USING btree (uuid, whiteboard_id);
+CREATE INDEX whiteboard_elements_asset_id_idx ON whiteboard_elements USING btree (asset_id);
+CREATE INDEX whiteboard_elements_bounding_box_idx ON whiteboard_elements USING gist (box(point(min_x, min_y), point(max_x, max_y)));
+CREATE INDEX whiteboard_elements_whiteboard_id_z_index_idx ON whiteboard_elements USING btree (whiteboard_id, z_index);
 
 --
 
-CREATE TABLE whiteboard_sessions (
-    socket_id character varying(255) NOT NULL,
+CREATE TABLE whiteboard_operations (
+    id integer NOT NULL,
     whiteboard_id integer NOT NULL,
-    user_id integer NOT NULL,
+    version integer NOT NULL,
+    operation_type character varying(32) NOT NULL,
+    payload jsonb NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
 );
 
-ALTER TABLE ONLY whiteboard_sessions
-    ADD CONSTRAINT whiteboard_sessions_pkey PRIMARY KEY (socket_id);
+CREATE SEQUENCE whiteboard_operations_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+ALTER SEQUENCE whiteboard_operations_id_seq OWNED BY whiteboard_operations.id;
+ALTER TABLE ONLY whiteboard_operations ALTER COLUMN id SET DEFAULT nextval('whiteboard_operations_id_seq'::regclass);
+
+ALTER TABLE ONLY whiteboard_operations
+    ADD CONSTRAINT whiteboard_operations_pkey PRIMARY KEY (id);
+
+CREATE UNIQUE INDEX whiteboard_operations_whiteboard_id_version_idx ON whiteboard_operations USING btree (whiteboard_id, version);
+
+--
+
+CREATE TABLE whiteboard_preview_queue (
+    whiteboard_id integer NOT NULL,
+    attempts integer DEFAULT 0 NOT NULL,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY whiteboard_preview_queue
+    ADD CONSTRAINT whiteboard_preview_queue_pkey PRIMARY KEY (whiteboard_id);
+
+CREATE INDEX whiteboard_preview_queue_queued_at_idx ON whiteboard_preview_queue USING btree (queued_at);
+
+--
+
+CREATE TABLE whiteboard_snapshots (
+    whiteboard_id integer NOT NULL,
+    version integer NOT NULL,
+    data bytea NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY whiteboard_snapshots
+    ADD CONSTRAINT whiteboard_snapshots_pkey PRIMARY KEY (whiteboard_id, version);
 
 --
 
@@ -496,7 +581,8 @@ CREATE TABLE whiteboards (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     created_by integer NOT NULL,
     deleted_at TIMESTAMP WITH TIME ZONE,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    version integer DEFAULT 0 NOT NULL
 );
 
 CREATE SEQUENCE whiteboards_id_seq
@@ -511,6 +597,41 @@ ALTER TABLE ONLY whiteboards ALTER COLUMN id SET DEFAULT nextval('whiteboards_id
 ALTER TABLE ONLY whiteboards
     ADD CONSTRAINT whiteboards_pkey PRIMARY KEY (id);
 
+CREATE INDEX whiteboards_title_search_idx ON whiteboards USING gin (to_tsvector('simple', coalesce(title, '')));
+
+--
+
+-- Title, description and comments of an asset, weighted in that order, for keyword search.
+CREATE OR REPLACE FUNCTION asset_search_vector(asset_id integer, title text, description text) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce($2, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce($3, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((SELECT string_agg(c.body, ' ') FROM comments c WHERE c.asset_id = $1), '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION assets_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := asset_search_vector(NEW.id, NEW.title, NEW.description);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION comments_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE assets SET search_vector = asset_search_vector(id, title, description) WHERE id = OLD.asset_id;
+    ELSE
+        UPDATE assets SET search_vector = asset_search_vector(id, title, description) WHERE id = NEW.asset_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER assets_search_vector_update BEFORE INSERT OR UPDATE OF title, description ON assets
+    FOR EACH ROW EXECUTE PROCEDURE assets_search_vector_trigger();
+
+CREATE TRIGGER comments_search_vector_update AFTER INSERT OR DELETE OR UPDATE OF body ON comments
+    FOR EACH ROW EXECUTE PROCEDURE comments_search_vector_trigger();
+
 --
 
 ALTER TABLE ONLY activities
@@ -533,6 +654,8 @@ ALTER TABLE ONLY asset_users
     ADD CONSTRAINT asset_users_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_users
     ADD CONSTRAINT asset_users_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY asset_image_queue
+    ADD CONSTRAINT asset_image_queue_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_whiteboard_elements
     ADD CONSTRAINT asset_whiteboard_elements_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_whiteboard_elements
@@ -557,16 +680,20 @@ ALTER TABLE ONLY course_groups
     ADD CONSTRAINT course_groups_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY courses
     ADD CONSTRAINT courses_canvas_api_domain_fkey FOREIGN KEY (canvas_api_domain) REFERENCES canvas(canvas_api_domain) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY points_recalculations
+    ADD CONSTRAINT points_recalculations_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY users
     ADD CONSTRAINT users_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY whiteboard_elements
     ADD CONSTRAINT whiteboard_elements_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY whiteboard_elements
     ADD CONSTRAINT whiteboard_elements_whiteboard_id_fkey FOREIGN KEY (whiteboard_id) REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE;
-ALTER TABLE ONLY whiteboard_sessions
-    ADD CONSTRAINT whiteboard_sessions_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
-ALTER TABLE ONLY whiteboard_sessions
-    ADD CONSTRAINT whiteboard_sessions_whiteboard_id_fkey FOREIGN KEY (whiteboard_id) REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY whiteboard_operations
+    ADD CONSTRAINT whiteboard_operations_whiteboard_id_fkey FOREIGN KEY (whiteboard_id) REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY whiteboard_preview_queue
+    ADD CONSTRAINT whiteboard_preview_queue_whiteboard_id_fkey FOREIGN KEY (whiteboard_id) REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY whiteboard_snapshots
+    ADD CONSTRAINT whiteboard_snapshots_whiteboard_id_fkey FOREIGN KEY (whiteboard_id) REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY whiteboard_users
     ADD CONSTRAINT whiteboard_users_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY whiteboard_users
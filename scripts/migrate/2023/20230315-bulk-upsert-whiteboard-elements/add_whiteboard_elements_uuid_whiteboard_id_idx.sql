@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Bulk upsert of whiteboard elements relies on ON CONFLICT (uuid, whiteboard_id). Remove duplicates, keeping the latest.
+DELETE FROM whiteboard_elements e
+USING whiteboard_elements newer
+WHERE e.uuid = newer.uuid AND e.whiteboard_id = newer.whiteboard_id AND e.id < newer.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS whiteboard_elements_uuid_whiteboard_id_idx ON whiteboard_elements USING btree (uuid, whiteboard_id);
+
+COMMIT;
@@ -0,0 +1,6 @@
+BEGIN;
+
+-- Whiteboard presence is tracked in Redis (or in-process), not in the db.
+DROP TABLE IF EXISTS whiteboard_sessions;
+
+COMMIT;
@@ -0,0 +1,8 @@
+BEGIN;
+
+-- Reordering slots elements between neighbors, so z_index becomes fractional.
+ALTER TABLE whiteboard_elements ALTER COLUMN z_index TYPE DOUBLE PRECISION;
+
+CREATE INDEX IF NOT EXISTS whiteboard_elements_whiteboard_id_z_index_idx ON whiteboard_elements USING btree (whiteboard_id, z_index);
+
+COMMIT;
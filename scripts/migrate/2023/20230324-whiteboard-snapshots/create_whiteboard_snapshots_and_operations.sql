@@ -0,0 +1,47 @@
+BEGIN;
+
+-- Per-whiteboard version of the operation log.
+ALTER TABLE whiteboards ADD COLUMN IF NOT EXISTS version integer DEFAULT 0 NOT NULL;
+
+CREATE TABLE IF NOT EXISTS whiteboard_operations (
+    id SERIAL PRIMARY KEY,
+    whiteboard_id integer NOT NULL REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    version integer NOT NULL,
+    operation_type character varying(32) NOT NULL,
+    payload jsonb NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS whiteboard_operations_whiteboard_id_version_idx ON whiteboard_operations USING btree (whiteboard_id, version);
+
+CREATE TABLE IF NOT EXISTS whiteboard_snapshots (
+    whiteboard_id integer NOT NULL REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    version integer NOT NULL,
+    data bytea NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    PRIMARY KEY (whiteboard_id, version)
+);
+
+-- History of existing whiteboards starts with a snapshot of their elements. Data is uncompressed JSON, which the app
+-- tells apart from its own zlib-compressed snapshots.
+INSERT INTO whiteboard_snapshots (whiteboard_id, version, data)
+SELECT w.id, w.version, convert_to(COALESCE((
+    SELECT CAST(json_agg(json_build_object(
+        'id', e.id,
+        'assetId', e.asset_id,
+        'createdAt', to_char(e.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"'),
+        'element', CAST(CAST(e.element AS JSONB) || jsonb_build_object('uuid', e.uuid) AS JSON),
+        'updatedAt', to_char(e.updated_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"'),
+        'uuid', e.uuid,
+        'whiteboardId', e.whiteboard_id,
+        'zIndex', e.z_index
+    ) ORDER BY e.z_index) AS TEXT)
+    FROM whiteboard_elements e
+    WHERE e.whiteboard_id = w.id
+), '[]'), 'UTF8')
+FROM whiteboards w
+ON CONFLICT (whiteboard_id, version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,34 @@
+BEGIN;
+
+-- Bounding box of each element, indexed for viewport queries.
+ALTER TABLE whiteboard_elements ADD COLUMN IF NOT EXISTS min_x DOUBLE PRECISION;
+ALTER TABLE whiteboard_elements ADD COLUMN IF NOT EXISTS min_y DOUBLE PRECISION;
+ALTER TABLE whiteboard_elements ADD COLUMN IF NOT EXISTS max_x DOUBLE PRECISION;
+ALTER TABLE whiteboard_elements ADD COLUMN IF NOT EXISTS max_y DOUBLE PRECISION;
+
+-- Backfill is conservative: a square, centered on the origin of the element, which contains it at any angle. Exact
+-- bounds are written the next time the element is saved. Elements without position are in every viewport.
+UPDATE whiteboard_elements e SET
+    min_x = COALESCE(b.x - b.d, '-Infinity'),
+    min_y = COALESCE(b.y - b.d, '-Infinity'),
+    max_x = COALESCE(b.x + b.d, 'Infinity'),
+    max_y = COALESCE(b.y + b.d, 'Infinity')
+FROM (
+    SELECT
+        id,
+        (element->>'left')::DOUBLE PRECISION AS x,
+        (element->>'top')::DOUBLE PRECISION AS y,
+        sqrt(
+            power((COALESCE((element->>'width')::DOUBLE PRECISION, 0) + COALESCE((element->>'strokeWidth')::DOUBLE PRECISION, 0))
+                * abs(COALESCE((element->>'scaleX')::DOUBLE PRECISION, 1)), 2)
+            + power((COALESCE((element->>'height')::DOUBLE PRECISION, 0) + COALESCE((element->>'strokeWidth')::DOUBLE PRECISION, 0))
+                * abs(COALESCE((element->>'scaleY')::DOUBLE PRECISION, 1)), 2)
+        ) AS d
+    FROM whiteboard_elements
+) b
+WHERE e.id = b.id;
+
+CREATE INDEX IF NOT EXISTS whiteboard_elements_bounding_box_idx ON whiteboard_elements
+    USING gist (box(point(min_x, min_y), point(max_x, max_y)));
+
+COMMIT;
@@ -0,0 +1,15 @@
+BEGIN;
+
+-- Whiteboards due a preview image, shared by all app servers.
+CREATE TABLE IF NOT EXISTS whiteboard_preview_queue (
+    whiteboard_id integer PRIMARY KEY REFERENCES whiteboards(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    attempts integer DEFAULT 0 NOT NULL,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS whiteboard_preview_queue_queued_at_idx ON whiteboard_preview_queue USING btree (queued_at);
+
+COMMIT;
@@ -0,0 +1,44 @@
+BEGIN;
+
+ALTER TABLE assets ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Title, description and comments of an asset, weighted in that order, for keyword search.
+CREATE OR REPLACE FUNCTION asset_search_vector(asset_id integer, title text, description text) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce($2, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce($3, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((SELECT string_agg(c.body, ' ') FROM comments c WHERE c.asset_id = $1), '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION assets_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := asset_search_vector(NEW.id, NEW.title, NEW.description);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION comments_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE assets SET search_vector = asset_search_vector(id, title, description) WHERE id = OLD.asset_id;
+    ELSE
+        UPDATE assets SET search_vector = asset_search_vector(id, title, description) WHERE id = NEW.asset_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS assets_search_vector_update ON assets;
+CREATE TRIGGER assets_search_vector_update BEFORE INSERT OR UPDATE OF title, description ON assets
+    FOR EACH ROW EXECUTE PROCEDURE assets_search_vector_trigger();
+
+DROP TRIGGER IF EXISTS comments_search_vector_update ON comments;
+CREATE TRIGGER comments_search_vector_update AFTER INSERT OR DELETE OR UPDATE OF body ON comments
+    FOR EACH ROW EXECUTE PROCEDURE comments_search_vector_trigger();
+
+-- Backfill.
+UPDATE assets SET search_vector = asset_search_vector(id, title, description);
+
+CREATE INDEX IF NOT EXISTS assets_search_vector_idx ON assets USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS whiteboards_title_search_idx ON whiteboards USING gin (to_tsvector('simple', coalesce(title, '')));
+
+COMMIT;
@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Course-wide recalculation of points, queued when a course's activity configuration changes.
+CREATE TABLE IF NOT EXISTS points_recalculations (
+    course_id integer PRIMARY KEY REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    status character varying(255) DEFAULT 'queued'::character varying NOT NULL,
+    users_total integer,
+    users_updated integer DEFAULT 0 NOT NULL,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+COMMIT;
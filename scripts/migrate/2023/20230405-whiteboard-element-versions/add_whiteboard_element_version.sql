@@ -0,0 +1,6 @@
+BEGIN;
+
+-- Version of the latest write of each element, shared by all workers. Older writes are rejected.
+ALTER TABLE whiteboard_elements ADD COLUMN IF NOT EXISTS version BIGINT DEFAULT 0 NOT NULL;
+
+COMMIT;
@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Assets with a new image, which their whiteboard elements have yet to get.
+CREATE TABLE IF NOT EXISTS asset_image_queue (
+    asset_id integer PRIMARY KEY REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS asset_image_queue_queued_at_idx ON asset_image_queue USING btree (queued_at);
+
+-- Whiteboard elements are looked up by asset.
+CREATE INDEX IF NOT EXISTS whiteboard_elements_asset_id_idx ON whiteboard_elements USING btree (asset_id);
+
+COMMIT;
@@ -0,0 +1,14 @@
+BEGIN;
+
+-- Assets are paged by (count, id). A NULL count would sort first and could not be encoded in a cursor.
+UPDATE assets SET comment_count = 0 WHERE comment_count IS NULL;
+UPDATE assets SET dislikes = 0 WHERE dislikes IS NULL;
+UPDATE assets SET likes = 0 WHERE likes IS NULL;
+UPDATE assets SET views = 0 WHERE views IS NULL;
+
+ALTER TABLE assets ALTER COLUMN comment_count SET NOT NULL;
+ALTER TABLE assets ALTER COLUMN dislikes SET NOT NULL;
+ALTER TABLE assets ALTER COLUMN likes SET NOT NULL;
+ALTER TABLE assets ALTER COLUMN views SET NOT NULL;
+
+COMMIT;
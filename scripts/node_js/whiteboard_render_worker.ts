@@ -0,0 +1,84 @@
+import _ from 'lodash'
+import {initialize, render} from './whiteboard_renderer'
+
+/**
+ * Long-lived whiteboard renderer, one of a pool managed by 'squiggy/lib/render_pool.py'. Fabric and node-canvas are
+ * loaded once per process, not once per PNG.
+ *
+ * PROTOCOL: Every frame is a 4-byte (big-endian) length followed by that many bytes.
+ *  - Request, on stdin: JSON frame {id, type, whiteboardElements} where type is 'ping' or 'render'.
+ *  - Response, on stdout: PNG data in zero or more non-empty frames, as node-canvas produces it, then an empty frame,
+ *    then JSON frame {id, status, error}.
+ * Requests are handled one at a time, in order. PNG streaming pauses while stdout is full. Logging goes to stderr.
+ *
+ * USAGE: node ./scripts/node_js/whiteboard_render_worker.js -b /path/to/squiggy
+ */
+
+// @ts-ignore
+const args = process.argv
+const index = args.indexOf('-b')
+const baseDir = (index > -1 && index < args.length - 1) ? args[index + 1] : null
+
+if (!baseDir) {
+  throw new Error('Required arg -b (base dir) is missing.')
+}
+
+initialize(baseDir)
+
+let buffer = Buffer.alloc(0)
+let queue = Promise.resolve()
+
+process.stdin.on('data', (data: Buffer) => {
+  buffer = Buffer.concat([buffer, data])
+  while (buffer.length >= 4 && buffer.length >= 4 + buffer.readUInt32BE(0)) {
+    const length = buffer.readUInt32BE(0)
+    const request = JSON.parse(buffer.subarray(4, 4 + length).toString('utf8'))
+    buffer = buffer.subarray(4 + length)
+    queue = queue.then(() => $_handle(request))
+  }
+})
+
+process.stdin.on('end', () => queue.then(() => process.exit(0)))
+
+function $_handle(request: any): Promise<void> {
+  if (request.type === 'ping') {
+    $_end({id: request.id, status: 'ok'})
+    return Promise.resolve()
+  }
+  return render(request.whiteboardElements || []).then((canvas: any) => {
+    return new Promise<void>((resolve: any) => {
+      const stream = canvas.createPNGStream()
+      stream.on('data', (chunk: Buffer) => {
+        // An empty frame marks the end of PNG data.
+        if (chunk.length && !$_write(chunk)) {
+          stream.pause()
+          process.stdout.once('drain', () => stream.resume())
+        }
+      })
+      stream.on('end', () => {
+        $_end({id: request.id, status: 'ok'})
+        canvas.dispose()
+        resolve()
+      })
+      stream.on('error', (error: any) => {
+        $_end({id: request.id, status: 'error', error: _.toString(error)})
+        resolve()
+      })
+    })
+  }).catch((error: any) => {
+    console.error(error)
+    $_end({id: request.id, status: 'error', error: _.toString(error)})
+  })
+}
+
+function $_end(trailer: any) {
+  $_write(Buffer.alloc(0))
+  $_write(Buffer.from(JSON.stringify(trailer), 'utf8'))
+}
+
+function $_write(data: Buffer): boolean {
+  const frame = Buffer.alloc(4 + data.length)
+  frame.writeUInt32BE(data.length, 0)
+  data.copy(frame, 4)
+  return process.stdout.write(frame)
+}
@@ -0,0 +1,117 @@
+import _ from 'lodash'
+import {fabric} from 'fabric'
+
+/**
+ * Render serialized whiteboard elements (as seen in Squiggy database) to PNG. Shared by the one-off script
+ * 'save_whiteboard_as_png.ts' and the long-lived 'whiteboard_render_worker.ts'.
+ */
+
+const WHITEBOARD_PADDING = 10
+
+let isInitialized = false
+
+export function initialize(baseDir: string) {
+  if (!isInitialized) {
+    fabric.nodeCanvas.registerFont(`${baseDir}/dist/static/fonts/HelveticaNeueuLight.ttf`, {
+      family: 'HelveticaNeue-Light',
+      weight: 'regular',
+      style: 'normal'
+    })
+    // Horizontal and vertical origins are set to center
+    fabric.Object.prototype.originX = fabric.Object.prototype.originY = 'center'
+    isInitialized = true
+  }
+}
+
+export function render(whiteboardElements: any[], log: (statement: string) => void = _.noop): Promise<any> {
+  // Outer corners of elements in the canvas
+  let left = Number.MAX_VALUE
+  let top = Number.MAX_VALUE
+  let right = Number.MIN_VALUE
+  let bottom = Number.MIN_VALUE
+
+  const deserializedElements: any[] = []
+  const promises: any[] = []
+
+  _.each(whiteboardElements, (whiteboardElement: any) => {
+    // Canvas doesn't seem to deal terribly well with text elements that specify a prioritized list
+    // of font family names. It seems that the only way to render custom fonts is to only specify one
+    if (whiteboardElement.element.fontFamily) {
+      whiteboardElement.element.fontFamily = 'HelveticaNeue-Light'
+    }
+    // Deserialize the element, get its boundary and check how large the canvas should be to display the element entirely.
+    promises.push(new Promise<void>((resolve: any) => {
+      const type = fabric.util.string.camelize(fabric.util.string.capitalize(whiteboardElement.element.type))
+      const uuid = whiteboardElement.uuid
+      const zIndex = whiteboardElement.zIndex
+      $_createFabricObject(whiteboardElement.element, type).then((object: any) => {
+        log(`${_.capitalize(object.type)} element deserialized (uuid: ${uuid})`)
+        deserializedElements.push({element: object, uuid, zIndex})
+        const bound = object.getBoundingRect()
+        // The values below determine canvas size during render.
+        left = Math.min(left, bound.left)
+        top = Math.min(top, bound.top)
+        right = Math.max(right, bound.left + bound.width)
+        bottom = Math.max(bottom, bound.top + bound.height)
+        resolve()
+      })
+    }))
+  })
+
+  return Promise.all(promises).then(() => {
+    log('Finally, render the Fabric.js canvas.')
+    // At this point we've figured out what the left-most and right-most element is. By subtracting
+    // their X-coordinates we get the desired width of the canvas. The height can be calculated in
+    // a similar way by using the Y-coordinates
+    let width = right - left
+    let height = bottom - top
+    // Neither width nor height should exceed 2048px.
+    let scale_factor = 1
+    if (width > 3000 && width >= height) {
+      scale_factor = 3000 / width
+    } else if (height > 3000 && height > width) {
+      scale_factor = 3000 / height
+    }
+    if (scale_factor < 1) {
+      // If scaling down is required, first change the canvas dimensions.
+      width = width * scale_factor
+      height = height * scale_factor
+      // Next, scale and reposition each element against top left corner of the canvas.
+      _.each(deserializedElements, (element) => {
+        element.scaleX = element.scaleX * scale_factor
+        element.scaleY = element.scaleY * scale_factor
+        element.left = left + ((element.left - left) * scale_factor)
+        element.top = top + ((element.top - top) * scale_factor)
+      })
+    }
+    // Add a bit of padding so elements don't stick to the side
+    width += (2 * WHITEBOARD_PADDING)
+    height += (2 * WHITEBOARD_PADDING)
+
+    // Create a canvas and pan it to the top-left corner
+    const canvas = new fabric.Canvas(null, {backgroundColor: '#fff', width, height})
+    canvas.absolutePan(new fabric.Point(left - WHITEBOARD_PADDING, top - WHITEBOARD_PADDING))
+    canvas.setZoom(scale_factor)
+
+    // Render canvas AFTER all elements have been added. This is significantly faster
+    canvas.renderOnAddRemove = false
+
+    // Add elements to the canvas
+    const sorted = _.sortBy(deserializedElements, ['zIndex', 'uuid'])
+    _.each(sorted, (whiteboardElement: any) => canvas.add(whiteboardElement.element))
+    canvas.renderAll()
+    return canvas
+  })
+}
+
+function $_createFabricObject(element, type) {
+  return new Promise<any>(resolve => {
+    fabric[type].fromObject(element, (e: any) => {
+      if (element.type === 'image') {
+        e.setSrc(element.src, resolve)
+      } else {
+        resolve(e)
+      }
+    })
+  })
+}
@@ -30,6 +30,7 @@ from squiggy.lib.errors import BadRequestError, ResourceNotFoundError
 from squiggy.lib.http import response_with_csv_download, tolerant_jsonify
 from squiggy.models.activity import Activity
 from squiggy.models.activity_type import ActivityType
+from squiggy.models.points_recalculation import PointsRecalculation
 from squiggy.models.user import User
 
 
@@ -56,8 +57,19 @@ def update_activity_configuration():
         course_id=current_user.course_id,
         updates=params,
     )
-    Activity.recalculate_points(course_id=current_user.course_id)
-    return tolerant_jsonify({'updated': True})
+    # Points of every user in the course are recalculated in the background.
+    points_recalculation = PointsRecalculation.enqueue(course_id=current_user.course_id)
+    return tolerant_jsonify({
+        'pointsRecalculation': points_recalculation.to_api_json(),
+        'updated': True,
+    })
+
+
+@app.route('/api/activities/points/recalculation', methods=['GET'])
+@teacher_required
+def get_points_recalculation():
+    points_recalculation = PointsRecalculation.find_by_course_id(course_id=current_user.course_id)
+    return tolerant_jsonify(points_recalculation and points_recalculation.to_api_json())
 
 
 @app.route('/api/activities/csv', methods=['GET'])
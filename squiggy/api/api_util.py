@@ -31,19 +31,18 @@ from flask_login import current_user, login_user
 from flask_socketio import emit
 from squiggy.lib.errors import BadRequestError, UnauthorizedRequestError
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
+from squiggy.lib.socket_io_util import get_socket_io_coalesced_room, get_socket_io_high_fidelity_room, get_socket_io_room, SOCKET_IO_NAMESPACE
 from squiggy.lib.util import is_admin, is_teaching, safe_strip
-from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
+from squiggy.lib.viewport import parse_viewport
+from squiggy.lib.whiteboard_state import save_whiteboard_elements, whiteboard_state
 from squiggy.logger import logger
-from squiggy.models.activity import Activity
 from squiggy.models.activity_type import activities_type
-from squiggy.models.asset import Asset, assets_type
+from squiggy.models.asset import assets_type
 from squiggy.models.canvas import Canvas
 from squiggy.models.user import User
 from squiggy.models.whiteboard import Whiteboard
-from squiggy.models.whiteboard_element import WhiteboardElement
-from squiggy.models.whiteboard_session import WhiteboardSession
-
-SOCKET_IO_NAMESPACE = '/'
 
 
 def admin_required(func):
@@ -109,8 +108,68 @@ def can_current_user_update_comment(comment):
     return current_user.id and (comment.user_id == current_user.id or current_user.is_admin or current_user.is_teaching)
 
 
-def get_socket_io_room(whiteboard_id):
-    return f'whiteboard-{whiteboard_id}'
+def patch_whiteboard_elements(socket_id, patches, whiteboard_id, coalesce=False, write_behind=False):
+    # Each patch is {'element': changed properties of the Fabric object, None to remove, 'uuid': uuid}. The server merges
+    # patches into the saved elements. The room gets the patches, not whole elements, with a per-whiteboard sequence number.
+    if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
+        raise UnauthorizedRequestError('Unauthorized')
+    if not socket_id:
+        raise BadRequestError('socket_id is required')
+    patches = _get_valid_patches(patches)
+
+    actor = (current_user.course_id, current_user.id)
+    if coalesce:
+        # Save and broadcast to the coalesced room happen in the next coalescer window.
+        socket_event_coalescer.add_patches(
+            actor=actor,
+            patches=patches,
+            room=get_socket_io_coalesced_room(whiteboard_id),
+            socket_id=socket_id,
+            whiteboard_id=whiteboard_id,
+        )
+        room = get_socket_io_high_fidelity_room(whiteboard_id)
+    elif write_behind:
+        whiteboard_state.apply_patches(
+            course_id=actor[0],
+            user_id=actor[1],
+            patches=patches,
+            whiteboard_id=whiteboard_id,
+        )
+        room = get_socket_io_room(whiteboard_id)
+    else:
+        save_whiteboard_elements(
+            actors_by_uuid={},
+            patches_by_uuid={p['uuid']: p['element'] for p in patches},
+            whiteboard_elements=[],
+            whiteboard_id=whiteboard_id,
+        )
+        room = get_socket_io_room(whiteboard_id)
+    # Clients skip a patch with a sequence number older than the last one they applied to the element.
+    sequence = whiteboard_state.next_sequence_number(whiteboard_id)
+    if not app.config['TESTING']:
+        logger.info(f'socketio: Emit patch_whiteboard_elements where whiteboard_id = {whiteboard_id} AND sequence = {sequence}')
+        emit(
+            'patch_whiteboard_elements',
+            {
+                'patches': patches,
+                'sequence': sequence,
+                'whiteboardId': whiteboard_id,
+            },
+            include_self=False,
+            namespace=SOCKET_IO_NAMESPACE,
+            skip_sid=socket_id,
+            to=room,
+        )
+    if not coalesce:
+        whiteboard_presence.touch(
+            socket_id=socket_id,
+            user_id=current_user.id,
+            whiteboard_id=whiteboard_id,
+        )
+    return {
+        'patches': patches,
+        'sequence': sequence,
+    }
 
 
 def start_login_session(login_session, redirect_path=None, tool_id=None):
@@ -144,38 +203,79 @@ def start_login_session(login_session, redirect_path=None, tool_id=None):
         return tolerant_jsonify({'message': f'User {login_session.user_id} failed to authenticate.'}, 403)
 
 
-def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id):
+def stream_whiteboard_elements(socket_id, viewport, whiteboard_id, exclude_uuids=None):
+    # Send whiteboard elements to one socket, in chunks: what is in view first, then the rest, nearest first.
     if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
         raise UnauthorizedRequestError('Unauthorized')
     if not socket_id:
         raise BadRequestError('socket_id is required')
+    try:
+        viewport = parse_viewport(viewport)
+    except ValueError as e:
+        raise BadRequestError(str(e))
+    chunks = Whiteboard.get_whiteboard_element_chunks(
+        chunk_size=app.config['WHITEBOARD_ELEMENT_CHUNK_SIZE'],
+        exclude_uuids=exclude_uuids,
+        viewport=viewport,
+        whiteboard_id=whiteboard_id,
+    )
+    for index, chunk in enumerate(chunks):
+        whiteboard_elements = Whiteboard.hydrate_whiteboard_elements(chunk)
+        if not app.config['TESTING']:
+            emit(
+                'whiteboard_elements_chunk',
+                {
+                    'chunkCount': len(chunks),
+                    'index': index,
+                    'whiteboardElements': whiteboard_elements,
+                    'whiteboardId': whiteboard_id,
+                },
+                namespace=SOCKET_IO_NAMESPACE,
+                to=socket_id,
+            )
+    return {'chunkCount': len(chunks)}
 
-    queue_for_preview_image = False
-    results = []
+
+def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id, coalesce=False, write_behind=False):
+    if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
+        raise UnauthorizedRequestError('Unauthorized')
+    if not socket_id:
+        raise BadRequestError('socket_id is required')
+
+    upserts = []
     for whiteboard_element in whiteboard_elements:
         element = whiteboard_element.get('element') if whiteboard_element else None
         ignore = not element or (element.get('type') in ['i-text', 'textbox'] and not element.get('text', '').strip())
         if ignore:
             continue
-        queue_for_preview_image = True
-        if WhiteboardElement.get_id_per_uuid(whiteboard_element.get('uuid')):
-            upserted = _update_whiteboard_element(
-                whiteboard_element=whiteboard_element,
+        _validate_fabricjs_element(element)
+        upserts.append(whiteboard_element)
+
+    if coalesce:
+        return _coalesce_whiteboard_elements(
+            socket_id=socket_id,
+            upserts=upserts,
+            whiteboard_elements=whiteboard_elements,
+            whiteboard_id=whiteboard_id,
+        )
+    results = []
+    if upserts:
+        if write_behind:
+            # Live edits are held in memory and saved to the db in batches.
+            whiteboard_state.apply(
+                course_id=current_user.course_id,
+                user_id=current_user.id,
+                whiteboard_elements=upserts,
                 whiteboard_id=whiteboard_id,
             )
+            results = upserts
         else:
-            z_indexes = [w.z_index for w in WhiteboardElement.find_by_whiteboard_id(whiteboard_id)]
-            next_available_z_index = max(z_indexes) + 1 if z_indexes else 0
-            upserted = _create_whiteboard_element(
-                asset_id=whiteboard_element.get('assetId'),
-                element=element,
+            actor = (current_user.course_id, current_user.id)
+            results = save_whiteboard_elements(
+                actors_by_uuid={w['element']['uuid']: actor for w in upserts},
+                whiteboard_elements=upserts,
                 whiteboard_id=whiteboard_id,
-                z_index=next_available_z_index,
             )
-            next_available_z_index += 1
-        results.append(upserted)
-    if queue_for_preview_image:
-        WhiteboardHousekeeping.queue_for_preview_image(whiteboard_id)
     if not app.config['TESTING']:
         logger.info(f'socketio: Emit upsert_whiteboard_elements where whiteboard_id = {whiteboard_id} AND socket_id = {socket_id}')
         emit(
@@ -186,7 +286,7 @@ def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id):
             skip_sid=socket_id,
             to=get_socket_io_room(whiteboard_id),
         )
-    WhiteboardSession.update_updated_at(
+    whiteboard_presence.touch(
         socket_id=socket_id,
         user_id=current_user.id,
         whiteboard_id=whiteboard_id,
@@ -194,46 +294,48 @@ def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id):
     return results
 
 
-def _create_whiteboard_element(
-    asset_id,
-    element,
-    whiteboard_id,
-    z_index,
-):
-    _validate_fabricjs_element(element)
-    whiteboard_element = WhiteboardElement.create(
-        asset_id=asset_id,
-        element=element,
-        uuid=element['uuid'],
+def _coalesce_whiteboard_elements(socket_id, upserts, whiteboard_elements, whiteboard_id):
+    # Save and broadcast to the room happen in the next coalescer window, once per element.
+    socket_event_coalescer.add(
+        actor=(current_user.course_id, current_user.id),
+        room=get_socket_io_coalesced_room(whiteboard_id),
+        socket_id=socket_id,
+        whiteboard_elements=upserts,
         whiteboard_id=whiteboard_id,
-        z_index=z_index,
     )
-    if asset_id:
-        asset = Asset.find_by_id(asset_id)
-        if asset:
-            user_id = current_user.id
-            if user_id not in [user.id for user in asset.users]:
-                course_id = current_user.course_id
-                whiteboard_activity = Activity.create(
-                    activity_type='whiteboard_add_asset',
-                    course_id=course_id,
-                    user_id=user_id,
-                    object_type='whiteboard',
-                    object_id=whiteboard_id,
-                    asset_id=asset.id,
-                )
-                for asset_user in asset.users:
-                    Activity.create(
-                        activity_type='get_whiteboard_add_asset',
-                        course_id=course_id,
-                        user_id=asset_user.id,
-                        object_type='whiteboard',
-                        object_id=whiteboard_id,
-                        asset_id=asset.id,
-                        actor_id=user_id,
-                        reciprocal_id=whiteboard_activity.id,
-                    )
-    return whiteboard_element.to_api_json()
+    if not app.config['TESTING']:
+        emit(
+            'upsert_whiteboard_elements',
+            whiteboard_elements,
+            include_self=False,
+            namespace=SOCKET_IO_NAMESPACE,
+            skip_sid=socket_id,
+            to=get_socket_io_high_fidelity_room(whiteboard_id),
+        )
+    return upserts
+
+
+def _get_valid_patches(patches):
+    # Patches of the same element, in one request, are merged in order.
+    elements_by_uuid = {}
+    for patch in patches or []:
+        uuid = patch.get('uuid') if isinstance(patch, dict) else None
+        element = patch.get('element') if uuid else None
+        error_message = None
+        if not isinstance(element, dict) or not element:
+            error_message = f'Invalid patch of whiteboard_element: {patch}.'
+        elif 'type' in element:
+            error_message = 'A patch cannot change the type of a whiteboard_element. Upsert it instead.'
+        elif 'text' in element and not safe_strip(element['text']):
+            error_message = f'Invalid patch of Fabric i-text/textbox element: {patch}.'
+        if error_message:
+            app.logger.error(error_message)
+            raise BadRequestError(error_message)
+        # Ensure consistent uuid.
+        elements_by_uuid.setdefault(uuid, {}).update({key: value for key, value in element.items() if key != 'uuid'})
+    if not elements_by_uuid:
+        raise BadRequestError('patches are required')
+    return [{'element': element, 'uuid': uuid} for uuid, element in elements_by_uuid.items()]
 
 
 def _is_safe_url(target):
@@ -244,30 +346,12 @@ def _is_safe_url(target):
     return test_url.scheme in ('http', 'https') and ref_url.netloc == test_url.netloc
 
 
-def _update_whiteboard_element(whiteboard_element, whiteboard_id):
-    if not whiteboard_element:
-        raise BadRequestError('Element required')
-
-    element = whiteboard_element['element']
-    _validate_fabricjs_element(element, True)
-
-    result = WhiteboardElement.update(
-        asset_id=whiteboard_element.get('assetId'),
-        element=element,
-        uuid=element['uuid'],
-        whiteboard_id=whiteboard_id,
-    )
-    if result:
-        return result.to_api_json()
-
-
-def _validate_fabricjs_element(element, is_update=False):
+def _validate_fabricjs_element(element):
     error_message = None
     if element['type'] in ['i-text', 'textbox'] and not safe_strip(element.get('text')):
         error_message = f'Invalid Fabric i-text/textbox element: {element}.'
-    if is_update:
-        if 'uuid' not in element:
-            error_message = 'uuid is required when updating existing whiteboard_element.'
+    if 'uuid' not in element:
+        error_message = 'uuid is required when upserting whiteboard_element.'
     if error_message:
         app.logger.error(error_message)
         raise BadRequestError(error_message)
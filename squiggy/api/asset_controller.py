@@ -29,6 +29,7 @@ import re
 from flask import current_app as app, request, Response
 from flask_login import current_user, login_required
 from squiggy.api.api_util import can_current_user_update_asset, can_current_user_view_asset
+from squiggy.lib.asset_views import asset_view_buffer
 from squiggy.lib.aws import stream_object, upload_to_s3
 from squiggy.lib.errors import BadRequestError, ResourceNotFoundError
 from squiggy.lib.http import retrieve_to_file, tolerant_jsonify
@@ -65,7 +66,8 @@ def get_asset(asset_id):
     asset = Asset.find_by_id(asset_id=asset_id)
     if asset and can_current_user_view_asset(asset=asset):
         if current_user.id not in [user.id for user in asset.users]:
-            asset.increment_views(current_user.id)
+            # Recorded in the background.
+            asset_view_buffer.add(asset_id=asset.id, course_id=asset.course_id, user_id=current_user.id)
         return tolerant_jsonify(asset.to_api_json(user_id=current_user.id))
     else:
         raise ResourceNotFoundError(f'No asset found with id: {asset_id}')
@@ -76,6 +78,8 @@ def get_asset(asset_id):
 def get_assets():
     params = request.get_json()
     order_by = _get(params, 'orderBy', 'recent')
+    cursor = params.get('cursor')
+    include_total = to_bool_or_none(params.get('includeTotal', True))
     offset = params.get('offset')
     limit = params.get('limit')
     filters = {
@@ -86,13 +90,18 @@ def get_assets():
         'owner_id': _get(params, 'userId', None),
         'section': _get(params, 'section', None),
     }
-    results = Asset.get_assets(
-        current_user=current_user,
-        filters=filters,
-        limit=limit,
-        offset=offset,
-        order_by=order_by,
-    )
+    try:
+        results = Asset.get_assets(
+            current_user=current_user,
+            cursor=cursor,
+            filters=filters,
+            include_total=include_total,
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+        )
+    except ValueError:
+        raise BadRequestError('Invalid cursor')
     return tolerant_jsonify(results)
 
 
@@ -28,6 +28,7 @@ from flask_login import current_user, login_required
 from squiggy.api.api_util import teacher_required
 from squiggy.lib.http import tolerant_jsonify
 from squiggy.models.course import Course
+from squiggy.models.whiteboard import whiteboard_authorization_cache
 
 
 @app.route('/api/course/activate', methods=['POST'])
@@ -67,4 +68,5 @@ def update_protect_assets_per_section_checkbox():
     params = request.get_json()
     protect_assets_per_section = params.get('protectSectionCheckbox')
     Course.update_protect_assets_per_section(current_user.course_id, protect_assets_per_section)
+    whiteboard_authorization_cache.clear()
     return tolerant_jsonify({'status': 'success'})
@@ -27,9 +27,11 @@ import json
 
 from flask import current_app as app, request
 from flask_socketio import emit
+from squiggy import std_commit
 from squiggy.api.api_util import get_socket_io_room, SOCKET_IO_NAMESPACE
 from squiggy.lib.errors import BadRequestError, InternalServerError, UnauthorizedRequestError
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.presence import whiteboard_presence
 from squiggy.lib.previews import verify_preview_service_authorization
 from squiggy.lib.util import utc_now
 from squiggy.logger import logger
@@ -103,33 +105,33 @@ def _update_asset_preview(metadata, params):
     ):
         return False
 
-    # If the asset appears in any live whiteboards, update via socketio.
-    all_asset_usages = WhiteboardElement.get_asset_usages(asset_id)
-    live_asset_usages = WhiteboardElement.get_asset_usages(asset_id, live_usages_only=True)
-    live_usage_whiteboard_element_ids = [whiteboard_element['id'] for whiteboard_element in live_asset_usages]
-    for whiteboard_element in all_asset_usages:
+    # Whiteboard elements of the asset get the new image, one write per whiteboard. This is the only place where
+    # whiteboard loads learn of new asset images; WhiteboardHousekeeping catches up on anything missed.
+    metadata = metadata or {}
+    upserts_by_whiteboard_id = {}
+    for whiteboard_element in WhiteboardElement.get_asset_usages(asset_id):
         element = whiteboard_element['element']
-        whiteboard_id = whiteboard_element['whiteboardId']
         if element.get('src') != asset_image_url:
             element['src'] = asset_image_url
             element['width'] = metadata['image_width'] if 'image_width' in metadata else element['width']
             image_height = metadata['image_height'] if 'image_height' in metadata else None
             is_link_asset = asset.asset_type == 'link'
             element['height'] = image_height or (DEFAULT_LINK_ASSET_IMAGE_HEIGHT if is_link_asset else element['height'])
-            w = WhiteboardElement.update(
-                asset_id=asset_id,
-                element=element,
-                uuid=whiteboard_element['uuid'],
-                whiteboard_id=whiteboard_id,
-            )
-            whiteboard_element['element'] = w.element
-        if not app.config['TESTING'] and whiteboard_element['id'] in live_usage_whiteboard_element_ids:
+            upserts_by_whiteboard_id.setdefault(whiteboard_element['whiteboardId'], []).append({
+                'assetId': asset.id,
+                'element': element,
+            })
+    user_ids_online = whiteboard_presence.get_user_ids_online(list(upserts_by_whiteboard_id.keys()))
+    for whiteboard_id, upserts in upserts_by_whiteboard_id.items():
+        whiteboard_elements, _ = WhiteboardElement.upsert_all(whiteboard_elements=upserts, whiteboard_id=whiteboard_id)
+        std_commit()
+        # If the asset appears in any live whiteboards, update via socketio.
+        if not app.config['TESTING'] and user_ids_online.get(whiteboard_id):
             logger.info(f'socketio: Emit upsert_whiteboard_elements where whiteboard_id = {whiteboard_id}')
             emit(
                 'upsert_whiteboard_elements',
-                [whiteboard_element],
+                whiteboard_elements,
                 namespace=SOCKET_IO_NAMESPACE,
                 to=get_socket_io_room(whiteboard_id),
             )
-
     return True
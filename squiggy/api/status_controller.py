@@ -26,10 +26,17 @@ from flask import current_app as app
 import redis
 from sqlalchemy.exc import SQLAlchemyError
 from squiggy import db
+from squiggy.api.api_util import admin_required
+from squiggy.lib.asset_views import asset_view_buffer
+from squiggy.lib.aws import s3_client_registry
+from squiggy.lib.cache import get_cache_stats
 from squiggy.lib.http import tolerant_jsonify
 from squiggy.lib.previews import ping_preview_service
+from squiggy.lib.render_cache import render_cache
+from squiggy.lib.render_pool import render_pool
 from squiggy.lib.socket_io_util import get_queue_url
 from squiggy.lib.util import utc_now
+from squiggy.lib.whiteboard_housekeeping import get_whiteboard_housekeeping_stats
 from squiggy.logger import logger
 
 
@@ -46,6 +53,19 @@ def app_status():
     return tolerant_jsonify(resp)
 
 
+@app.route('/api/status/metrics')
+@admin_required
+def app_metrics():
+    return tolerant_jsonify({
+        'assetViews': asset_view_buffer.stats(),
+        'caches': get_cache_stats(),
+        's3': s3_client_registry.stats(),
+        'renderCache': render_cache.stats(),
+        'renderPool': render_pool.stats(),
+        'whiteboardHousekeeping': get_whiteboard_housekeeping_stats(),
+    })
+
+
 def _cache_status():
     try:
         r = redis.from_url(get_queue_url(app), socket_connect_timeout=1)
@@ -25,16 +25,19 @@ ENHANCEMENTS, OR MODIFICATIONS.
 
 import re
 
-from flask import current_app as app, request, send_file
+from flask import current_app as app, request, Response, stream_with_context
 from flask_login import current_user, login_required
 from flask_socketio import emit
 from squiggy.api.api_util import can_current_user_view_asset, get_socket_io_room, SOCKET_IO_NAMESPACE
 from squiggy.lib.errors import BadRequestError, ResourceNotFoundError
-from squiggy.lib.file_remover import file_remover
 from squiggy.lib.http import tolerant_jsonify
-from squiggy.lib.util import isoformat, local_now
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
+from squiggy.lib.util import isoformat, local_now, to_int
+from squiggy.lib.viewport import parse_viewport
 from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
-from squiggy.lib.whiteboard_util import to_png_file
+from squiggy.lib.whiteboard_state import whiteboard_state
+from squiggy.lib.whiteboard_util import to_png_stream
 from squiggy.logger import logger
 from squiggy.models.asset import Asset
 from squiggy.models.asset_whiteboard_element import AssetWhiteboardElement
@@ -42,14 +45,20 @@ from squiggy.models.category import Category
 from squiggy.models.user import User
 from squiggy.models.whiteboard import Whiteboard
 from squiggy.models.whiteboard_element import WhiteboardElement
-from squiggy.models.whiteboard_session import WhiteboardSession
+from squiggy.models.whiteboard_operation import WhiteboardOperation
 
 
 @app.route('/api/whiteboard/<whiteboard_id>')
 @login_required
 def get_whiteboard(whiteboard_id):
     if Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
-        whiteboard = Whiteboard.find_by_id(current_user=current_user, whiteboard_id=whiteboard_id)
+        # Optional viewport, 'left,top,width,height', limits the response to elements in view.
+        viewport = request.args.get('viewport')
+        try:
+            viewport = parse_viewport(viewport) if viewport else None
+        except ValueError as e:
+            raise BadRequestError(str(e))
+        whiteboard = Whiteboard.find_by_id(current_user=current_user, viewport=viewport, whiteboard_id=whiteboard_id)
         return tolerant_jsonify(whiteboard)
     else:
         raise ResourceNotFoundError('Whiteboard not found')
@@ -90,6 +99,8 @@ def export_as_asset(whiteboard_id):
         whiteboard_id=whiteboard_id,
     )
     if whiteboard:
+        socket_event_coalescer.flush(whiteboard_id)
+        whiteboard_state.flush(whiteboard_id)
         whiteboard_elements = WhiteboardElement.find_by_whiteboard_id(whiteboard_id=whiteboard_id)
         if whiteboard_elements:
             params = request.get_json()
@@ -110,14 +121,15 @@ def export_as_asset(whiteboard_id):
                 title=title,
                 users=User.find_by_ids(collaborator_user_ids),
             )
-            for whiteboard_element in whiteboard_elements:
+            # Fractional z_index of the whiteboard becomes an ordinal in the asset.
+            for z_index, whiteboard_element in enumerate(sorted(whiteboard_elements, key=lambda w: w.z_index)):
                 element = whiteboard_element.element
                 AssetWhiteboardElement.create(
                     asset_id=asset.id,
                     element=element,
                     element_asset_id=element.get('assetId'),
                     uuid=element['uuid'],
-                    z_index=whiteboard_element.z_index,
+                    z_index=z_index,
                 )
             return tolerant_jsonify(Asset.find_by_id(asset_id=asset.id).to_api_json())
         else:
@@ -146,21 +158,85 @@ def export_as_png(whiteboard_id):
     # Download
     now = local_now().strftime('%Y-%m-%d_%H-%M-%S')
     filename = re.sub(r'[^a-zA-Z0-9]', '_', whiteboard['title'])
-    png_file = to_png_file(whiteboard)
-    if png_file:
-        path_to_file = png_file.name
-        response = send_file(
-            as_attachment=True,
-            download_name=f'{filename}_{now}.png',
-            path_or_file=path_to_file,
+    png_stream = to_png_stream(whiteboard)
+    if png_stream:
+        # PNG chunks go to the client as the renderer produces them.
+        return Response(
+            stream_with_context(png_stream),
+            headers={
+                'Content-disposition': f'attachment; filename="{filename}_{now}.png"',
+            },
+            mimetype='image/png',
         )
-        file_remover.clean_up_when_done(response, path_to_file)
-        logger.info(f'Delete transient file {path_to_file}')
-        return response
     else:
         raise BadRequestError('Failed to generate whiteboard PNG')
 
 
+@app.route('/api/whiteboard/<whiteboard_id>/history')
+@login_required
+def get_whiteboard_history(whiteboard_id):
+    if Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
+        limit = to_int(request.args.get('limit', 50))
+        if limit is None:
+            raise BadRequestError('limit must be an integer')
+        limit = max(1, min(limit, app.config['WHITEBOARD_HISTORY_MAX_LIMIT']))
+        operations = WhiteboardOperation.get_history(limit=limit, whiteboard_id=whiteboard_id)
+        return tolerant_jsonify([operation.to_api_json() for operation in operations])
+    else:
+        raise ResourceNotFoundError('Not found')
+
+
+@app.route('/api/whiteboard/<whiteboard_id>/undo', methods=['POST'])
+@login_required
+def undo(whiteboard_id):
+    if Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
+        params = request.get_json()
+        socket_id = params.get('socketId')
+        if not socket_id:
+            raise BadRequestError('socket_id is required')
+        version = params.get('version')
+        if version is not None:
+            version = to_int(version)
+            if version is None or version < 1:
+                raise BadRequestError('version must be a positive integer')
+        # Pending edits are part of history.
+        socket_event_coalescer.flush(whiteboard_id)
+        whiteboard_state.flush(whiteboard_id)
+        result = Whiteboard.undo(version=version, whiteboard_id=whiteboard_id)
+        if not result:
+            raise BadRequestError('Nothing to undo')
+        restored, deleted_uuids = result
+        restored = Whiteboard.hydrate_whiteboard_elements(restored)
+        if not app.config['TESTING']:
+            logger.info(f'socketio: Emit undo of whiteboard {whiteboard_id}')
+            room = get_socket_io_room(whiteboard_id)
+            if restored:
+                emit(
+                    'upsert_whiteboard_elements',
+                    restored,
+                    include_self=False,
+                    namespace=SOCKET_IO_NAMESPACE,
+                    skip_sid=socket_id,
+                    to=room,
+                )
+            if deleted_uuids:
+                emit(
+                    'delete_whiteboard_elements',
+                    deleted_uuids,
+                    include_self=False,
+                    namespace=SOCKET_IO_NAMESPACE,
+                    skip_sid=socket_id,
+                    to=room,
+                )
+        WhiteboardHousekeeping.queue_for_preview_image(whiteboard_id)
+        return tolerant_jsonify({
+            'deletedUuids': deleted_uuids,
+            'whiteboardElements': restored,
+        })
+    else:
+        raise ResourceNotFoundError('Not found')
+
+
 @app.route('/api/whiteboard/<whiteboard_id>/undelete', methods=['POST'])
 @login_required
 def undelete_whiteboard(whiteboard_id):
@@ -189,7 +265,7 @@ def undelete_whiteboard(whiteboard_id):
                 to=get_socket_io_room(whiteboard_id),
             )
         if current_user.is_student:
-            WhiteboardSession.update_updated_at(
+            whiteboard_presence.touch(
                 socket_id=socket_id,
                 user_id=current_user.user_id,
                 whiteboard_id=whiteboard_id,
@@ -270,7 +346,7 @@ def delete_whiteboard(whiteboard_id):
                 to=get_socket_io_room(whiteboard_id),
             )
         if current_user.is_student:
-            WhiteboardSession.update_updated_at(
+            whiteboard_presence.touch(
                 socket_id=socket_id,
                 user_id=current_user.user_id,
                 whiteboard_id=whiteboard_id,
@@ -325,7 +401,7 @@ def update_whiteboard(whiteboard_id):
                 to=get_socket_io_room(whiteboard_id),
             )
         if current_user.is_student:
-            WhiteboardSession.update_updated_at(
+            whiteboard_presence.touch(
                 socket_id=socket_id,
                 user_id=current_user.user_id,
                 whiteboard_id=whiteboard_id,
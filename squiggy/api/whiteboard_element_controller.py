@@ -26,15 +26,17 @@ ENHANCEMENTS, OR MODIFICATIONS.
 from flask import current_app as app, request
 from flask_login import current_user, login_required
 from flask_socketio import emit
-from squiggy.api.api_util import get_socket_io_room, upsert_whiteboard_elements
+from squiggy.api.api_util import get_socket_io_room, patch_whiteboard_elements, upsert_whiteboard_elements
 from squiggy.lib.errors import BadRequestError, UnauthorizedRequestError
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
 from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
+from squiggy.lib.whiteboard_state import whiteboard_state
 from squiggy.logger import logger
 from squiggy.models.asset_whiteboard_element import AssetWhiteboardElement
 from squiggy.models.whiteboard import Whiteboard
 from squiggy.models.whiteboard_element import WhiteboardElement
-from squiggy.models.whiteboard_session import WhiteboardSession
 from squiggy.sockets import SOCKET_IO_NAMESPACE
 
 
@@ -48,14 +50,16 @@ def order_whiteboard_elements():
     whiteboard_id = params.get('whiteboardId')
     if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
         raise UnauthorizedRequestError('Unauthorized')
-    if not direction:
-        raise BadRequestError('direction is required')
+    if direction not in ['bringForward', 'bringToFront', 'sendBackwards', 'sendToBack']:
+        raise BadRequestError('Valid direction is required')
     if not socket_id:
         raise BadRequestError('socket_id is required')
     if len(uuids or []) == 0:
         raise BadRequestError('uuids required')
 
-    # Order the whiteboard_elements
+    # Order the whiteboard_elements, including those not yet saved.
+    socket_event_coalescer.flush(whiteboard_id)
+    whiteboard_state.flush(whiteboard_id)
     WhiteboardElement.update_z_indexes(
         direction=direction,
         uuids=uuids,
@@ -75,7 +79,7 @@ def order_whiteboard_elements():
             skip_sid=socket_id,
             to=get_socket_io_room(whiteboard_id),
         )
-    WhiteboardSession.update_updated_at(
+    whiteboard_presence.touch(
         socket_id=socket_id,
         user_id=current_user.user_id,
         whiteboard_id=whiteboard_id,
@@ -83,6 +87,20 @@ def order_whiteboard_elements():
     return tolerant_jsonify({'message': 'Success'})
 
 
+@app.route('/api/whiteboard_elements/patch', methods=['POST'])
+@login_required
+def patch():
+    params = request.form or request.get_json()
+    result = patch_whiteboard_elements(
+        socket_id=params.get('socketId'),
+        patches=params.get('patches'),
+        whiteboard_id=params.get('whiteboardId'),
+        coalesce=bool(app.config['SOCKET_IO_COALESCE_WINDOW']),
+        write_behind=app.config['WHITEBOARD_STATE_WRITE_BEHIND'],
+    )
+    return tolerant_jsonify(result)
+
+
 @app.route('/api/whiteboard_elements/upsert', methods=['POST'])
 @login_required
 def upsert():
@@ -95,6 +113,8 @@ def upsert():
         socket_id=socket_id,
         whiteboard_elements=whiteboard_elements,
         whiteboard_id=whiteboard_id,
+        coalesce=bool(app.config['SOCKET_IO_COALESCE_WINDOW']),
+        write_behind=app.config['WHITEBOARD_STATE_WRITE_BEHIND'],
     )
     return tolerant_jsonify(results)
 
@@ -111,6 +131,9 @@ def delete_whiteboard_elements():
     if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
         raise UnauthorizedRequestError('Unauthorized')
 
+    # Pending edits must not bring deleted elements back to life.
+    socket_event_coalescer.discard(uuids=uuids, whiteboard_id=whiteboard_id)
+    whiteboard_state.discard(uuids=uuids, whiteboard_id=whiteboard_id)
     whiteboard_elements = WhiteboardElement.find_all(uuids=uuids, whiteboard_id=whiteboard_id)
     if len(whiteboard_elements):
         logger.info(f'socketio: Emit delete_whiteboard_elements where whiteboard_id = {whiteboard_id}')
@@ -131,7 +154,7 @@ def delete_whiteboard_elements():
             )
         WhiteboardElement.delete_all(uuids=uuids, whiteboard_id=whiteboard_id)
         WhiteboardHousekeeping.queue_for_preview_image(whiteboard_id)
-        WhiteboardSession.update_updated_at(
+        whiteboard_presence.touch(
             socket_id=socket_id,
             user_id=current_user.user_id,
             whiteboard_id=whiteboard_id,
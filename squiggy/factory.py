@@ -28,9 +28,14 @@ import os
 from flask import Flask
 from squiggy import db
 from squiggy.configs import load_configs
+from squiggy.lib.asset_views import launch_asset_views
+from squiggy.lib.cache import launch_cache_invalidation
 from squiggy.lib.canvas_poller import launch_pollers
+from squiggy.lib.points_recalculation import launch_points_recalculation
+from squiggy.lib.socket_event_coalescer import launch_socket_event_coalescer
 from squiggy.lib.socket_io_util import create_mock_socket, initialize_socket_io
 from squiggy.lib.whiteboard_housekeeping import launch_whiteboard_housekeeping
+from squiggy.lib.whiteboard_state import launch_whiteboard_state
 from squiggy.logger import initialize_app_logger
 from squiggy.routes import register_routes
 from squiggy.sockets import register_sockets
@@ -53,5 +58,10 @@ def create_app():
             if app.config['CANVAS_POLLER']:
                 launch_pollers()
             launch_whiteboard_housekeeping()
+            launch_cache_invalidation()
+            launch_whiteboard_state()
+            launch_socket_event_coalescer()
+            launch_points_recalculation()
+            launch_asset_views()
 
     return app, socketio
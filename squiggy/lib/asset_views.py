@@ -0,0 +1,179 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import atexit
+from threading import Lock
+from time import monotonic, sleep
+
+from flask import current_app as app
+import redis
+from squiggy import db
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.redis_util import get_redis_client
+from squiggy.lib.util import utc_now
+from squiggy.logger import logger
+from squiggy.models.asset import Asset
+
+# Per (asset_id, user_id), a Redis key marks a view counted within the dedup window, shared by all workers.
+DEDUP_KEY_PREFIX = 'squiggy_asset_view'
+
+
+def launch_asset_views():
+    app_arg = app._get_current_object()
+    AssetViewFlusher().run_async()
+    # Record pending views when the worker shuts down.
+    atexit.register(_flush_on_exit, app_arg)
+
+
+class AssetViewBuffer(object):
+    """Views of assets, appended per request and recorded in batches."""
+
+    def __init__(self):
+        self.deduplicated = 0
+        self.flush_lock = Lock()
+        self.lock = Lock()
+        # Without Redis, views counted within the dedup window are tracked per process: (asset_id, user_id) -> time.
+        self.counted = {}
+        self.pending = []
+        self.recorded = 0
+
+    def add(self, asset_id, course_id, user_id):
+        # Returns False if the user's view falls within the dedup window of their last counted view of the asset.
+        if not self._is_countable(asset_id, user_id):
+            with self.lock:
+                self.deduplicated += 1
+            return False
+        with self.lock:
+            self.pending.append({
+                'assetId': asset_id,
+                'courseId': course_id,
+                'userId': user_id,
+                'viewedAt': utc_now(),
+            })
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.counted = {}
+            self.pending = []
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                views = self.pending
+                self.pending = []
+                self._prune_counted()
+            if not views:
+                return 0
+            try:
+                count = Asset.record_views(views)
+            except Exception as e:
+                logger.error(f'Failed to record {len(views)} asset view(s).')
+                logger.exception(e)
+                db.session.rollback()
+                self._requeue(views)
+                return 0
+        with self.lock:
+            self.recorded += count
+        return count
+
+    def stats(self):
+        with self.lock:
+            return {
+                'deduplicated': self.deduplicated,
+                'pending': len(self.pending),
+                'recorded': self.recorded,
+            }
+
+    def _is_countable(self, asset_id, user_id):
+        window = app.config['ASSET_VIEW_DEDUP_WINDOW_SECONDS']
+        if not window:
+            return True
+        client = get_redis_client()
+        if client:
+            try:
+                return bool(client.set(f'{DEDUP_KEY_PREFIX}_{asset_id}_{user_id}', 1, ex=window, nx=True))
+            except redis.RedisError as e:
+                logger.error('Failed to check Redis for duplicate asset view; will dedup per process.')
+                logger.exception(e)
+        now = monotonic()
+        with self.lock:
+            last_counted = self.counted.get((asset_id, user_id))
+            if last_counted is not None and now - last_counted < window:
+                return False
+            self.counted[(asset_id, user_id)] = now
+            return True
+
+    def _requeue(self, views):
+        # Failed views go back to the head of the queue, for the next flush. After the last attempt they are dropped, and
+        # the user's next view of the asset is countable.
+        max_attempts = app.config['ASSET_VIEW_FLUSH_MAX_ATTEMPTS']
+        retries = []
+        dropped = []
+        for view in views:
+            attempts = view.get('attempts', 0) + 1
+            if attempts < max_attempts:
+                retries.append({**view, 'attempts': attempts})
+            else:
+                dropped.append(view)
+        with self.lock:
+            self.pending = retries + self.pending
+            for view in dropped:
+                self.counted.pop((view['assetId'], view['userId']), None)
+        if dropped:
+            logger.error(f'Dropped {len(dropped)} asset view(s) after {max_attempts} failed attempts.')
+            client = get_redis_client()
+            if client:
+                try:
+                    client.delete(*[f"{DEDUP_KEY_PREFIX}_{v['assetId']}_{v['userId']}" for v in dropped])
+                except redis.RedisError as e:
+                    logger.error('Failed to delete Redis keys of dropped asset views.')
+                    logger.exception(e)
+
+    def _prune_counted(self):
+        window = app.config['ASSET_VIEW_DEDUP_WINDOW_SECONDS'] or 0
+        now = monotonic()
+        self.counted = {key: counted_at for key, counted_at in self.counted.items() if now - counted_at < window}
+
+
+class AssetViewFlusher(BackgroundJob):
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='asset_view_flusher', **kwargs)
+
+    def run(self):
+        while True:
+            sleep(app.config['ASSET_VIEW_FLUSH_INTERVAL'])
+            asset_view_buffer.flush()
+
+
+asset_view_buffer = AssetViewBuffer()
+
+
+def _flush_on_exit(app_arg):
+    with app_arg.app_context():
+        count = asset_view_buffer.flush()
+        if count:
+            logger.info(f'Recorded {count} pending asset view(s) on shutdown')
@@ -23,45 +23,147 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from collections import deque
 from datetime import datetime
+from math import ceil
 import os
 import re
+from threading import Lock
+from time import time
 from urllib.parse import parse_qs, urlparse
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from flask import current_app as app
 import magic
 import smart_open
+from squiggy.lib.cache import TTLCache
 from squiggy.lib.errors import InternalServerError
 from squiggy.lib.util import utc_now
 from squiggy.logger import logger
 
 
 S3_PREVIEW_URL_PATTERN = '^https://suitec-preview-images-\w+\.s3.*\.amazonaws\.com'
+# Smallest part S3 accepts in a multipart upload, and so the most a streaming upload holds in memory.
+S3_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+# Signed urls have at least this many seconds of life left when handed out.
+S3_SIGNED_URL_MIN_LIFE = 3600
+
+# Per (bucket, key), the signed url of the current time window.
+signed_url_cache = TTLCache(name='s3_signed_urls')
+
+
+class S3ClientRegistry:
+    """One boto3 session and S3 client, shared by all threads, replaced when credentials change or it grows old.
+
+    Clients are thread-safe; sessions are not, so the session is used only under lock.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.client = None
+        self.client_created_at = None
+        self.credentials = None
+        self.session = None
+        # Latest request durations, in seconds, and running totals.
+        self.request_durations = deque(maxlen=1000)
+        self.counts = {
+            'clientCreations': 0,
+            'requestErrors': 0,
+            'requests': 0,
+        }
+
+    def clear(self):
+        # The next caller gets a new client, e.g. after credentials are rotated in place.
+        with self.lock:
+            self.client = None
+
+    def get_client(self):
+        with self.lock:
+            return self._refresh()[1]
+
+    def get_resource(self):
+        # Resources are not thread-safe, so each caller gets its own, from the shared session.
+        with self.lock:
+            session, _ = self._refresh()
+            return session.resource('s3', config=self._get_config())
+
+    def stats(self):
+        with self.lock:
+            durations = sorted(self.request_durations)
+            return {
+                **self.counts,
+                'requestSecondsMax': durations[-1] if durations else None,
+                'requestSecondsMedian': durations[len(durations) // 2] if durations else None,
+            }
+
+    def _get_config(self):
+        return Config(max_pool_connections=app.config['AWS_S3_MAX_POOL_CONNECTIONS'])
+
+    def _on_after_call(self, context, **kwargs):
+        started_at = context.get('squiggy_started_at')
+        with self.lock:
+            self.counts['requests'] += 1
+            if started_at:
+                self.request_durations.append(time() - started_at)
+
+    def _on_after_call_error(self, **kwargs):
+        with self.lock:
+            self.counts['requestErrors'] += 1
+
+    def _on_before_call(self, context, **kwargs):
+        context['squiggy_started_at'] = time()
+
+    def _refresh(self):
+        credentials = (app.config['AWS_ACCESS_KEY_ID'], app.config['AWS_SECRET_ACCESS_KEY'])
+        is_expired = self.client and time() - self.client_created_at > app.config['AWS_S3_CLIENT_MAX_AGE']
+        if not self.client or is_expired or credentials != self.credentials:
+            self.session = boto3.Session(
+                aws_access_key_id=credentials[0],
+                aws_secret_access_key=credentials[1],
+            )
+            self.client = self.session.client('s3', config=self._get_config())
+            self.client.meta.events.register('before-call.s3', self._on_before_call)
+            self.client.meta.events.register('after-call.s3', self._on_after_call)
+            self.client.meta.events.register('after-call-error.s3', self._on_after_call_error)
+            self.client_created_at = time()
+            self.credentials = credentials
+            self.counts['clientCreations'] += 1
+        return self.session, self.client
+
+
+s3_client_registry = S3ClientRegistry()
+
+
+def get_s3_object_chunks(bucket, key, chunk_size):
+    # Returns None if there is no such object.
+    try:
+        return _get_s3_client().get_object(Bucket=bucket, Key=key)['Body'].iter_chunks(chunk_size=chunk_size)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ['404', 'NoSuchKey']:
+            logger.error(f'S3 get operation failed (bucket={bucket}, key={key})')
+            logger.exception(e)
+        return None
 
 
 def get_s3_signed_url(url):
-    if not is_s3_preview_url(url):
-        return url
-    parsed_url = urlparse(url)
-    query_string = parse_qs(parsed_url.query)
+    return get_s3_signed_urls([url])[0]
 
-    # If we already have a signed URL with at least an hour of life left, that will do.
-    if 'Expires' in query_string and (int(query_string['Expires'][0]) - datetime.utcnow().timestamp()) > 3600:
-        return url
 
-    s3 = _get_s3_client()
-    bucket = re.sub('\..*$', '', parsed_url.hostname)
-    key = re.sub('^/', '', parsed_url.path)
+def get_s3_signed_urls(urls):
+    return [_sign_s3_url(url) if _is_signature_needed(url) else url for url in urls]
 
-    return s3.generate_presigned_url(
-        ClientMethod='get_object',
-        Params={
-            'Bucket': bucket,
-            'Key': key,
-        },
-        ExpiresIn=3600,
-    )
+
+def is_s3_object(bucket, key):
+    try:
+        _get_s3_client().head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ['404', 'NoSuchKey']:
+            logger.error(f'S3 head operation failed (bucket={bucket}, key={key})')
+            logger.exception(e)
+        return False
 
 
 def put_binary_data_to_s3(bucket, key, binary_data, content_type):
@@ -75,9 +177,28 @@ def put_binary_data_to_s3(bucket, key, binary_data, content_type):
         return None
 
 
+def put_chunks_to_s3(bucket, key, chunks, content_type):
+    # Multipart upload, part by part as chunks arrive. If 'chunks' raises then the upload is aborted and the error is
+    # the caller's to handle.
+    try:
+        transport_params = {
+            'min_part_size': S3_MULTIPART_PART_SIZE,
+            'multipart_upload_kwargs': {'ContentType': content_type},
+            'resource': s3_client_registry.get_resource(),
+        }
+        with smart_open.open(f's3://{bucket}/{key}', 'wb', transport_params=transport_params) as s3_object:
+            for chunk in chunks:
+                s3_object.write(chunk)
+        return True
+    except (BotoCoreError, ClientError) as e:
+        logger.error(f'S3 multipart upload failed (bucket={bucket}, key={key})')
+        logger.exception(e)
+        return None
+
+
 def stream_object(s3_url):
     try:
-        return smart_open.open(s3_url, 'rb', transport_params={'session': _get_session()})
+        return smart_open.open(s3_url, 'rb', transport_params={'resource': s3_client_registry.get_resource()})
     except Exception as e:
         logger.error(f'S3 stream operation failed (s3_url={s3_url})')
         logger.exception(e)
@@ -103,12 +224,36 @@ def upload_to_s3(filename, byte_stream, s3_key_prefix):
         raise InternalServerError('Could not upload file.')
 
 
-def _get_s3_client():
-    return _get_session().client('s3')
+def _is_signature_needed(url):
+    if not is_s3_preview_url(url):
+        return False
+    query_string = parse_qs(urlparse(url).query)
+    # If we already have a signed URL with enough life left, that will do.
+    expires = 'Expires' in query_string and int(query_string['Expires'][0])
+    return not (expires and expires - datetime.utcnow().timestamp() > S3_SIGNED_URL_MIN_LIFE)
 
 
-def _get_session():
-    return boto3.Session(
-        aws_access_key_id=app.config['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=app.config['AWS_SECRET_ACCESS_KEY'],
-    )
+def _sign_s3_url(url):
+    parsed_url = urlparse(url)
+    bucket = re.sub('\..*$', '', parsed_url.hostname)
+    key = re.sub('^/', '', parsed_url.path)
+    # Within a time window, every read gets the same url (and so browsers and CDNs can cache what it points to). Its
+    # expiry is pinned to the end of the window, which keeps urls signed by peer workers identical too.
+    window_seconds = app.config['S3_SIGNED_URL_WINDOW_SECONDS']
+    now = time()
+    window_end = (int(now // window_seconds) + 1) * window_seconds
+
+    def _sign():
+        return _get_s3_client().generate_presigned_url(
+            ClientMethod='get_object',
+            Params={
+                'Bucket': bucket,
+                'Key': key,
+            },
+            ExpiresIn=ceil(window_end + S3_SIGNED_URL_MIN_LIFE - time()),
+        )
+    return signed_url_cache.get_or_load((bucket, key), _sign, ttl_seconds=window_end - now)
+
+
+def _get_s3_client():
+    return s3_client_registry.get_client()
@@ -0,0 +1,135 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from squiggy.lib.redis_util import publish, subscribe
+
+# Invalidations are shared with peer workers over this channel.
+INVALIDATION_CHANNEL = 'squiggy_cache_invalidation'
+
+# All caches of this process, by name.
+caches = {}
+
+_MISSING = object()
+
+
+def launch_cache_invalidation():
+    subscribe(INVALIDATION_CHANNEL, _handle_invalidation)
+
+
+def get_cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+class TTLCache(object):
+    """Thread-safe, size-bounded (least recently used is evicted) cache of entries which expire."""
+
+    def __init__(self, name, max_size=10000):
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.hits = 0
+        self.lock = Lock()
+        self.max_size = max_size
+        self.misses = 0
+        self.name = name
+        caches[name] = self
+
+    def get(self, key, default=None):
+        now = monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def get_or_load(self, key, load, ttl_seconds):
+        # Note: a loaded value of None is cached too.
+        value = self.get(key, default=_MISSING)
+        if value is _MISSING:
+            value = load()
+            self.put(key, value, ttl_seconds)
+        return value
+
+    def put(self, key, value, ttl_seconds):
+        with self.lock:
+            self.entries[key] = (monotonic() + ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        self._apply({'type': 'clear'})
+        self._publish({'type': 'clear'})
+
+    def invalidate(self, key):
+        self._apply({'key': key, 'type': 'key'})
+        self._publish({'key': list(key) if isinstance(key, tuple) else key, 'type': 'key'})
+
+    def invalidate_where(self, index, value):
+        # Drop every entry whose tuple key has the given value at the given index.
+        message = {'index': index, 'type': 'where', 'value': value}
+        self._apply(message)
+        self._publish(message)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 4) if lookups else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+            }
+
+    def _apply(self, message):
+        with self.lock:
+            message_type = message['type']
+            if message_type == 'clear':
+                self.entries.clear()
+            elif message_type == 'key':
+                key = message['key']
+                self.entries.pop(tuple(key) if isinstance(key, list) else key, None)
+            elif message_type == 'where':
+                index = message['index']
+                value = message['value']
+                for key in [k for k in self.entries.keys() if isinstance(k, tuple) and len(k) > index and k[index] == value]:
+                    del self.entries[key]
+
+    def _publish(self, message):
+        publish(INVALIDATION_CHANNEL, {**message, 'cache': self.name})
+
+
+def _handle_invalidation(message):
+    cache = caches.get(message.get('cache'))
+    if cache:
+        cache._apply(message)
@@ -46,6 +46,7 @@ from squiggy.models.course import Course
 from squiggy.models.course_group import CourseGroup
 from squiggy.models.course_group_membership import CourseGroupMembership
 from squiggy.models.user import User
+from squiggy.models.whiteboard import whiteboard_authorization_cache
 
 
 def launch_pollers():
@@ -208,6 +209,8 @@ class CanvasPoller(BackgroundJob):
         api_users = list(api_course.get_users(include=['enrollments', 'avatar_url', 'email']))
         logger.debug(f'Retrieved {len(api_users)} users from Canvas: {_format_course(db_course)}')
         api_user_ids = set()
+        # Changes in enrollment, role or sections can change whiteboard authorization.
+        users_changed = False
         for u in api_users:
             api_user_ids.add(u.id)
             enrollment_state = 'active'
@@ -242,6 +245,7 @@ class CanvasPoller(BackgroundJob):
                         setattr(db_user, key, value)
                         updated = True
                 if updated:
+                    users_changed = True
                     logger.debug(f'Updating info for user {db_user.canvas_user_id}: {_format_course(db_course)}')
                     db.session.add(db_user)
                     std_commit()
@@ -251,7 +255,10 @@ class CanvasPoller(BackgroundJob):
                 logger.debug(f'Marking user {db_user.canvas_user_id} as inactive: {_format_course(db_course)}')
                 db_user.canvas_enrollment_state = 'inactive'
                 db.session.add(db_user)
+                users_changed = True
         std_commit()
+        if users_changed:
+            whiteboard_authorization_cache.clear()
         return db_users_by_canvas_id
 
     def poll_assignments(self, db_course, api_course, users_by_canvas_id):
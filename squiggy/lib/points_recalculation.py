@@ -0,0 +1,84 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from time import sleep
+
+from flask import current_app as app
+from sqlalchemy.exc import SQLAlchemyError
+from squiggy import db
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.logger import logger
+from squiggy.models.activity import Activity
+from squiggy.models.points_recalculation import PointsRecalculation
+from squiggy.models.user import User
+
+
+def launch_points_recalculation():
+    PointsRecalculationJob().run_async()
+
+
+def recalculate_queued_points():
+    # Recalculate points in every queued course, one batch of users at a time. Returns the count of courses.
+    course_count = 0
+    while True:
+        claim = PointsRecalculation.claim(visibility_timeout=app.config['POINTS_RECALCULATION_VISIBILITY_TIMEOUT'])
+        if not claim:
+            return course_count
+        _recalculate_points(course_id=claim['courseId'], queued_at=claim['queuedAt'])
+        course_count += 1
+
+
+class PointsRecalculationJob(BackgroundJob):
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='points_recalculation', **kwargs)
+
+    def run(self):
+        while True:
+            sleep(app.config['POINTS_RECALCULATION_INTERVAL'])
+            recalculate_queued_points()
+
+
+def _recalculate_points(course_id, queued_at):
+    batch_size = app.config['POINTS_RECALCULATION_BATCH_SIZE']
+    try:
+        user_ids = User.get_user_ids_by_course_id(course_id)
+        PointsRecalculation.update_progress(course_id=course_id, queued_at=queued_at, users_total=len(user_ids), users_updated=0)
+        for index in range(0, len(user_ids), batch_size):
+            batch = user_ids[index:index + batch_size]
+            Activity.recalculate_points(course_id=course_id, user_ids=batch)
+            PointsRecalculation.update_progress(
+                course_id=course_id,
+                queued_at=queued_at,
+                users_total=len(user_ids),
+                users_updated=index + len(batch),
+            )
+        status = 'done'
+    except SQLAlchemyError as e:
+        logger.error(f'Failed to recalculate points of course {course_id}')
+        logger.exception(e)
+        db.session.rollback()
+        status = 'error'
+    PointsRecalculation.finish(course_id=course_id, queued_at=queued_at, status=status)
@@ -0,0 +1,173 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from threading import Lock
+from time import time
+
+from flask import current_app as app
+import redis
+from squiggy.lib.redis_util import get_redis_client
+from squiggy.logger import logger
+
+# Per whiteboard, a sorted set of '{user_id}:{socket_id}' scored by time of last activity.
+REDIS_WHITEBOARD_KEY_PREFIX = 'squiggy_presence_whiteboard'
+# Per socket, '{whiteboard_id}:{user_id}' so that a socket can be removed without knowing its whiteboard.
+REDIS_SOCKET_KEY_PREFIX = 'squiggy_presence_socket'
+
+
+class LocalPresence(object):
+    """In-process presence, for single-node deployments."""
+
+    def __init__(self):
+        self.lock = Lock()
+        # Per socket_id: (user_id, whiteboard_id, last_seen)
+        self.sessions = {}
+
+    def get_user_ids_online(self, whiteboard_ids):
+        active_since = time() - _get_expiration_seconds()
+        user_ids_online = {int(whiteboard_id): set() for whiteboard_id in whiteboard_ids}
+        with self.lock:
+            for user_id, whiteboard_id, last_seen in self.sessions.values():
+                if whiteboard_id in user_ids_online and last_seen > active_since:
+                    user_ids_online[whiteboard_id].add(user_id)
+        return user_ids_online
+
+    def prune(self):
+        active_since = time() - _get_expiration_seconds()
+        with self.lock:
+            for socket_id in [s for s, session in self.sessions.items() if session[2] <= active_since]:
+                del self.sessions[socket_id]
+
+    def remove(self, socket_id):
+        with self.lock:
+            self.sessions.pop(socket_id, None)
+
+    def touch(self, socket_id, user_id, whiteboard_id):
+        with self.lock:
+            self.sessions[socket_id] = (int(user_id), int(whiteboard_id), time())
+
+
+class RedisPresence(object):
+    """Presence shared by all workers. Entries expire; nothing to clean up."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_user_ids_online(self, whiteboard_ids):
+        whiteboard_ids = [int(whiteboard_id) for whiteboard_id in whiteboard_ids]
+        active_since = time() - _get_expiration_seconds()
+        pipeline = self.client.pipeline(transaction=False)
+        for whiteboard_id in whiteboard_ids:
+            pipeline.zrangebyscore(_whiteboard_key(whiteboard_id), active_since, '+inf')
+        user_ids_online = {}
+        for whiteboard_id, members in zip(whiteboard_ids, pipeline.execute()):
+            user_ids_online[whiteboard_id] = {int(member.decode().split(':', 1)[0]) for member in members}
+        return user_ids_online
+
+    def prune(self):
+        pass
+
+    def remove(self, socket_id):
+        socket_key = _socket_key(socket_id)
+        value = self.client.get(socket_key)
+        pipeline = self.client.pipeline(transaction=False)
+        if value:
+            whiteboard_id, user_id = value.decode().split(':', 1)
+            pipeline.zrem(_whiteboard_key(whiteboard_id), f'{user_id}:{socket_id}')
+        pipeline.delete(socket_key)
+        pipeline.execute()
+
+    def touch(self, socket_id, user_id, whiteboard_id):
+        now = time()
+        expiration_seconds = _get_expiration_seconds()
+        whiteboard_key = _whiteboard_key(whiteboard_id)
+        socket_key = _socket_key(socket_id)
+        value = f'{whiteboard_id}:{user_id}'
+        previous = self.client.getset(socket_key, value)
+        pipeline = self.client.pipeline(transaction=False)
+        if previous and previous.decode() != value:
+            # Socket moved to another whiteboard.
+            previous_whiteboard_id, previous_user_id = previous.decode().split(':', 1)
+            pipeline.zrem(_whiteboard_key(previous_whiteboard_id), f'{previous_user_id}:{socket_id}')
+        pipeline.expire(socket_key, int(expiration_seconds))
+        pipeline.zadd(whiteboard_key, {f'{user_id}:{socket_id}': now})
+        pipeline.zremrangebyscore(whiteboard_key, '-inf', now - expiration_seconds)
+        pipeline.expire(whiteboard_key, int(expiration_seconds))
+        pipeline.execute()
+
+
+class WhiteboardPresence(object):
+    """Who is online, per whiteboard. The backend is Redis when configured, else in-process."""
+
+    def __init__(self):
+        self.local = LocalPresence()
+
+    def get_user_ids_online(self, whiteboard_ids):
+        # Returns set of user_ids per whiteboard_id.
+        if not whiteboard_ids:
+            return {}
+        return self._call('get_user_ids_online', whiteboard_ids) or {int(whiteboard_id): set() for whiteboard_id in whiteboard_ids}
+
+    def is_online(self, whiteboard_id):
+        return bool(self.get_user_ids_online([whiteboard_id]).get(int(whiteboard_id)))
+
+    def prune(self):
+        self._call('prune')
+
+    def remove(self, socket_id):
+        self._call('remove', socket_id)
+
+    def touch(self, socket_id, user_id, whiteboard_id):
+        if socket_id and user_id and whiteboard_id:
+            self._call('touch', socket_id, user_id, whiteboard_id)
+
+    def _backend(self):
+        backend = app.config['WHITEBOARD_PRESENCE_BACKEND']
+        client = get_redis_client() if backend in [None, 'redis'] else None
+        return RedisPresence(client) if client else self.local
+
+    def _call(self, method_name, *args):
+        try:
+            return getattr(self._backend(), method_name)(*args)
+        except redis.RedisError as e:
+            # Presence is nice-to-have; a Redis outage must not break whiteboards.
+            logger.error(f'Presence backend failed on {method_name}')
+            logger.exception(e)
+            return None
+
+
+whiteboard_presence = WhiteboardPresence()
+
+
+def _get_expiration_seconds():
+    return app.config['WHITEBOARD_SESSION_EXPIRATION_MINUTES'] * 60
+
+
+def _socket_key(socket_id):
+    return f'{REDIS_SOCKET_KEY_PREFIX}:{socket_id}'
+
+
+def _whiteboard_key(whiteboard_id):
+    return f'{REDIS_WHITEBOARD_KEY_PREFIX}:{whiteboard_id}'
@@ -26,14 +26,12 @@ ENHANCEMENTS, OR MODIFICATIONS.
 import base64
 import hashlib
 import hmac
-import os
-import re
 
 from flask import current_app as app
 from squiggy.lib import http
-from squiggy.lib.aws import upload_to_s3
-from squiggy.lib.util import local_now, to_int, utc_now
-from squiggy.lib.whiteboard_util import to_png_file
+from squiggy.lib.aws import is_s3_object
+from squiggy.lib.render_cache import get_render_key, get_s3_render_key, get_s3_render_url, get_whiteboard_png_chunks, put_whiteboard_png_to_s3
+from squiggy.lib.util import to_int, utc_now
 from squiggy.logger import logger
 
 
@@ -73,28 +71,23 @@ def generate_preview_service_signature(nonce=None):
 
 def generate_whiteboard_preview(whiteboard):
     if app.config['PREVIEWS_ENABLED']:
-        png_file = to_png_file(whiteboard)
-        now = local_now().strftime('%Y-%m-%d_%H-%M-%S')
-        file_name = png_file.name
-        with open(file_name, mode='rb') as f:
-            filename = re.sub(r'[^a-zA-Z0-9]', '_', whiteboard['title'])
-            s3_attrs = upload_to_s3(
-                byte_stream=f.read(),
-                filename=f'{filename}_{now}.png',
-                s3_key_prefix=get_s3_key_prefix(whiteboard['courseId'], 'whiteboard'),
-            )
-            if not generate_previews(
-                object_id=whiteboard['id'],
-                object_type='whiteboard',
-                object_url=s3_attrs['download_url'],
-            ):
-                # TODO: If preview-image status is needed then the 'whiteboards' table needs 'preview_status' column.
-                pass
-        os.remove(file_name)
-        if s3_attrs and s3_attrs.get('download_url'):
-            return s3_attrs['download_url']
-        else:
-            return None
+        # The S3 key of a render is its content hash. Unchanged whiteboard, unchanged preview: nothing to do.
+        render_key = get_render_key(whiteboard['whiteboardElements'])
+        image_url = get_s3_render_url(render_key)
+        if whiteboard.get('imageUrl') == image_url:
+            return image_url
+        if not is_s3_object(app.config['S3_BUCKET'], get_s3_render_key(render_key)):
+            # Rendered PNG goes to S3 part by part, as the renderer produces it.
+            chunks = get_whiteboard_png_chunks(whiteboard=whiteboard, render_key=render_key, check_s3=False)
+            image_url = put_whiteboard_png_to_s3(chunks=chunks, render_key=render_key)
+        if image_url and not generate_previews(
+            object_id=whiteboard['id'],
+            object_type='whiteboard',
+            object_url=image_url,
+        ):
+            # TODO: If preview-image status is needed then the 'whiteboards' table needs 'preview_status' column.
+            pass
+        return image_url
 
 
 def get_s3_key_prefix(course_id, object_type):
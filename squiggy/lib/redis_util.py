@@ -0,0 +1,84 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+from time import sleep
+
+from flask import current_app as app
+import redis
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.socket_io_util import get_queue_url
+from squiggy.logger import logger
+
+# One client (and connection pool) per Redis URL, shared by all threads of this process.
+redis_clients = {}
+
+
+def get_redis_client():
+    queue_url = get_queue_url(app)
+    if not queue_url:
+        return None
+    if queue_url not in redis_clients:
+        redis_clients[queue_url] = redis.from_url(queue_url)
+    return redis_clients[queue_url]
+
+
+def publish(channel, message):
+    client = get_redis_client()
+    if client:
+        try:
+            client.publish(channel, json.dumps(message))
+        except redis.RedisError as e:
+            logger.error(f'Failed to publish to Redis channel {channel}')
+            logger.exception(e)
+
+
+def subscribe(channel, handler):
+    # Messages published by any worker, this one included, are passed to handler. No-op if Redis is not configured.
+    if get_queue_url(app):
+        RedisSubscriber(channel=channel, handler=handler).run_async()
+
+
+class RedisSubscriber(BackgroundJob):
+
+    def __init__(self, channel, handler):
+        self.channel = channel
+        self.handler = handler
+        super().__init__(thread_name=f'redis_subscriber_{channel}')
+
+    def run(self):
+        try:
+            pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(self.channel)
+            for message in pubsub.listen():
+                try:
+                    self.handler(json.loads(message['data']))
+                except Exception as e:
+                    logger.error(f'Failed to handle message on Redis channel {self.channel}')
+                    logger.exception(e)
+        except redis.RedisError as e:
+            logger.error(f'Lost subscription to Redis channel {self.channel}, will retry')
+            logger.exception(e)
+            sleep(5)
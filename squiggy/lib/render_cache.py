@@ -0,0 +1,191 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from threading import Lock
+from urllib.parse import urlparse
+
+from flask import current_app as app
+from squiggy.lib.aws import get_s3_object_chunks, is_s3_preview_url, put_chunks_to_s3
+from squiggy.lib.render_pool import render_pool
+from squiggy.logger import logger
+
+# Bump when whiteboard_renderer.ts draws differently. Old renders are then never hit again.
+RENDERER_VERSION = 1
+S3_KEY_PREFIX = 'whiteboard_renders'
+# PNGs are read from disk and S3 in chunks of this many bytes.
+CHUNK_SIZE = 64 * 1024
+
+
+class RenderCache:
+    """Whiteboard PNGs by content hash. Tiers: local disk (least recently used are evicted), then S3."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = {
+            'diskHits': 0,
+            'evictions': 0,
+            'misses': 0,
+            's3Hits': 0,
+        }
+
+    def get(self, render_key, check_s3=True):
+        chunks = self.get_chunks(render_key=render_key, check_s3=check_s3)
+        return None if chunks is None else b''.join(chunks)
+
+    def get_chunks(self, render_key, check_s3=True):
+        # Returns an iterator of PNG chunks, or None on a miss. Chunks from S3 are saved to disk as they pass.
+        chunks = self._get_chunks_from_disk(render_key)
+        if chunks is not None:
+            self._count('diskHits')
+            return chunks
+        if check_s3:
+            chunks = get_s3_object_chunks(app.config['S3_BUCKET'], get_s3_render_key(render_key), chunk_size=CHUNK_SIZE)
+            if chunks is not None:
+                self._count('s3Hits')
+                return self.put_chunks(chunks=chunks, render_key=render_key)
+        self._count('misses')
+        return None
+
+    def put(self, png, render_key):
+        for _ in self.put_chunks(chunks=[png], render_key=render_key):
+            pass
+
+    def put_chunks(self, chunks, render_key):
+        # Yields 'chunks' while writing them to disk. The PNG is cached only if every chunk passed through.
+        directory = _get_directory()
+        f = tempfile.NamedTemporaryFile(delete=False, dir=directory, suffix='.tmp')
+        is_complete = False
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            # Write, then rename, so readers never see a partial file.
+            os.replace(f.name, os.path.join(directory, f'{render_key}.png'))
+            is_complete = True
+        finally:
+            if not is_complete:
+                _remove(f.name)
+        self._evict(directory)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _evict(self, directory):
+        entries = [e for e in os.scandir(directory) if e.name.endswith('.png')]
+        total_bytes = sum(e.stat().st_size for e in entries)
+        max_bytes = app.config['WHITEBOARD_RENDER_CACHE_MAX_BYTES']
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if total_bytes <= max_bytes:
+                break
+            total_bytes -= entry.stat().st_size
+            if _remove(entry.path):
+                self._count('evictions')
+
+    def _get_chunks_from_disk(self, render_key):
+        path = os.path.join(_get_directory(), f'{render_key}.png')
+        try:
+            # An open file survives eviction.
+            f = open(path, mode='rb')
+            # Recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return _read_chunks(f)
+
+
+render_cache = RenderCache()
+
+
+def get_render_key(whiteboard_elements):
+    # Stable hash of what the renderer sees. S3 signatures are left out of 'src' and z-order is list order.
+    ordered = sorted(whiteboard_elements, key=lambda w: (w['zIndex'], w['uuid']))
+    canonical = []
+    for whiteboard_element in ordered:
+        element = whiteboard_element['element']
+        src = element.get('src')
+        if src and is_s3_preview_url(src):
+            element = {**element, 'src': urlparse(src)._replace(query='').geturl()}
+        canonical.append({'element': element, 'uuid': whiteboard_element['uuid']})
+    payload = json.dumps({'rendererVersion': RENDERER_VERSION, 'whiteboardElements': canonical}, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_s3_render_key(render_key):
+    return f'{S3_KEY_PREFIX}/{render_key}.png'
+
+
+def get_s3_render_url(render_key):
+    return f"s3://{app.config['S3_BUCKET']}/{get_s3_render_key(render_key)}"
+
+
+def get_whiteboard_png_chunks(whiteboard, render_key=None, check_s3=True):
+    # PNG chunks from cache or, on a miss, streamed from the render pool and cached on the way through.
+    render_key = render_key or get_render_key(whiteboard['whiteboardElements'])
+    chunks = render_cache.get_chunks(render_key=render_key, check_s3=check_s3)
+    if chunks is None:
+        logger.info(f"Render whiteboard {whiteboard['id']} (render_key={render_key})")
+        chunks = render_cache.put_chunks(
+            chunks=render_pool.render_stream(whiteboard['whiteboardElements']),
+            render_key=render_key,
+        )
+    return chunks
+
+
+def put_whiteboard_png_to_s3(chunks, render_key):
+    if put_chunks_to_s3(app.config['S3_BUCKET'], get_s3_render_key(render_key), chunks, 'image/png'):
+        return get_s3_render_url(render_key)
+    return None
+
+
+def _read_chunks(f):
+    with f:
+        chunk = f.read(CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = f.read(CHUNK_SIZE)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _get_directory():
+    directory = app.config['WHITEBOARD_RENDER_CACHE_DIR'] or os.path.join(tempfile.gettempdir(), 'squiggy_render_cache')
+    os.makedirs(directory, exist_ok=True)
+    return directory
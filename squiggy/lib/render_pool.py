@@ -0,0 +1,227 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import os
+import select
+import struct
+import subprocess
+from threading import BoundedSemaphore, Lock
+from time import time
+
+from flask import current_app as app
+from squiggy.logger import logger
+
+
+class RenderError(Exception):
+    pass
+
+
+class RenderWorker:
+    """Long-lived Node process (scripts/node_js/whiteboard_render_worker.js). Messages are length-prefixed frames.
+
+    When the app exits, stdin of the worker closes and it exits too.
+    """
+
+    def __init__(self, base_dir, node_executable):
+        self.process = subprocess.Popen(
+            [
+                node_executable,
+                f'{base_dir}/scripts/node_js/whiteboard_render_worker.js',
+                '-b',
+                base_dir,
+            ],
+            env={'NODE_PATH': f'{base_dir}/node_modules'},
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.last_used_at = time()
+        self.render_count = 0
+        self.request_count = 0
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+    def kill(self):
+        # Mid-response, the worker may be blocked on a full stdout. No waiting for a clean exit.
+        self.process.kill()
+        self.process.wait()
+        for pipe in [self.process.stdin, self.process.stdout]:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def ping(self, timeout):
+        try:
+            for _ in self._request({'type': 'ping'}, timeout=timeout):
+                pass
+            return True
+        except (OSError, RenderError) as e:
+            logger.warning(f'Render worker (pid {self.process.pid}) failed health check: {e}')
+            return False
+
+    def render(self, whiteboard_elements, timeout):
+        # Yields PNG chunks as the worker produces them. The worker is unusable if the caller stops early.
+        self.render_count += 1
+        yield from self._request({'type': 'render', 'whiteboardElements': whiteboard_elements}, timeout=timeout)
+
+    def _read(self, size, deadline):
+        data = b''
+        while len(data) < size:
+            remaining = deadline - time()
+            if remaining <= 0 or not select.select([self.process.stdout], [], [], remaining)[0]:
+                raise RenderError('Render worker timed out')
+            chunk = os.read(self.process.stdout.fileno(), size - len(data))
+            if not chunk:
+                raise RenderError(f'Render worker exited with code {self.process.poll()}')
+            data += chunk
+        return data
+
+    def _read_frame(self, timeout):
+        # The timeout is per frame, so a slow consumer of PNG chunks does not time out the render.
+        deadline = time() + timeout
+        size = struct.unpack('>I', self._read(4, deadline))[0]
+        return self._read(size, deadline)
+
+    def _request(self, message, timeout):
+        self.request_count += 1
+        request_id = self.request_count
+        payload = json.dumps({**message, 'id': request_id}).encode('utf-8')
+        self.process.stdin.write(struct.pack('>I', len(payload)) + payload)
+        self.process.stdin.flush()
+        # PNG data frames until an empty one, then the trailer.
+        chunk = self._read_frame(timeout)
+        while chunk:
+            yield chunk
+            chunk = self._read_frame(timeout)
+        trailer = json.loads(self._read_frame(timeout))
+        self.last_used_at = time()
+        if trailer.get('id') != request_id:
+            raise RenderError(f"Render worker out of sync: expected response {request_id}, got {trailer.get('id')}")
+        if trailer.get('status') != 'ok':
+            raise RenderError(f"Render failed: {trailer.get('error')}")
+
+
+class RenderPool:
+    """Node render workers shared by PNG download and whiteboard previews. Idle workers are reused; busy ones are not."""
+
+    def __init__(self):
+        self.idle_workers = []
+        self.lock = Lock()
+        self.semaphore = None
+        self.counts = {
+            'errors': 0,
+            'renders': 0,
+            'restarts': 0,
+            'starts': 0,
+        }
+
+    def render(self, whiteboard_elements):
+        # Returns PNG bytes.
+        return b''.join(self.render_stream(whiteboard_elements))
+
+    def render_stream(self, whiteboard_elements):
+        # Yields PNG chunks. Blocks while the maximum number of renders is in progress. The worker is held until the
+        # caller has consumed the last chunk; a caller that stops early, e.g. a dropped download, costs a worker restart.
+        timeout = app.config['WHITEBOARD_RENDER_TIMEOUT']
+        semaphore = self._get_semaphore()
+        if not semaphore.acquire(timeout=timeout):
+            raise RenderError('All render workers are busy')
+        try:
+            worker = self._checkout()
+            is_complete = False
+            try:
+                yield from worker.render(whiteboard_elements, timeout=timeout)
+                is_complete = True
+            except Exception:
+                self._count('errors')
+                raise
+            finally:
+                if not is_complete:
+                    # A worker in an unknown state is not reused.
+                    worker.kill()
+            self._count('renders')
+            self._checkin(worker)
+        finally:
+            semaphore.release()
+
+    def shutdown(self):
+        with self.lock:
+            workers = self.idle_workers
+            self.idle_workers = []
+        for worker in workers:
+            worker.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counts,
+                'idleWorkers': len(self.idle_workers),
+            }
+
+    def _checkin(self, worker):
+        if worker.render_count >= app.config['WHITEBOARD_RENDER_WORKER_MAX_RENDERS']:
+            # Restart now and then, lest node-canvas leak memory.
+            self._count('restarts')
+            worker.close()
+        else:
+            with self.lock:
+                self.idle_workers.append(worker)
+
+    def _checkout(self):
+        health_check_interval = app.config['WHITEBOARD_RENDER_WORKER_HEALTH_CHECK_INTERVAL']
+        while True:
+            with self.lock:
+                worker = self.idle_workers.pop() if self.idle_workers else None
+            if not worker:
+                break
+            is_stale = time() - worker.last_used_at > health_check_interval
+            if worker.is_alive() and (not is_stale or worker.ping(timeout=5)):
+                return worker
+            self._count('restarts')
+            worker.close()
+        self._count('starts')
+        return RenderWorker(base_dir=app.config['BASE_DIR'], node_executable=app.config['NODE_EXECUTABLE'])
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _get_semaphore(self):
+        with self.lock:
+            if not self.semaphore:
+                self.semaphore = BoundedSemaphore(app.config['WHITEBOARD_RENDER_POOL_SIZE'])
+            return self.semaphore
+
+
+render_pool = RenderPool()
@@ -0,0 +1,225 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from threading import Lock
+from time import sleep
+
+from flask import current_app as app
+from squiggy import db
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.socket_io_util import SOCKET_IO_NAMESPACE
+from squiggy.lib.whiteboard_state import merge_edits, save_whiteboard_elements, whiteboard_state
+from squiggy.logger import logger
+
+
+def launch_socket_event_coalescer():
+    if app.config['SOCKET_IO_COALESCE_WINDOW']:
+        SocketEventCoalescerJob().run_async()
+
+
+class SocketEventCoalescer(object):
+
+    def __init__(self):
+        self.lock = Lock()
+        # Per whiteboard_id, latest edit keyed by uuid: {'actor', 'broadcast', 'room', 'socketId', 'version'} and either
+        # 'whiteboardElement' or 'patch' (changed properties of the element).
+        self.pending = {}
+        # Per whiteboard_id, socket_id to user_id of sockets with activity in the current window.
+        self.sessions = {}
+
+    def add(self, actor, room, socket_id, whiteboard_elements, whiteboard_id):
+        # The actor is (course_id, user_id). Only the latest version of each element, per window, is saved and broadcast.
+        edits = [(w['element']['uuid'], {'whiteboardElement': w}) for w in whiteboard_elements]
+        self._add(actor, edits, room, socket_id, whiteboard_id)
+
+    def add_patches(self, actor, room, socket_id, patches, whiteboard_id):
+        # Each patch is {'element': changed properties, 'uuid': uuid}. Patches of an element, per window, are merged.
+        edits = [(p['uuid'], {'patch': p['element']}) for p in patches]
+        self._add(actor, edits, room, socket_id, whiteboard_id)
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+            self.sessions = {}
+
+    def discard(self, uuids, whiteboard_id):
+        whiteboard_id = int(whiteboard_id)
+        with self.lock:
+            pending = self.pending.get(whiteboard_id)
+            if pending:
+                for uuid in uuids:
+                    pending.pop(uuid, None)
+
+    def flush(self, whiteboard_id):
+        whiteboard_id = int(whiteboard_id)
+        with self.lock:
+            pending = self.pending.pop(whiteboard_id, None)
+            sessions = self.sessions.pop(whiteboard_id, {})
+        if pending:
+            self._broadcast({uuid: entry for uuid, entry in pending.items() if not entry['broadcast']}, whiteboard_id)
+            try:
+                self._save(pending, whiteboard_id)
+            except Exception as e:
+                logger.error(f'Failed to save {len(pending)} coalesced element(s) of whiteboard {whiteboard_id}; will retry.')
+                logger.exception(e)
+                db.session.rollback()
+                self._requeue(pending, whiteboard_id)
+                pending = None
+        for socket_id, user_id in sessions.items():
+            whiteboard_presence.touch(
+                socket_id=socket_id,
+                user_id=user_id,
+                whiteboard_id=whiteboard_id,
+            )
+        return len(pending or {})
+
+    def flush_all(self):
+        with self.lock:
+            whiteboard_ids = list(set(self.pending.keys()) | set(self.sessions.keys()))
+        return sum(self.flush(whiteboard_id) for whiteboard_id in whiteboard_ids)
+
+    def get_pending(self, whiteboard_id):
+        # Unsaved elements, keyed by uuid, as {'version'} and either 'whiteboardElement' or 'patch'.
+        edit_keys = ['patch', 'version', 'whiteboardElement']
+        with self.lock:
+            pending = self.pending.get(int(whiteboard_id), {})
+            return {uuid: {key: e[key] for key in edit_keys if key in e} for uuid, e in pending.items()}
+
+    def _add(self, actor, edits, room, socket_id, whiteboard_id):
+        # Edits are (uuid, {'whiteboardElement'} or {'patch'}).
+        whiteboard_id = int(whiteboard_id)
+        # Versions are reserved on arrival, which orders these edits among those of other workers.
+        versions = whiteboard_state.reserve_versions(count=len(edits), whiteboard_id=whiteboard_id)
+        with self.lock:
+            pending = self.pending.setdefault(whiteboard_id, {})
+            for (uuid, edit), version in zip(edits, versions):
+                pending[uuid] = merge_edits(
+                    pending.get(uuid),
+                    {
+                        **edit,
+                        'actor': actor,
+                        'broadcast': False,
+                        'room': room,
+                        'socketId': socket_id,
+                        'uuid': uuid,
+                        'version': version,
+                    },
+                )
+            self.sessions.setdefault(whiteboard_id, {})[socket_id] = actor[1]
+
+    def _broadcast(self, pending, whiteboard_id):
+        # One broadcast per sender, which already has the latest state: upserts of whole elements, and patches with a
+        # sequence number. Returns (room, skip_sid, whiteboard_elements, patches) per sender.
+        edits_per_sender = {}
+        for entry in pending.values():
+            whiteboard_elements, patches = edits_per_sender.setdefault((entry['room'], entry['socketId']), ([], []))
+            if 'patch' in entry:
+                patches.append({'element': entry['patch'], 'uuid': entry['uuid']})
+            else:
+                whiteboard_elements.append(entry['whiteboardElement'])
+        broadcasts = [(room, socket_id, w, p) for (room, socket_id), (w, p) in edits_per_sender.items()]
+        if not app.config['TESTING']:
+            socketio = app.extensions['socketio']
+            for room, socket_id, whiteboard_elements, patches in broadcasts:
+                if whiteboard_elements:
+                    logger.info(f'socketio: Emit {len(whiteboard_elements)} coalesced upsert_whiteboard_elements to room {room}')
+                    socketio.emit(
+                        'upsert_whiteboard_elements',
+                        whiteboard_elements,
+                        namespace=SOCKET_IO_NAMESPACE,
+                        skip_sid=socket_id,
+                        to=room,
+                    )
+                if patches:
+                    sequence = whiteboard_state.next_sequence_number(whiteboard_id)
+                    logger.info(f'socketio: Emit {len(patches)} coalesced patch_whiteboard_elements to room {room} (sequence {sequence})')
+                    socketio.emit(
+                        'patch_whiteboard_elements',
+                        {
+                            'patches': patches,
+                            'sequence': sequence,
+                            'whiteboardId': whiteboard_id,
+                        },
+                        namespace=SOCKET_IO_NAMESPACE,
+                        skip_sid=socket_id,
+                        to=room,
+                    )
+        return broadcasts
+
+    def _requeue(self, pending, whiteboard_id):
+        with self.lock:
+            # Already broadcast; only the save is retried. Edits which arrived during the failed write are newer.
+            requeued = {uuid: {**entry, 'broadcast': True} for uuid, entry in pending.items()}
+            for uuid, entry in self.pending.get(whiteboard_id, {}).items():
+                requeued[uuid] = merge_edits(requeued.get(uuid), entry)
+            self.pending[whiteboard_id] = requeued
+
+    def _save(self, pending, whiteboard_id):
+        if app.config['WHITEBOARD_STATE_WRITE_BEHIND']:
+            edits_per_actor = {}
+            for entry in pending.values():
+                edits_per_actor.setdefault(entry['actor'], []).append(entry)
+            for (course_id, user_id), entries in edits_per_actor.items():
+                upserts = [entry for entry in entries if 'whiteboardElement' in entry]
+                if upserts:
+                    whiteboard_state.apply(
+                        course_id=course_id,
+                        user_id=user_id,
+                        versions=[entry['version'] for entry in upserts],
+                        whiteboard_elements=[entry['whiteboardElement'] for entry in upserts],
+                        whiteboard_id=whiteboard_id,
+                    )
+                patches = [entry for entry in entries if 'patch' in entry]
+                if patches:
+                    whiteboard_state.apply_patches(
+                        course_id=course_id,
+                        user_id=user_id,
+                        patches=[{'element': entry['patch'], 'uuid': entry['uuid']} for entry in patches],
+                        versions=[entry['version'] for entry in patches],
+                        whiteboard_id=whiteboard_id,
+                    )
+        else:
+            save_whiteboard_elements(
+                actors_by_uuid={uuid: entry['actor'] for uuid, entry in pending.items()},
+                patches_by_uuid={uuid: entry['patch'] for uuid, entry in pending.items() if 'patch' in entry},
+                versions_by_uuid={uuid: entry['version'] for uuid, entry in pending.items()},
+                whiteboard_elements=[entry['whiteboardElement'] for entry in pending.values() if 'whiteboardElement' in entry],
+                whiteboard_id=whiteboard_id,
+            )
+
+
+class SocketEventCoalescerJob(BackgroundJob):
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='socket_event_coalescer', **kwargs)
+
+    def run(self):
+        while True:
+            sleep(app.config['SOCKET_IO_COALESCE_WINDOW'] / 1000)
+            socket_event_coalescer.flush_all()
+
+
+socket_event_coalescer = SocketEventCoalescer()
@@ -25,6 +25,8 @@ ENHANCEMENTS, OR MODIFICATIONS.
 
 from flask_socketio import SocketIO
 
+SOCKET_IO_NAMESPACE = '/'
+
 
 def initialize_socket_io(app):
     debug_socketio = app.config['SOCKET_IO_DEBUG_MODE']
@@ -58,3 +60,17 @@ def get_queue_url(app):
     if app.config['REDIS_HOST']:
         queue_url = f"rediss://:{app.config['REDIS_PASSWORD']}@{app.config['REDIS_HOST']}:{app.config['REDIS_PORT']}"
     return queue_url
+
+
+def get_socket_io_coalesced_room(whiteboard_id):
+    # Clients not in the high-fidelity room get upserts of elements being edited here, coalesced.
+    return f'whiteboard-{whiteboard_id}-coalesced'
+
+
+def get_socket_io_room(whiteboard_id):
+    return f'whiteboard-{whiteboard_id}'
+
+
+def get_socket_io_high_fidelity_room(whiteboard_id):
+    # Clients in this room opt in to every intermediate state of elements being edited, instead of coalesced updates.
+    return f'whiteboard-{whiteboard_id}-high-fidelity'
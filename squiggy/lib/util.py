@@ -85,6 +85,17 @@ def local_now():
     return utc_now().astimezone(pytz.timezone(app.config['TIMEZONE']))
 
 
+def merge_patch(target, patch):
+    # Top-level properties of patch replace those of target; a None value removes the property. Target is not modified.
+    merged = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = value
+    return merged
+
+
 def safe_strip(s):
     return str(s).strip() if isinstance(s, str) else None
 
@@ -0,0 +1,108 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import math
+
+ORIGIN_OFFSETS = {
+    'bottom': 1,
+    'center': 0.5,
+    'left': 0,
+    'right': 1,
+    'top': 0,
+}
+
+
+def get_bounding_box(element):
+    # Axis-aligned (min_x, min_y, max_x, max_y) of a Fabric object, or None if the element lacks geometry.
+    try:
+        left = float(element['left'])
+        top = float(element['top'])
+        stroke_width = float(element.get('strokeWidth') or 0)
+        width = (float(element.get('width') or 0) + stroke_width) * abs(float(element.get('scaleX') or 1))
+        height = (float(element.get('height') or 0) + stroke_width) * abs(float(element.get('scaleY') or 1))
+        angle = math.radians(float(element.get('angle') or 0))
+    except (KeyError, TypeError, ValueError):
+        return None
+    # Fabric rotates the object about its origin, which sits at (left, top).
+    offset_x = ORIGIN_OFFSETS.get(element.get('originX'), 0.5) * width
+    offset_y = ORIGIN_OFFSETS.get(element.get('originY'), 0.5) * height
+    cos, sin = math.cos(angle), math.sin(angle)
+    xs = []
+    ys = []
+    for (x, y) in [(-offset_x, -offset_y), (width - offset_x, -offset_y), (-offset_x, height - offset_y), (width - offset_x, height - offset_y)]:
+        xs.append(left + x * cos - y * sin)
+        ys.append(top + x * sin + y * cos)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def intersects(bounding_box, viewport):
+    # Elements of unknown size are always in view.
+    if bounding_box is None:
+        return True
+    min_x, min_y, max_x, max_y = bounding_box
+    return max_x >= viewport['left'] and min_x <= viewport['right'] and max_y >= viewport['top'] and min_y <= viewport['bottom']
+
+
+def parse_viewport(value):
+    # Viewport is a dict or 'left,top,width,height' string. Returns dict with left, top, right and bottom.
+    if isinstance(value, str):
+        value = dict(zip(['left', 'top', 'width', 'height'], value.split(',')))
+    try:
+        left = float(value['left'])
+        top = float(value['top'])
+        width = float(value['width'])
+        height = float(value['height'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'Invalid viewport: {value}')
+    if width <= 0 or height <= 0 or not all(math.isfinite(v) for v in [left, top, width, height]):
+        raise ValueError(f'Invalid viewport: {value}')
+    return {
+        'bottom': top + height,
+        'left': left,
+        'right': left + width,
+        'top': top,
+    }
+
+
+def prioritize_whiteboard_elements(chunk_size, viewport, whiteboard_elements):
+    # Split whiteboard elements (api_json) into chunks: what is in view comes first, then the rest, nearest first.
+    # Within a chunk, elements are in z-index order.
+    center_x = (viewport['left'] + viewport['right']) / 2
+    center_y = (viewport['top'] + viewport['bottom']) / 2
+    visible = []
+    distant = []
+    for whiteboard_element in whiteboard_elements:
+        bounding_box = get_bounding_box(whiteboard_element['element'])
+        if intersects(bounding_box, viewport):
+            visible.append(whiteboard_element)
+        else:
+            min_x, min_y, max_x, max_y = bounding_box
+            dx = max(min_x - center_x, 0, center_x - max_x)
+            dy = max(min_y - center_y, 0, center_y - max_y)
+            distant.append((math.hypot(dx, dy), whiteboard_element))
+    distant.sort(key=lambda d: d[0])
+    ordered = visible + [whiteboard_element for (distance, whiteboard_element) in distant]
+    chunks = [ordered[index:index + chunk_size] for index in range(0, len(ordered), chunk_size)]
+    return [sorted(chunk, key=lambda w: w['zIndex']) for chunk in chunks]
@@ -23,19 +23,47 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from time import sleep
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import sleep, time
 
 from flask import current_app as app
 from sqlalchemy import text
-from squiggy import db
+from squiggy import db, std_commit
 from squiggy.lib.background_job import BackgroundJob
 from squiggy.lib.db_util import advisory_lock
 from squiggy.lib.login_session import LoginSession
+from squiggy.lib.presence import whiteboard_presence
 from squiggy.lib.previews import generate_whiteboard_preview
+from squiggy.lib.socket_io_util import get_socket_io_room, SOCKET_IO_NAMESPACE
 from squiggy.lib.util import utc_now
 from squiggy.logger import initialize_background_logger, logger
+from squiggy.models.asset_image_queue import AssetImageQueue
 from squiggy.models.whiteboard import Whiteboard
-from squiggy.models.whiteboard_session import WhiteboardSession
+from squiggy.models.whiteboard_element import WhiteboardElement
+from squiggy.models.whiteboard_preview_queue import WhiteboardPreviewQueue
+from squiggy.models.whiteboard_snapshot import WhiteboardSnapshot
+
+
+# Preview generation: latest durations, in seconds, and running totals. Guarded by preview_lock.
+preview_durations = deque(maxlen=100)
+preview_lock = Lock()
+preview_counts = {
+    'failed': 0,
+    'succeeded': 0,
+}
+
+
+def get_whiteboard_housekeeping_stats():
+    with preview_lock:
+        durations = sorted(preview_durations)
+        return {
+            **preview_counts,
+            'previewSecondsMax': durations[-1] if durations else None,
+            'previewSecondsMedian': durations[len(durations) // 2] if durations else None,
+            'queueDepth': WhiteboardPreviewQueue.get_depth(),
+        }
 
 
 def launch_whiteboard_housekeeping():
@@ -44,7 +72,6 @@ def launch_whiteboard_housekeeping():
 
 class WhiteboardHousekeeping(BackgroundJob):
 
-    whiteboard_id_queue = set()
     whiteboard_housekeeping = None
 
     def __init__(self, **kwargs):
@@ -63,55 +90,109 @@ class WhiteboardHousekeeping(BackgroundJob):
 
     def run(self):
         while True:
+            # Every app server drains the preview queue.
+            self._generate_whiteboard_previews()
             if not self.is_running:
                 with advisory_lock(app.config['ADVISORY_LOCK_ID_WHITEBOARD_HOUSEKEEPING']) as has_lock:
                     if has_lock:
                         self.is_running = True
                         try:
-                            self._generate_whiteboard_previews()
-                            WhiteboardSession.delete_stale_sessions()
+                            self._reconcile_asset_images()
+                            self._compact_operation_logs()
+                            whiteboard_presence.prune()
                         finally:
                             self.is_running = False
             sleep(15)
 
+    def _compact_operation_logs(self):
+        # Loads are read-only. Without compaction, the operation log to replay on each load grows without bound.
+        whiteboard_ids = WhiteboardSnapshot.get_whiteboard_ids_due(limit=app.config['WHITEBOARD_SNAPSHOT_COMPACTION_BATCH_SIZE'])
+        for whiteboard_id in whiteboard_ids:
+            self.logger.info(f'Compact operation log of whiteboard {whiteboard_id}')
+            WhiteboardSnapshot.compact(whiteboard_id)
+
     def _generate_whiteboard_previews(self):
-        # Copy and clear
-        whiteboard_id_set = self.whiteboard_id_queue.copy()
-        self.whiteboard_id_queue.clear()
-
-        for whiteboard_id in whiteboard_id_set:
-            # First, find user authorized to render whiteboard.
-            sql = text("""
-                SELECT u.id FROM users u
-                JOIN whiteboards w ON w.course_id = u.course_id
-                WHERE w.id = :whiteboard_id
-                  AND (
-                    u.canvas_course_role ILIKE '%admin%'
-                    OR u.canvas_course_role ILIKE '%instructor%'
-                    OR u.canvas_course_role ILIKE '%teacher%'
-                )
-                ORDER BY u.canvas_course_role LIMIT 1
-            """)
-            result = db.session.execute(sql, {'whiteboard_id': whiteboard_id}).fetchone()
-            user_id = result[0] if result else None
-            if user_id:
-                # Next, generate whiteboard preview image.
+        count = 0
+        app_arg = app._get_current_object()
+        workers = app.config['WHITEBOARD_HOUSEKEEPING_WORKERS']
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='whiteboard_preview') as executor:
+            while True:
+                claims = self._claim_whiteboards_due(limit=workers)
+                if not claims:
+                    break
+                user_ids = _get_preview_user_ids([c['whiteboardId'] for c in claims])
+                # Whiteboards are handed to the pool in priority order. The pool is drained before the next claim.
+                futures = [executor.submit(self._generate_whiteboard_preview, app_arg, c, user_ids.get(c['whiteboardId'])) for c in claims]
+                for future in futures:
+                    future.result()
+                count += len(claims)
+
+        update_timestamp(utc_now())
+        self.logger.info(f'Generation job cycle complete ({count} whiteboards), updated timestamp.')
+
+    def _generate_whiteboard_preview(self, app_arg, claim, user_id):
+        whiteboard_id = claim['whiteboardId']
+        with app_arg.app_context():
+            if not user_id:
+                self.logger.error(f'Whiteboard {whiteboard_id} gets no preview because instructor not found.')
+                WhiteboardPreviewQueue.complete(queued_at=claim['queuedAt'], whiteboard_id=whiteboard_id)
+                return
+            started_at = time()
+            try:
                 whiteboard = Whiteboard.find_by_id(
                     current_user=LoginSession(user_id),
                     whiteboard_id=whiteboard_id,
                 )
-                self.logger.info(f'Generating preview image for whiteboard {whiteboard_id}')
-                image_url = generate_whiteboard_preview(whiteboard=whiteboard)
-                if image_url:
-                    Whiteboard.update_preview(
-                        whiteboard_id=whiteboard['id'],
-                        image_url=image_url,
-                    )
-            else:
-                self.logger.error(f'Whiteboard {whiteboard_id} gets no preview because instructor not found.')
+                if whiteboard:
+                    self.logger.info(f'Generating preview image for whiteboard {whiteboard_id} (attempt {claim["attempts"]})')
+                    image_url = generate_whiteboard_preview(whiteboard=whiteboard)
+                    if image_url and image_url != whiteboard['imageUrl']:
+                        Whiteboard.update_preview(
+                            whiteboard_id=whiteboard['id'],
+                            image_url=image_url,
+                        )
+                WhiteboardPreviewQueue.complete(queued_at=claim['queuedAt'], whiteboard_id=whiteboard_id)
+                _record_preview(seconds=time() - started_at, success=True)
+            except Exception as e:
+                self.logger.error(f'Failed to generate preview image for whiteboard {whiteboard_id}')
+                self.logger.exception(e)
+                db.session.rollback()
+                WhiteboardPreviewQueue.fail(
+                    max_attempts=app.config['WHITEBOARD_PREVIEW_QUEUE_MAX_ATTEMPTS'],
+                    retry_seconds=app.config['WHITEBOARD_PREVIEW_QUEUE_RETRY_SECONDS'],
+                    whiteboard_id=whiteboard_id,
+                )
+                _record_preview(seconds=time() - started_at, success=False)
 
-        update_timestamp(utc_now())
-        self.logger.info('Generation job cycle complete, updated timestamp.')
+    @classmethod
+    def _claim_whiteboards_due(cls, limit):
+        # Longest waiting whiteboards are claimed. Of those, the ones nobody has open go first.
+        claims = WhiteboardPreviewQueue.claim(
+            limit=limit,
+            max_attempts=app.config['WHITEBOARD_PREVIEW_QUEUE_MAX_ATTEMPTS'],
+            quiet_seconds=app.config['WHITEBOARD_PREVIEW_QUIET_SECONDS'],
+            visibility_timeout=app.config['WHITEBOARD_PREVIEW_QUEUE_VISIBILITY_TIMEOUT'],
+        )
+        user_ids_online = whiteboard_presence.get_user_ids_online([c['whiteboardId'] for c in claims]) if claims else {}
+        return sorted(claims, key=lambda c: bool(user_ids_online.get(c['whiteboardId'])))
+
+    def _reconcile_asset_images(self):
+        # Safety net for the preview callback, which updates whiteboard elements of an asset with a new image. Assets are
+        # taken off the queue in the transaction that updates their elements. One batch per cycle.
+        asset_ids = AssetImageQueue.claim(limit=app.config['WHITEBOARD_ASSET_IMAGE_RECONCILE_BATCH_SIZE'])
+        whiteboard_elements_by_whiteboard_id = WhiteboardElement.reconcile_asset_images(asset_ids=asset_ids)
+        if not whiteboard_elements_by_whiteboard_id:
+            return
+        user_ids_online = whiteboard_presence.get_user_ids_online(list(whiteboard_elements_by_whiteboard_id.keys()))
+        for whiteboard_id, whiteboard_elements in whiteboard_elements_by_whiteboard_id.items():
+            self.logger.info(f'Reconciled {len(whiteboard_elements)} asset images of whiteboard {whiteboard_id}')
+            if not app.config['TESTING'] and user_ids_online.get(whiteboard_id):
+                app.extensions['socketio'].emit(
+                    'upsert_whiteboard_elements',
+                    whiteboard_elements,
+                    namespace=SOCKET_IO_NAMESPACE,
+                    to=get_socket_io_room(whiteboard_id),
+                )
 
     @classmethod
     def start(cls):
@@ -120,7 +201,32 @@ class WhiteboardHousekeeping(BackgroundJob):
 
     @classmethod
     def queue_for_preview_image(cls, whiteboard_id):
-        cls.whiteboard_id_queue.add(whiteboard_id)
+        # Every change restarts the quiet period of the whiteboard.
+        WhiteboardPreviewQueue.enqueue(whiteboard_id)
+        std_commit()
+
+
+def _get_preview_user_ids(whiteboard_ids):
+    # Per whiteboard, a user authorized to render it.
+    sql = text("""
+        SELECT DISTINCT ON (w.id) w.id AS whiteboard_id, u.id AS user_id FROM users u
+        JOIN whiteboards w ON w.course_id = u.course_id
+        WHERE w.id = ANY(:whiteboard_ids)
+          AND (
+            u.canvas_course_role ILIKE '%admin%'
+            OR u.canvas_course_role ILIKE '%instructor%'
+            OR u.canvas_course_role ILIKE '%teacher%'
+        )
+        ORDER BY w.id, u.canvas_course_role
+    """)
+    rows = db.session.execute(sql, {'whiteboard_ids': whiteboard_ids})
+    return {row['whiteboard_id']: row['user_id'] for row in rows}
+
+
+def _record_preview(seconds, success):
+    with preview_lock:
+        preview_durations.append(seconds)
+        preview_counts['succeeded' if success else 'failed'] += 1
 
 
 def update_timestamp(time):
@@ -131,3 +237,4 @@ def update_timestamp(time):
         UPDATE SET last_run = :time
     """)
     db.session.execute(update_timestamp_sql, {'time': time})
+    std_commit()
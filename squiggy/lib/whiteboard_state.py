@@ -0,0 +1,393 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import atexit
+from copy import deepcopy
+from threading import Lock, RLock
+from time import sleep, time
+from uuid import uuid4
+
+from flask import current_app as app
+import redis
+from squiggy import db, std_commit
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.redis_util import get_redis_client, publish, subscribe
+from squiggy.lib.util import merge_patch
+from squiggy.logger import logger
+from squiggy.models.activity import Activity
+from squiggy.models.asset import Asset
+from squiggy.models.whiteboard_element import WhiteboardElement
+from squiggy.models.whiteboard_preview_queue import WhiteboardPreviewQueue
+
+# Workers share live whiteboard edits, not yet saved to the db, over this channel.
+REDIS_CHANNEL = 'squiggy_whiteboard_state'
+# Edits announced by a peer worker are forgotten if the peer never reports them saved (e.g., it crashed).
+PEER_STATE_EXPIRATION_SECONDS = 300
+# Every write of a whiteboard element carries a version, from a per-whiteboard Redis counter shared by all workers. The
+# db rejects a write older than the stored version.
+VERSION_KEY_PREFIX = 'squiggy_whiteboard_element_version'
+# Reserve ARGV[1] versions. The counter never falls behind the clock (ARGV[2], microseconds) so that versions keep
+# increasing if Redis loses the counter or a worker falls back to its own clock.
+RESERVE_VERSIONS_SCRIPT = """
+    local count = tonumber(ARGV[1])
+    local last = redis.call('INCRBY', KEYS[1], count)
+    local floor = tonumber(ARGV[2]) + count
+    if last < floor then
+        redis.call('SET', KEYS[1], floor)
+        last = floor
+    end
+    return last
+"""
+# Broadcasts of patches carry a sequence number, from a per-whiteboard Redis counter shared by all workers.
+SEQUENCE_KEY_PREFIX = 'squiggy_whiteboard_sequence'
+WORKER_ID = uuid4().hex
+
+
+def launch_whiteboard_state():
+    app_arg = app._get_current_object()
+    WhiteboardStateFlusher().run_async()
+    subscribe(REDIS_CHANNEL, whiteboard_state.handle_peer_message)
+    # Save pending edits when the worker shuts down.
+    atexit.register(_flush_on_exit, app_arg)
+
+
+def merge_edits(previous, edit):
+    # An edit carries either a whiteboard element or a patch (changed properties of the element, None to remove), and a
+    # version. The newer edit wins, except that a newer patch is merged into the older edit. Order of arrival does not
+    # matter. Inputs are not modified.
+    if not previous:
+        return edit
+    older, newer = sorted([previous, edit], key=lambda e: e['version'])
+    if 'patch' not in newer:
+        return newer
+    if 'patch' in older:
+        return {**newer, 'patch': {**older['patch'], **newer['patch']}}
+    whiteboard_element = older['whiteboardElement']
+    merged = {key: value for key, value in newer.items() if key != 'patch'}
+    merged['whiteboardElement'] = {**whiteboard_element, 'element': merge_patch(whiteboard_element['element'], newer['patch'])}
+    return merged
+
+
+def save_whiteboard_elements(actors_by_uuid, whiteboard_elements, whiteboard_id, patches_by_uuid=None, versions_by_uuid=None):
+    # Actor (course_id, user_id) per uuid is credited if the element is new and carries an asset. Patches, keyed by uuid,
+    # are merged into saved elements. Without versions, the save is the latest edit of its elements. Elements, activities
+    # and the preview request commit together.
+    whiteboard_id = int(whiteboard_id)
+    patches_by_uuid = patches_by_uuid or {}
+    if versions_by_uuid is None:
+        uuids = list(dict.fromkeys([w['element']['uuid'] for w in whiteboard_elements] + list(patches_by_uuid.keys())))
+        versions_by_uuid = dict(zip(uuids, whiteboard_state.reserve_versions(count=len(uuids), whiteboard_id=whiteboard_id)))
+    results, inserted_uuids = WhiteboardElement.upsert_all(
+        versions_by_uuid=versions_by_uuid,
+        whiteboard_elements=whiteboard_elements,
+        whiteboard_id=whiteboard_id,
+    )
+    for result in results:
+        uuid = result['uuid']
+        if result['assetId'] and uuid in inserted_uuids:
+            course_id, user_id = actors_by_uuid[uuid]
+            _create_whiteboard_add_asset_activities(
+                asset_id=result['assetId'],
+                course_id=course_id,
+                user_id=user_id,
+                whiteboard_id=whiteboard_id,
+            )
+    results += WhiteboardElement.patch_all(
+        patches_by_uuid=patches_by_uuid,
+        versions_by_uuid=versions_by_uuid,
+        whiteboard_id=whiteboard_id,
+    )
+    # The preview image is due once the whiteboard goes quiet.
+    WhiteboardPreviewQueue.enqueue(whiteboard_id)
+    std_commit()
+    # Unsaved copies of these elements, here or on peer workers, are now stale.
+    whiteboard_state.forget_saved(versions_by_uuid=versions_by_uuid, whiteboard_id=whiteboard_id)
+    return results
+
+
+class WhiteboardStateStore(object):
+
+    def __init__(self):
+        self.lock = Lock()
+        # Held for the duration of a db write, so that discarded elements are not written after the fact.
+        self.flush_lock = RLock()
+        # Per whiteboard_id, unsaved elements keyed by uuid, in order of arrival.
+        self.dirty = {}
+        # Per whiteboard_id, unsaved elements held by peer workers.
+        self.peer_dirty = {}
+        self.socket_ids_per_whiteboard_id = {}
+        self.whiteboard_id_per_socket_id = {}
+        # Fallback when Redis is not configured: versions and sequence numbers are per worker.
+        self.last_version = 0
+        self.sequence_per_whiteboard_id = {}
+
+    def apply(self, course_id, user_id, whiteboard_elements, whiteboard_id, versions=None):
+        # Versions, one per element, are reserved here unless the caller reserved them on arrival of the edits.
+        whiteboard_id = int(whiteboard_id)
+        versions = versions or self.reserve_versions(count=len(whiteboard_elements), whiteboard_id=whiteboard_id)
+        edits = [{'version': v, 'whiteboardElement': w} for w, v in zip(whiteboard_elements, versions)]
+        self._apply((course_id, user_id), edits, whiteboard_id)
+
+    def apply_patches(self, course_id, user_id, patches, whiteboard_id, versions=None):
+        # Each patch is {'element': changed properties, 'uuid': uuid}. Versions as in apply().
+        whiteboard_id = int(whiteboard_id)
+        versions = versions or self.reserve_versions(count=len(patches), whiteboard_id=whiteboard_id)
+        edits = [{'patch': p['element'], 'uuid': p['uuid'], 'version': v} for p, v in zip(patches, versions)]
+        self._apply((course_id, user_id), edits, whiteboard_id)
+
+    def clear(self):
+        with self.lock:
+            self.dirty = {}
+            self.peer_dirty = {}
+
+    def discard(self, uuids, whiteboard_id):
+        whiteboard_id = int(whiteboard_id)
+        with self.flush_lock:
+            self._discard(uuids, whiteboard_id)
+        self._publish('discard', whiteboard_id, {'uuids': uuids})
+
+    def flush(self, whiteboard_id):
+        whiteboard_id = int(whiteboard_id)
+        with self.flush_lock:
+            with self.lock:
+                entries = self.dirty.pop(whiteboard_id, None) or {}
+                # A patch of an element which a peer worker has yet to save waits for that save.
+                peer_dirty = self.peer_dirty.get(whiteboard_id, {})
+                held = {uuid: e for uuid, e in entries.items() if 'patch' in e and 'whiteboardElement' in peer_dirty.get(uuid, {})}
+                if held:
+                    self.dirty[whiteboard_id] = held
+                    entries = {uuid: entry for uuid, entry in entries.items() if uuid not in held}
+            if not entries:
+                return 0
+            try:
+                save_whiteboard_elements(
+                    actors_by_uuid={uuid: entry['actor'] for uuid, entry in entries.items()},
+                    patches_by_uuid={uuid: entry['patch'] for uuid, entry in entries.items() if 'patch' in entry},
+                    versions_by_uuid={uuid: entry['version'] for uuid, entry in entries.items()},
+                    whiteboard_elements=[entry['whiteboardElement'] for entry in entries.values() if 'whiteboardElement' in entry],
+                    whiteboard_id=whiteboard_id,
+                )
+            except Exception as e:
+                logger.error(f'Failed to save {len(entries)} element(s) of whiteboard {whiteboard_id}; will retry.')
+                logger.exception(e)
+                db.session.rollback()
+                self._requeue(entries, whiteboard_id)
+                return 0
+        return len(entries)
+
+    def flush_all(self):
+        with self.lock:
+            whiteboard_ids = list(self.dirty.keys())
+        return sum(self.flush(whiteboard_id) for whiteboard_id in whiteboard_ids)
+
+    def forget_saved(self, versions_by_uuid, whiteboard_id):
+        # Drop unsaved copies of elements as old as, or older than, what is in the db. Peer workers do the same.
+        self._forget_saved(versions_by_uuid, int(whiteboard_id))
+        self._publish('saved', int(whiteboard_id), {'versions': versions_by_uuid})
+
+    def get_pending(self, whiteboard_id, buffered=None):
+        # Unsaved elements keyed by uuid, latest version of each. If only changed properties of an element are pending
+        # then its entry is {'patch': ...}, to be merged into the saved element. Edits buffered upstream (e.g., by the
+        # socket event coalescer) are passed in as {uuid: {'version', 'whiteboardElement' or 'patch'}}.
+        whiteboard_id = int(whiteboard_id)
+        with self.lock:
+            pending = {}
+            for entries in [self.peer_dirty.get(whiteboard_id, {}), self.dirty.get(whiteboard_id, {}), buffered or {}]:
+                for uuid, entry in entries.items():
+                    pending[uuid] = merge_edits(pending.get(uuid), entry)
+            return deepcopy({
+                uuid: entry['whiteboardElement'] if 'whiteboardElement' in entry else {'patch': entry['patch']}
+                for uuid, entry in pending.items()
+            })
+
+    def next_sequence_number(self, whiteboard_id):
+        whiteboard_id = int(whiteboard_id)
+        client = get_redis_client()
+        if client:
+            try:
+                return client.incr(f'{SEQUENCE_KEY_PREFIX}_{whiteboard_id}')
+            except redis.RedisError as e:
+                logger.error(f'Failed to increment sequence number of whiteboard {whiteboard_id} in Redis')
+                logger.exception(e)
+        with self.lock:
+            sequence_number = self.sequence_per_whiteboard_id.get(whiteboard_id, 0) + 1
+            self.sequence_per_whiteboard_id[whiteboard_id] = sequence_number
+            return sequence_number
+
+    def reserve_versions(self, count, whiteboard_id):
+        # Returns 'count' versions, in increasing order, newer than any reserved before.
+        if not count:
+            return []
+        floor = int(time() * 1000000)
+        client = get_redis_client()
+        if client:
+            try:
+                last = int(client.eval(RESERVE_VERSIONS_SCRIPT, 1, f'{VERSION_KEY_PREFIX}_{int(whiteboard_id)}', count, floor))
+                return list(range(last - count + 1, last + 1))
+            except redis.RedisError as e:
+                logger.error(f'Failed to reserve versions of whiteboard {whiteboard_id} in Redis')
+                logger.exception(e)
+        with self.lock:
+            self.last_version = max(self.last_version, floor) + count
+            return list(range(self.last_version - count + 1, self.last_version + 1))
+
+    def handle_peer_message(self, message):
+        origin = message['origin']
+        if origin == WORKER_ID:
+            return
+        whiteboard_id = message['whiteboardId']
+        message_type = message['type']
+        if message_type == 'apply':
+            with self.lock:
+                peer_dirty = self.peer_dirty.setdefault(whiteboard_id, {})
+                for edit in message['edits']:
+                    uuid = _get_uuid(edit)
+                    peer_dirty[uuid] = {**merge_edits(peer_dirty.get(uuid), edit), 'receivedAt': time()}
+        elif message_type == 'discard':
+            with self.flush_lock:
+                self._discard(message['uuids'], whiteboard_id)
+        elif message_type == 'saved':
+            self._forget_saved(message['versions'], whiteboard_id)
+
+    def join(self, socket_id, whiteboard_id):
+        whiteboard_id = int(whiteboard_id)
+        with self.lock:
+            self.socket_ids_per_whiteboard_id.setdefault(whiteboard_id, set()).add(socket_id)
+            self.whiteboard_id_per_socket_id[socket_id] = whiteboard_id
+
+    def leave(self, socket_id):
+        # Pending edits are saved when the last socket of this worker leaves the whiteboard.
+        with self.lock:
+            whiteboard_id = self.whiteboard_id_per_socket_id.pop(socket_id, None)
+            if whiteboard_id is None:
+                return
+            socket_ids = self.socket_ids_per_whiteboard_id.get(whiteboard_id, set())
+            socket_ids.discard(socket_id)
+            if socket_ids:
+                return
+            self.socket_ids_per_whiteboard_id.pop(whiteboard_id, None)
+        self.flush(whiteboard_id)
+
+    def prune_peer_state(self):
+        expired_before = time() - PEER_STATE_EXPIRATION_SECONDS
+        with self.lock:
+            for whiteboard_id in list(self.peer_dirty.keys()):
+                peer_dirty = self.peer_dirty[whiteboard_id]
+                for uuid in [uuid for uuid, entry in peer_dirty.items() if entry['receivedAt'] < expired_before]:
+                    del peer_dirty[uuid]
+                if not peer_dirty:
+                    del self.peer_dirty[whiteboard_id]
+
+    def _apply(self, actor, edits, whiteboard_id):
+        with self.lock:
+            dirty = self.dirty.setdefault(whiteboard_id, {})
+            for edit in edits:
+                uuid = _get_uuid(edit)
+                previous = dirty.get(uuid)
+                dirty[uuid] = {
+                    **merge_edits(previous, deepcopy(edit)),
+                    # If the element is new then its creator gets the credit, not the last editor.
+                    'actor': previous['actor'] if previous else actor,
+                }
+        if edits:
+            self._publish('apply', whiteboard_id, {'edits': edits})
+
+    def _discard(self, uuids, whiteboard_id):
+        with self.lock:
+            for pending in [self.dirty.get(whiteboard_id), self.peer_dirty.get(whiteboard_id)]:
+                if pending:
+                    for uuid in uuids:
+                        pending.pop(uuid, None)
+
+    def _forget_saved(self, versions_by_uuid, whiteboard_id):
+        with self.lock:
+            for pending_per_whiteboard_id in [self.dirty, self.peer_dirty]:
+                pending = pending_per_whiteboard_id.get(whiteboard_id)
+                if pending:
+                    for uuid, version in versions_by_uuid.items():
+                        entry = pending.get(uuid)
+                        if entry and entry['version'] <= version:
+                            del pending[uuid]
+                    if not pending:
+                        del pending_per_whiteboard_id[whiteboard_id]
+
+    def _publish(self, message_type, whiteboard_id, payload):
+        publish(REDIS_CHANNEL, {
+            **payload,
+            'origin': WORKER_ID,
+            'type': message_type,
+            'whiteboardId': whiteboard_id,
+        })
+
+    def _requeue(self, entries, whiteboard_id):
+        with self.lock:
+            # Edits which arrived during the failed write are newer. They win, or are merged if they are patches.
+            requeued = dict(entries)
+            for uuid, entry in self.dirty.get(whiteboard_id, {}).items():
+                previous = requeued.get(uuid)
+                requeued[uuid] = {**merge_edits(previous, entry), 'actor': previous['actor'] if previous else entry['actor']}
+            self.dirty[whiteboard_id] = requeued
+
+
+class WhiteboardStateFlusher(BackgroundJob):
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='whiteboard_state_flusher', **kwargs)
+
+    def run(self):
+        while True:
+            sleep(app.config['WHITEBOARD_STATE_FLUSH_INTERVAL'] / 1000)
+            whiteboard_state.flush_all()
+            whiteboard_state.prune_peer_state()
+
+
+whiteboard_state = WhiteboardStateStore()
+
+
+def _create_whiteboard_add_asset_activities(asset_id, course_id, user_id, whiteboard_id):
+    # No commit: activities are saved with the elements that earned them.
+    asset = Asset.find_by_id(asset_id)
+    if asset and user_id not in [user.id for user in asset.users]:
+        Activity.insert_batch(
+            activity_type='whiteboard_add_asset',
+            course_id=course_id,
+            user_id=user_id,
+            object_type='whiteboard',
+            object_id=whiteboard_id,
+            asset_id=asset.id,
+            reciprocal_activity_type='get_whiteboard_add_asset',
+            reciprocal_user_ids=[u.id for u in asset.users],
+        )
+
+
+def _get_uuid(edit):
+    return edit['uuid'] if 'patch' in edit else edit['whiteboardElement']['element']['uuid']
+
+
+def _flush_on_exit(app_arg):
+    with app_arg.app_context():
+        count = whiteboard_state.flush_all()
+        if count:
+            logger.info(f'Saved {count} pending whiteboard element(s) on shutdown')
@@ -23,48 +23,37 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-import json
-import subprocess
-import tempfile
+from itertools import chain
 import traceback
 
 from flask import current_app as app
-from squiggy import mock
+from squiggy import mock_open_file
+from squiggy.lib.render_cache import get_whiteboard_png_chunks
+from squiggy.lib.render_pool import RenderError
 from squiggy.logger import logger
 
 
-@mock('fixtures/mock_whiteboard.png')
-def to_png_file(whiteboard):
-    base_dir = app.config['BASE_DIR']
-    temp_file = tempfile.NamedTemporaryFile(suffix='.json')
-    with open(temp_file.name, mode='wt', encoding='utf-8') as f:
-        json.dump(whiteboard['whiteboardElements'], f)
-    with open(f.name, mode='rb') as f:
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as png_file:
-                executable = [
-                    app.config['NODE_EXECUTABLE'],
-                    f'{base_dir}/scripts/node_js/save_whiteboard_as_png.js',
-                    '-b',
-                    base_dir,
-                    '-w',
-                    f.name,
-                    '-p',
-                    png_file.name,
-                ]
-                exit_code = subprocess.run(
-                    executable,
-                    env={'NODE_PATH': f'{base_dir}/node_modules'},
-                )
-                logger.info(f'Exit code of whiteboard.to_png_file script: {exit_code}')
-                return png_file
-        except OSError as e:
-            app.logger.error(f"""
-                OSError: {e.strerror}
-                OSError number: {e.errno}
-                OSError filename: {e.filename}
-            """)
-            return None
-        except:  # noqa: E722
-            logger.error(traceback.format_exc())
-            return None
+def to_png_stream(whiteboard):
+    # Iterator of PNG chunks, or None if the whiteboard could not be rendered. Rendering gets as far as the first chunk
+    # here, so that a failure is known before the caller commits to a response.
+    try:
+        chunks = iter(_get_png_chunks(whiteboard))
+        return chain([next(chunks, b'')], chunks)
+    except OSError as e:
+        app.logger.error(f"""
+            OSError: {e.strerror}
+            OSError number: {e.errno}
+            OSError filename: {e.filename}
+        """)
+        return None
+    except RenderError as e:
+        logger.error(f"Failed to render whiteboard {whiteboard['id']}: {e}")
+        return None
+    except:  # noqa: E722
+        logger.error(traceback.format_exc())
+        return None
+
+
+@mock_open_file(path_to_file='mock_whiteboard.png', mode='rb')
+def _get_png_chunks(whiteboard):
+    return get_whiteboard_png_chunks(whiteboard)
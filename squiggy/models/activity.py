@@ -31,7 +31,7 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import text
 from squiggy import db, std_commit
 from squiggy.lib.util import isoformat, utc_now
-from squiggy.models.activity_type import activities_type, ActivityType
+from squiggy.models.activity_type import activities_type, ActivityType, DEFAULT_ACTIVITY_TYPE_CONFIGURATION
 from squiggy.models.base import Base
 from squiggy.models.course import Course
 from squiggy.models.user import User
@@ -130,24 +130,107 @@ class Activity(Base):
             reciprocal_id=reciprocal_id,
             activity_metadata=activity_metadata,
         )
+        points = ActivityType.get_points_by_type(course_id=course_id).get(activity_type, 0)
         db.session.add(activity)
-        user = User.find_by_id(user_id)
-        if user:
-            user.last_activity = utc_now()
-            db.session.add(user)
-        cls.recalculate_points(course_id=course_id, user_ids=[user_id])
+        # Points of the new activity are added to the user's total, in the same transaction.
+        User.query.filter_by(id=user_id).update(
+            {User.last_activity: utc_now(), User.points: User.points + points},
+            synchronize_session='evaluate',
+        )
         std_commit()
         return activity
 
+    @classmethod
+    def create_batch(cls, **kwargs):
+        # See insert_batch. Returns the id of the first activity.
+        activity_id = cls.insert_batch(**kwargs)
+        std_commit()
+        return activity_id
+
+    @classmethod
+    def insert_batch(
+        cls,
+        activity_type,
+        course_id,
+        user_id,
+        object_type,
+        object_id=None,
+        asset_id=None,
+        reciprocal_activity_type=None,
+        reciprocal_user_ids=None,
+    ):
+        # An activity of 'user_id' and, per user of 'reciprocal_user_ids', a 'reciprocal_activity_type' activity with
+        # 'user_id' as actor. All activities are inserted by one statement, which also updates the last_activity and
+        # points of all users concerned. No commit. Returns the id of the first activity.
+        points_by_type = ActivityType.get_points_by_type(course_id=course_id)
+        reciprocal_user_ids = sorted(set(reciprocal_user_ids or []))
+        params = {
+            'activity_type': activity_type,
+            'asset_id': asset_id,
+            'course_id': course_id,
+            'object_id': object_id,
+            'object_type': object_type,
+            'points': points_by_type.get(activity_type, 0),
+            'reciprocal_activity_type': reciprocal_activity_type,
+            'reciprocal_points': points_by_type.get(reciprocal_activity_type, 0),
+            'reciprocal_user_ids': reciprocal_user_ids,
+            'user_id': user_id,
+        }
+        sql = """
+            WITH first_activity AS (
+                INSERT INTO activities (type, course_id, user_id, object_type, object_id, asset_id, created_at, updated_at)
+                VALUES (
+                    CAST(:activity_type AS enum_activities_type), :course_id, :user_id,
+                    CAST(:object_type AS enum_activities_object_type), CAST(:object_id AS integer), CAST(:asset_id AS integer),
+                    now(), now()
+                )
+                RETURNING id
+            ),
+            reciprocal_activities AS (
+                INSERT INTO activities (
+                    type, course_id, user_id, object_type, object_id, asset_id, actor_id, reciprocal_id, created_at, updated_at
+                )
+                SELECT
+                    CAST(:reciprocal_activity_type AS enum_activities_type), :course_id, r.user_id,
+                    CAST(:object_type AS enum_activities_object_type), CAST(:object_id AS integer), CAST(:asset_id AS integer),
+                    :user_id, f.id, now(), now()
+                FROM first_activity f, unnest(CAST(:reciprocal_user_ids AS integer[])) AS r(user_id)
+            ),
+            updated_users AS (
+                UPDATE users SET
+                    last_activity = now(),
+                    points = points
+                        + CASE WHEN id = :user_id THEN :points ELSE 0 END
+                        + CASE WHEN id = ANY(CAST(:reciprocal_user_ids AS integer[])) THEN :reciprocal_points ELSE 0 END
+                WHERE id = :user_id OR id = ANY(CAST(:reciprocal_user_ids AS integer[]))
+            )
+            SELECT id FROM first_activity"""
+        activity_id = db.session.execute(text(sql), params).scalar()
+        _expire_users(user_ids=[user_id] + reciprocal_user_ids)
+        return activity_id
+
     @classmethod
     def create_unless_exists(cls, **kwargs):
         if cls.query.filter_by(**kwargs).count() == 0:
             return cls.create(**kwargs)
 
     @classmethod
-    def delete_by_object_id(cls, object_type, object_id, course_id, user_ids):
-        cls.query.filter(and_(cls.object_type == object_type, cls.object_id == object_id)).delete()
-        cls.recalculate_points(course_id=course_id, user_ids=user_ids)
+    def delete(cls, course_id, **kwargs):
+        # Points of deleted activities are deducted from users' totals, in the same transaction.
+        points_by_type = ActivityType.get_points_by_type(course_id=course_id)
+        query = cls.query.filter_by(course_id=course_id, **kwargs)
+        points_by_user_id = {}
+        for user_id, activity_type in query.with_entities(cls.user_id, cls.activity_type).all():
+            points_by_user_id[user_id] = points_by_user_id.get(user_id, 0) - points_by_type.get(activity_type, 0)
+        query.delete(synchronize_session=False)
+        for user_id, points in points_by_user_id.items():
+            if points:
+                User.query.filter_by(id=user_id).update({User.points: User.points + points}, synchronize_session='evaluate')
+        std_commit()
+
+    @classmethod
+    def delete_by_object_id(cls, object_type, object_id, course_id):
+        cls.delete(course_id=course_id, object_type=object_type, object_id=object_id)
 
     @classmethod
     def find_by_object_id(cls, object_type, object_id):
@@ -275,37 +358,53 @@ class Activity(Base):
 
     @classmethod
     def recalculate_points(cls, course_id=None, user_ids=None):
+        # Full recalculation, in one statement, for when points per activity type change. See also points_recalculation.
         if not course_id and not user_ids:
             return
-        user_query = User.query
-        if course_id:
-            user_query = user_query.filter_by(course_id=course_id)
-        if user_ids:
-            user_query = user_query.filter(User.id.in_(user_ids))
-        users = user_query.all()
-        if not users:
-            return
         if not course_id:
-            course_id = users[0].course_id
-
-        configuration = ActivityType.get_activity_type_configuration(course_id=course_id)
-        configuration_by_type = {c['type']: c for c in configuration}
-        total_scores = {}
-
-        activity_query = cls.query.filter_by(course_id=course_id)
-        if user_ids:
-            activity_query = activity_query.filter(cls.user_id.in_(user_ids))
-        for activity in activity_query.all():
-            if configuration_by_type.get(activity.activity_type, {}).get('enabled', None):
-                score = configuration_by_type[activity.activity_type]['points']
-                total_scores[activity.user_id] = total_scores.get(activity.user_id, 0) + score
-        for user in users:
-            if user.id in total_scores:
-                user.points = total_scores[user.id]
-            else:
-                user.points = 0
-            db.session.add(user)
+            user = User.find_by_id(user_ids[0])
+            if not user:
+                return
+            course_id = user.course_id
+        # Points per type are the course's configuration, if any, else the default.
+        params = {
+            'course_id': course_id,
+            'default_enabled': [c['enabled'] for c in DEFAULT_ACTIVITY_TYPE_CONFIGURATION],
+            'default_points': [c['points'] for c in DEFAULT_ACTIVITY_TYPE_CONFIGURATION],
+            'default_types': [c['type'] for c in DEFAULT_ACTIVITY_TYPE_CONFIGURATION],
+            'user_ids': user_ids,
+        }
+        user_clause = 'AND u.id = ANY(:user_ids)' if user_ids else ''
+        # Users are locked, in id order, before their activities are summed. Concurrent increments of points wait for this
+        # transaction, and the sum (a later statement, so a fresh snapshot) includes every activity committed before it.
+        lock_sql = f'SELECT u.id FROM users u WHERE u.course_id = :course_id {user_clause} ORDER BY u.id FOR UPDATE'
+        db.session.execute(text(lock_sql), params)
+        sql = f"""
+            WITH points_per_type AS (
+                SELECT d.type, CASE
+                    WHEN t.id IS NULL THEN CASE WHEN d.enabled THEN d.points ELSE 0 END
+                    WHEN t.enabled THEN COALESCE(t.points, 0)
+                    ELSE 0
+                END AS points
+                FROM unnest(
+                    CAST(:default_types AS text[]), CAST(:default_points AS integer[]), CAST(:default_enabled AS boolean[])
+                ) AS d(type, points, enabled)
+                LEFT JOIN activity_types t ON t.course_id = :course_id AND CAST(t.type AS text) = d.type
+            )
+            UPDATE users SET points = totals.points
+            FROM (
+                SELECT u.id AS user_id, COALESCE(SUM(p.points), 0)::int AS points
+                FROM users u
+                LEFT JOIN activities a ON a.user_id = u.id AND a.course_id = :course_id
+                LEFT JOIN points_per_type p ON p.type = CAST(a.type AS text)
+                WHERE u.course_id = :course_id {user_clause}
+                GROUP BY u.id
+            ) totals
+            WHERE users.id = totals.user_id AND users.points != totals.points"""
+        db.session.execute(text(sql), params)
         std_commit()
+        # Users already loaded in this session have stale points.
+        db.session.expire_all()
 
     def to_api_json(self):
         return {
@@ -324,6 +423,12 @@ class Activity(Base):
         }
 
 
+def _expire_users(user_ids):
+    # Users loaded in this session are stale after raw SQL updates.
+    for user in [o for o in db.session.identity_map.values() if isinstance(o, User) and o.id in user_ids]:
+        db.session.expire(user, ['last_activity', 'points'])
+
+
 def _to_api_json_by_type(activities):
     activities_by_type = {
         'actions': {
@@ -23,8 +23,10 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from flask import current_app as app
 from sqlalchemy.dialects.postgresql import ENUM
 from squiggy import db, std_commit
+from squiggy.lib.cache import TTLCache
 from squiggy.lib.util import isoformat
 from squiggy.models.base import Base
 
@@ -51,6 +53,9 @@ activities_type = ENUM(
     create_type=False,
 )
 
+# Per course_id, activity type configuration merged with defaults. Invalidation reaches peer workers via Redis.
+activity_type_configuration_cache = TTLCache(name='activity_type_configuration')
+
 
 class ActivityType(Base):
     __tablename__ = 'activity_types'
@@ -95,23 +100,36 @@ class ActivityType(Base):
 
     @classmethod
     def get_activity_type_configuration(cls, course_id):
-        activity_configs = []
-        per_course_configs = cls.query.filter_by(course_id=course_id).all()
-        for default_config in DEFAULT_ACTIVITY_TYPE_CONFIGURATION:
-            activity_config = default_config.copy()
-            per_course_config = next((c for c in per_course_configs if c.activity_type == activity_config['type']), None)
-            if per_course_config:
-                activity_config['enabled'] = per_course_config.enabled
-                activity_config['points'] = per_course_config.points
-            activity_configs.append(activity_config)
-        std_commit()
-        return activity_configs
+        def _load():
+            per_course_configs = {c.activity_type: c for c in cls.query.filter_by(course_id=course_id).all()}
+            activity_configs = []
+            for default_config in DEFAULT_ACTIVITY_TYPE_CONFIGURATION:
+                activity_config = default_config.copy()
+                per_course_config = per_course_configs.get(activity_config['type'])
+                if per_course_config:
+                    activity_config['enabled'] = per_course_config.enabled
+                    activity_config['points'] = per_course_config.points
+                activity_configs.append(activity_config)
+            return activity_configs
+        activity_configs = activity_type_configuration_cache.get_or_load(
+            course_id,
+            _load,
+            ttl_seconds=app.config['ACTIVITY_TYPE_CACHE_TTL'],
+        )
+        # Callers get their own copy of the cached configuration.
+        return [c.copy() for c in activity_configs]
+
+    @classmethod
+    def get_points_by_type(cls, course_id):
+        # Disabled activity types score zero.
+        configuration = cls.get_activity_type_configuration(course_id=course_id)
+        return {c['type']: (c['points'] or 0) if c['enabled'] else 0 for c in configuration}
 
     @classmethod
     def update_activity_type_configuration(cls, course_id, updates):
-        existing_configs = cls.query.filter_by(course_id=course_id).all()
+        existing_configs = {c.activity_type: c for c in cls.query.filter_by(course_id=course_id).all()}
         for update in updates:
-            existing_config = next((c for c in existing_configs if c.activity_type == update['type']), None)
+            existing_config = existing_configs.get(update['type'])
             if existing_config:
                 existing_config.enabled = update['enabled']
                 existing_config.points = update['points']
@@ -125,6 +143,7 @@ class ActivityType(Base):
                 )
                 db.session.add(new_config)
         std_commit()
+        activity_type_configuration_cache.invalidate(course_id)
         return True
 
     def to_api_json(self):
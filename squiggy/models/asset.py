@@ -23,19 +23,26 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from itertools import groupby
+import base64
+import binascii
+import json
 import re
 from urllib.parse import urlparse
 
+from flask import current_app as app
 from sqlalchemy.dialects.postgresql import ENUM, JSON
 from sqlalchemy.sql import text
 from squiggy import db, std_commit
-from squiggy.lib.aws import get_s3_signed_url
+from squiggy.lib.aws import get_s3_signed_url, get_s3_signed_urls
+from squiggy.lib.cache import TTLCache
 from squiggy.lib.http import request
 from squiggy.lib.previews import generate_previews
+from squiggy.lib.search import to_prefix_tsquery, tsquery_sql
 from squiggy.lib.util import db_row_to_dict, isoformat, utc_now
 from squiggy.models.activity import Activity
+from squiggy.models.activity_type import ActivityType
 from squiggy.models.asset_category import asset_category_table
+from squiggy.models.asset_image_queue import AssetImageQueue
 from squiggy.models.asset_whiteboard_element import AssetWhiteboardElement
 from squiggy.models.base import Base
 
@@ -46,6 +53,21 @@ assets_sort_by_options = {
     'comments': 'Most comments',
 }
 
+# Per sort, the column that pages are ordered by, before 'id'. Sort by 'relevance' is available to keyword searches.
+assets_sort_columns = {
+    'recent': None,
+    'likes': 'likes',
+    'views': 'views',
+    'comments': 'comment_count',
+    'relevance': 'search_rank',
+}
+
+# Keyword match ranked by weight: title, then description, then comments.
+asset_search_rank = f'ts_rank(a.search_vector, {tsquery_sql()})'
+
+# Per (course_id, user_id, include_hidden, filters), the count of assets in the Asset Library.
+asset_total_cache = TTLCache(name='asset_library_total')
+
 assets_type = ENUM(
     'file',
     'link',
@@ -141,6 +163,10 @@ class Asset(Base):
     def find_by_id(cls, asset_id):
         return cls.query.filter_by(id=asset_id, deleted_at=None).first()
 
+    @classmethod
+    def get_deleted_asset_ids(cls, asset_ids):
+        return {r[0] for r in db.session.query(cls.id).filter(cls.id.in_(asset_ids), cls.deleted_at.isnot(None)).all()}
+
     @classmethod
     def create(
         cls,
@@ -176,6 +202,7 @@ class Asset(Base):
         )
         db.session.add(asset)
         std_commit()
+        asset_total_cache.invalidate_where(0, course_id)
 
         preview_url = download_url if asset_type in ['file', 'whiteboard'] else url
         _generate_previews(asset, preview_url)
@@ -201,6 +228,7 @@ class Asset(Base):
         if asset:
             asset.deleted_at = utc_now()
             std_commit()
+            asset_total_cache.invalidate_where(0, asset.course_id)
 
     @classmethod
     def update(
@@ -216,21 +244,29 @@ class Asset(Base):
         asset.categories = categories or []
         db.session.add(asset)
         std_commit()
+        asset_total_cache.invalidate_where(0, asset.course_id)
         return asset
 
     @classmethod
-    def get_assets(cls, current_user, filters, offset, order_by, limit, include_hidden=False):
+    def get_assets(cls, current_user, filters, offset, order_by, limit, cursor=None, include_hidden=False, include_total=True):
+        # Page of assets after 'cursor' (the 'nextCursor' of the previous page) or, failing that, at 'offset'. Raises
+        # ValueError if the cursor is not valid for 'order_by'.
+        tsquery = to_prefix_tsquery(filters.get('keywords'))
+        if order_by not in assets_sort_by_options and not (order_by == 'relevance' and tsquery):
+            order_by = 'recent'
         params = {
             'asset_ids': filters.get('asset_ids'),
             'asset_types': filters.get('asset_type'),
             'category_id': filters.get('category_id'),
             'course_id': current_user.course_id,
             'group_id': filters.get('group_id'),
-            'limit': limit,
+            # One extra row tells whether there is a next page.
+            'limit': limit and limit + 1,
             'my_asset_ids': current_user.asset_ids,
-            'offset': offset,
+            'offset': 0 if cursor else offset,
             'owner_id': filters.get('owner_id'),
             'section': filters.get('section'),
+            'tsquery': tsquery,
             'user_id': current_user.id,
         }
 
@@ -242,51 +278,161 @@ class Asset(Base):
             current_user=current_user,
         )
         order_clause = _build_order_clause(order_by)
-
-        assets_query = text(f"""SELECT DISTINCT ON (a.id, a.likes, a.views, a.comment_count) a.*, act.type AS activity_type
-            {from_clause} {where_clause} {order_clause}
-            LIMIT :limit OFFSET :offset""")
+        select_clause = _build_select_clause(order_by)
+        keyset_condition = _build_keyset_condition(cursor=cursor, order_by=order_by, params=params) if cursor else None
+
+        # Total is per course, user and filters, cached. If not cached then it comes with the page, in one round trip.
+        total_cache_key = (current_user.course_id, current_user.id, include_hidden, json.dumps(filters, default=str, sort_keys=True))
+        total = asset_total_cache.get(total_cache_key) if include_total else None
+        count_total = include_total and total is None
+        if count_total:
+            page_cte = f"""
+                matches AS (
+                    {select_clause}
+                    {from_clause} {where_clause} {order_clause}
+                ),
+                counted AS (
+                    SELECT a.*, COUNT(*) OVER ()::int AS total_count FROM matches a
+                ),
+                page AS (
+                    SELECT a.* FROM counted a
+                    {f'WHERE {keyset_condition}' if keyset_condition else ''} {order_clause}
+                    LIMIT :limit OFFSET :offset
+                )"""
+        else:
+            page_cte = f"""
+                page AS (
+                    {select_clause}
+                    {from_clause} {where_clause} {f'AND {keyset_condition}' if keyset_condition else ''} {order_clause}
+                    LIMIT :limit OFFSET :offset
+                )"""
+        # Owners of each asset via json_agg, in the same query.
+        assets_query = text(f"""
+            WITH {page_cte}
+            SELECT a.*, (
+                SELECT json_agg(json_build_object(
+                    'assetId', au.asset_id,
+                    'id', u.id,
+                    'canvasUserId', u.canvas_user_id,
+                    'canvasCourseRole', u.canvas_course_role,
+                    'canvasCourseSections', u.canvas_course_sections,
+                    'canvasEnrollmentState', u.canvas_enrollment_state,
+                    'canvasFullName', u.canvas_full_name,
+                    'canvasImage', u.canvas_image
+                ) ORDER BY u.id)
+                FROM asset_users au JOIN users u ON au.user_id = u.id
+                WHERE au.asset_id = a.id
+            ) AS asset_users_json
+            FROM page a {order_clause}""")
         assets_result = list(db.session.execute(assets_query, params))
-
-        count_query = text(f'SELECT COUNT(DISTINCT(a.id))::int AS count {from_clause} {where_clause}')
-        count_result = db.session.execute(count_query, params).fetchone()
-        total = (count_result and count_result[0]) or 0
-
-        asset_ids = [r['id'] for r in assets_result]
-
-        users_query = text("""
-            SELECT
-                au.asset_id, u.id, u.canvas_user_id, u.canvas_course_role, u.canvas_course_sections,
-                u.canvas_enrollment_state, u.canvas_full_name, u.canvas_image
-            FROM users u JOIN asset_users au
-            ON au.user_id = u.id AND au.asset_id = ANY(:asset_ids)
-            ORDER BY au.asset_id
-        """)
-        users_result = db.session.execute(users_query, {'asset_ids': asset_ids})
-        users_by_asset = dict()
-        for asset_id, user_rows in groupby(users_result, lambda r: r['asset_id']):
-            users_by_asset[asset_id] = [db_row_to_dict(r) for r in user_rows]
-
-        def _row_to_json_asset(row):
+        has_next_page = bool(limit) and len(assets_result) > limit
+        assets_result = assets_result[:limit] if has_next_page else assets_result
+
+        if count_total:
+            if assets_result:
+                total = assets_result[0]['total_count']
+            elif offset or cursor:
+                # Past the last page, the window has no row to report on.
+                count_query = text(f'SELECT COUNT(DISTINCT(a.id))::int AS count {from_clause} {where_clause}')
+                total = db.session.execute(count_query, params).scalar() or 0
+            else:
+                total = 0
+            asset_total_cache.put(total_cache_key, total, ttl_seconds=app.config['ASSET_LIBRARY_TOTAL_CACHE_TTL'])
+
+        json_assets = []
+        for row in assets_result:
             json_asset = db_row_to_dict(row)
-
+            users = json_asset.pop('assetUsersJson')
+            json_asset.pop('searchRank', None)
+            json_asset.pop('searchVector', None)
+            json_asset.pop('totalCount', None)
             # Has the user liked the asset?
             json_asset['liked'] = (json_asset['activityType'] == 'asset_like')
-
-            if json_asset['id'] in users_by_asset:
-                json_asset['users'] = users_by_asset[json_asset['id']]
-            json_asset['thumbnailUrl'] = get_s3_signed_url(json_asset['thumbnailUrl'])
-
-            return json_asset
+            if users:
+                json_asset['users'] = users
+            json_assets.append(json_asset)
+        for json_asset, thumbnail_url in zip(json_assets, get_s3_signed_urls([a['thumbnailUrl'] for a in json_assets])):
+            json_asset['thumbnailUrl'] = thumbnail_url
 
         results = {
+            'nextCursor': _encode_cursor(order_by=order_by, row=assets_result[-1]) if has_next_page else None,
             'offset': offset,
             'total': total,
-            'results': [_row_to_json_asset(r) for r in assets_result],
+            'results': json_assets,
         }
 
         return results
 
+    @classmethod
+    def record_views(cls, views):
+        # Per view ({'assetId', 'courseId', 'userId', 'viewedAt'}), an 'asset_view' activity plus a 'get_asset_view'
+        # activity per asset owner. One statement inserts all activities, adds to 'views' of assets, and updates points
+        # and last_activity of users. Returns the count of views recorded.
+        if not views:
+            return 0
+        course_ids = sorted({v['courseId'] for v in views})
+        points_by_course_id = {course_id: ActivityType.get_points_by_type(course_id=course_id) for course_id in course_ids}
+        params = {
+            'asset_ids': [v['assetId'] for v in views],
+            'course_ids': course_ids,
+            'get_view_points': [points_by_course_id[c].get('get_asset_view', 0) for c in course_ids],
+            'user_ids': [v['userId'] for v in views],
+            'view_points': [points_by_course_id[c].get('asset_view', 0) for c in course_ids],
+            'viewed_at': [v['viewedAt'] for v in views],
+        }
+        sql = """
+            WITH course_points AS (
+                SELECT * FROM unnest(CAST(:course_ids AS integer[]), CAST(:view_points AS integer[]), CAST(:get_view_points AS integer[]))
+                    AS p(course_id, view_points, get_view_points)
+            ),
+            view_activities AS (
+                INSERT INTO activities (type, course_id, user_id, object_type, object_id, asset_id, created_at, updated_at)
+                SELECT
+                    CAST('asset_view' AS enum_activities_type), a.course_id, v.user_id, CAST('asset' AS enum_activities_object_type),
+                    a.id, a.id, v.viewed_at, v.viewed_at
+                FROM unnest(CAST(:asset_ids AS integer[]), CAST(:user_ids AS integer[]), CAST(:viewed_at AS timestamptz[]))
+                    AS v(asset_id, user_id, viewed_at)
+                JOIN assets a ON a.id = v.asset_id AND a.deleted_at IS NULL
+                RETURNING id, asset_id, course_id, user_id, created_at
+            ),
+            get_view_activities AS (
+                INSERT INTO activities (
+                    type, course_id, user_id, object_type, object_id, asset_id, actor_id, reciprocal_id, created_at, updated_at
+                )
+                SELECT
+                    CAST('get_asset_view' AS enum_activities_type), va.course_id, au.user_id, CAST('asset' AS enum_activities_object_type),
+                    va.asset_id, va.asset_id, va.user_id, va.id, va.created_at, va.created_at
+                FROM view_activities va
+                JOIN asset_users au ON au.asset_id = va.asset_id
+                RETURNING course_id, user_id, created_at
+            ),
+            updated_assets AS (
+                UPDATE assets SET views = COALESCE(assets.views, 0) + counts.views
+                FROM (SELECT asset_id, COUNT(*)::int AS views FROM view_activities GROUP BY asset_id) counts
+                WHERE assets.id = counts.asset_id
+            ),
+            updated_users AS (
+                UPDATE users SET points = users.points + totals.points, last_activity = GREATEST(users.last_activity, totals.last_activity)
+                FROM (
+                    SELECT s.user_id, SUM(s.points)::int AS points, MAX(s.created_at) AS last_activity
+                    FROM (
+                        SELECT va.user_id, p.view_points AS points, va.created_at
+                        FROM view_activities va JOIN course_points p ON p.course_id = va.course_id
+                        UNION ALL
+                        SELECT g.user_id, p.get_view_points AS points, g.created_at
+                        FROM get_view_activities g JOIN course_points p ON p.course_id = g.course_id
+                    ) s
+                    GROUP BY s.user_id
+                ) totals
+                WHERE users.id = totals.user_id
+            )
+            SELECT COUNT(*) FROM view_activities"""
+        count = db.session.execute(text(sql), params).scalar()
+        std_commit()
+        # Assets and users already loaded in this session are stale.
+        db.session.expire_all()
+        return count
+
     def get_used_in_assets(self):
         def _to_api_json(row):
             return {
@@ -312,7 +458,7 @@ class Asset(Base):
         return count > 0
 
     def add_like(self, user_id):
-        like_activity = Activity.create_unless_exists(
+        like_query = Activity.query.filter_by(
             activity_type='asset_like',
             course_id=self.course_id,
             user_id=user_id,
@@ -320,65 +466,38 @@ class Asset(Base):
             object_id=self.id,
             asset_id=self.id,
         )
-        if like_activity:
-            for asset_owner in self.users:
-                Activity.create_unless_exists(
-                    activity_type='get_asset_like',
-                    course_id=self.course_id,
-                    user_id=asset_owner.id,
-                    object_type='asset',
-                    object_id=self.id,
-                    asset_id=self.id,
-                    actor_id=user_id,
-                    reciprocal_id=like_activity.id,
-                )
+        if like_query.count() == 0:
+            Activity.create_batch(
+                activity_type='asset_like',
+                course_id=self.course_id,
+                user_id=user_id,
+                object_type='asset',
+                object_id=self.id,
+                asset_id=self.id,
+                reciprocal_activity_type='get_asset_like',
+                reciprocal_user_ids=[u.id for u in self.users],
+            )
         self.likes = Activity.query.filter_by(asset_id=self.id, activity_type='asset_like').count()
         db.session.add(self)
         std_commit()
         return True
 
     def remove_like(self, user_id):
-        db.session.query(Activity).filter_by(
+        Activity.delete(
+            course_id=self.course_id,
             object_id=self.id,
             object_type='asset',
             activity_type='asset_like',
             user_id=user_id,
-        ).delete()
-        db.session.query(Activity).filter_by(
+        )
+        Activity.delete(
+            course_id=self.course_id,
             object_id=self.id,
             object_type='asset',
             activity_type='get_asset_like',
             actor_id=user_id,
-        ).delete()
-        std_commit()
-        Activity.recalculate_points(course_id=self.course_id, user_ids=[user_id] + [u.id for u in self.users])
-        self.likes = Activity.query.filter_by(object_id=self.id, object_type='asset', activity_type='asset_like').count()
-        db.session.add(self)
-        std_commit()
-        return True
-
-    def increment_views(self, user_id):
-        view_activity = Activity.create(
-            activity_type='asset_view',
-            course_id=self.course_id,
-            user_id=user_id,
-            object_type='asset',
-            object_id=self.id,
-            asset_id=self.id,
         )
-        if view_activity:
-            for asset_owner in self.users:
-                Activity.create(
-                    activity_type='get_asset_view',
-                    course_id=self.course_id,
-                    user_id=asset_owner.id,
-                    object_type='asset',
-                    object_id=self.id,
-                    asset_id=self.id,
-                    actor_id=user_id,
-                    reciprocal_id=view_activity.id,
-                )
-        self.views = Activity.query.filter_by(asset_id=self.id, activity_type='asset_view').count()
+        self.likes = Activity.query.filter_by(object_id=self.id, object_type='asset', activity_type='asset_like').count()
         db.session.add(self)
         std_commit()
         return True
@@ -403,6 +522,9 @@ class Asset(Base):
         if kwargs.get('thumbnail_url'):
             self.thumbnail_url = kwargs['thumbnail_url']
         if kwargs.get('image_url'):
+            if kwargs['image_url'] != self.image_url:
+                # Whiteboard elements of the asset are due the new image. See WhiteboardHousekeeping.
+                AssetImageQueue.enqueue(self.id)
             self.image_url = kwargs['image_url']
         if kwargs.get('pdf_url'):
             self.pdf_url = kwargs['pdf_url']
@@ -519,6 +641,20 @@ def _build_from_clause(filters, current_user):
     return from_clause
 
 
+def _build_keyset_condition(cursor, order_by, params):
+    # Rows after the cursor, in order. Every sort is descending, with 'id' as tie-breaker.
+    column = assets_sort_columns[order_by]
+    values = _decode_cursor(cursor=cursor, order_by=order_by)
+    params['cursor_id'] = values[-1]
+    if column:
+        params['cursor_value'] = values[0]
+        # ts_rank is real. A double bound would skip, or repeat, rows ranked the same as the last row of the previous page.
+        cursor_value = 'CAST(:cursor_value AS real)' if column == 'search_rank' else ':cursor_value'
+        return f'({_get_sort_expression(column)}, a.id) < ({cursor_value}, :cursor_id)'
+    else:
+        return 'a.id < :cursor_id'
+
+
 def _build_order_clause(order_by):
     if (order_by == 'recent'):
         return ' ORDER BY a.id DESC'
@@ -528,10 +664,20 @@ def _build_order_clause(order_by):
         return ' ORDER BY a.views DESC, a.id DESC'
     elif (order_by == 'comments'):
         return ' ORDER BY a.comment_count DESC, a.id DESC'
+    elif (order_by == 'relevance'):
+        return f' ORDER BY {asset_search_rank} DESC, a.id DESC'
     else:
         return ' ORDER BY a.id DESC'
 
 
+def _build_select_clause(order_by):
+    if order_by == 'relevance':
+        return f"""SELECT DISTINCT ON ({asset_search_rank}, a.id, a.likes, a.views, a.comment_count)
+            a.*, act.type AS activity_type, {asset_search_rank} AS search_rank"""
+    else:
+        return 'SELECT DISTINCT ON (a.id, a.likes, a.views, a.comment_count) a.*, act.type AS activity_type'
+
+
 def _build_where_clause(filters, include_hidden, params, current_user):
     where_clause = """WHERE
         a.deleted_at IS NULL
@@ -549,7 +695,11 @@ def _build_where_clause(filters, include_hidden, params, current_user):
             OR NOT lower(asset_owner.canvas_course_role) SIMILAR TO '%(student|learner)%'
         )"""
         params['user_course_sections'] = current_user.canvas_course_sections
-    if filters.get('keywords'):
+    if params.get('tsquery'):
+        # Title, description and comments, per the indexed 'search_vector'.
+        where_clause += f' AND a.search_vector @@ {tsquery_sql()}'
+    elif filters.get('keywords'):
+        # No word to search on, e.g. punctuation only.
         where_clause += ' AND (a.title ILIKE :keywords OR a.description ILIKE :keywords)'
         params['keywords'] = '%' + re.sub(r'\s+', '%', filters['keywords'].strip()) + '%'
 
@@ -568,6 +718,32 @@ def _build_where_clause(filters, include_hidden, params, current_user):
     return where_clause
 
 
+def _decode_cursor(cursor, order_by):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        values = decoded['values']
+        # Relevance is ranked by float.
+        value_types = [float if order_by == 'relevance' else int, int] if assets_sort_columns[order_by] else [int]
+        is_valid = decoded['orderBy'] == order_by \
+            and len(values) == len(value_types) \
+            and all(isinstance(v, t) and not isinstance(v, bool) for v, t in zip(values, value_types))
+    except (AttributeError, binascii.Error, KeyError, TypeError, UnicodeError, ValueError):
+        is_valid = False
+    if not is_valid:
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return values
+
+
+def _get_sort_expression(column):
+    return asset_search_rank if column == 'search_rank' else f'a.{column}'
+
+
+def _encode_cursor(order_by, row):
+    column = assets_sort_columns[order_by]
+    values = [row[column], row['id']] if column else [row['id']]
+    return base64.urlsafe_b64encode(json.dumps({'orderBy': order_by, 'values': values}).encode('utf-8')).decode('ascii')
+
+
 def _generate_previews(asset, preview_url):
     if not generate_previews(asset.id, preview_url):
         asset.update_preview(preview_status='error')
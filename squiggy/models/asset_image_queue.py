@@ -0,0 +1,61 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy import ForeignKey, Integer, text
+from squiggy import db
+from squiggy.models.base import Base
+
+
+class AssetImageQueue(Base):
+    __tablename__ = 'asset_image_queue'
+
+    # One row per asset with a new image, which its whiteboard elements have yet to get.
+    asset_id = db.Column('asset_id', Integer, ForeignKey('assets.id'), nullable=False, primary_key=True)
+    queued_at = db.Column('queued_at', db.DateTime, nullable=False)
+
+    @classmethod
+    def claim(cls, limit):
+        # Longest waiting assets are removed from the queue. No commit: rows come back if the caller's transaction fails.
+        sql = """
+            DELETE FROM asset_image_queue
+            WHERE asset_id IN (
+                SELECT asset_id FROM asset_image_queue
+                ORDER BY queued_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING asset_id
+        """
+        return [row['asset_id'] for row in db.session.execute(text(sql), {'limit': limit})]
+
+    @classmethod
+    def enqueue(cls, asset_id):
+        # No commit: the asset is queued in the transaction which changed its image.
+        sql = """
+            INSERT INTO asset_image_queue (asset_id, queued_at, created_at, updated_at)
+            VALUES (:asset_id, now(), now(), now())
+            ON CONFLICT (asset_id) DO UPDATE SET queued_at = now(), updated_at = now()
+        """
+        db.session.execute(text(sql), {'asset_id': asset_id})
@@ -72,7 +72,6 @@ class Comment(Base):
                 object_type='comment',
                 object_id=comment_id,
                 course_id=comment.asset.course_id,
-                user_ids=[comment.user_id] + [u.id for u in comment.asset.users],
             )
             std_commit(allow_test_environment=True)
             if asset:
@@ -136,31 +135,21 @@ class Comment(Base):
 def _create_activities_per_new_comment(asset, comment):
     if asset.visible:
         course_id = asset.course_id
-        comment_activity = None
+        comment_activity_id = None
         if comment.user_id not in [user.id for user in asset.users]:
-            comment_activity = Activity.create(
+            comment_activity_id = Activity.create_batch(
                 activity_type='asset_comment',
                 course_id=course_id,
                 user_id=comment.user_id,
                 object_type='comment',
                 object_id=comment.id,
                 asset_id=asset.id,
+                reciprocal_activity_type='get_asset_comment',
+                reciprocal_user_ids=[user.id for user in asset.users],
             )
-            for user in asset.users:
-                Activity.create(
-                    activity_type='get_asset_comment',
-                    course_id=course_id,
-                    user_id=user.id,
-                    object_type='comment',
-                    object_id=comment.id,
-                    asset_id=asset.id,
-                    actor_id=comment.user_id,
-                    reciprocal_id=comment_activity.id,
-                )
         if comment.parent_id:
             parent = Comment.find_by_id(comment.parent_id)
             if parent.user_id != comment.user_id:
-                reciprocal_id = comment_activity.id if comment_activity else None
                 Activity.create(
                     activity_type='get_asset_comment_reply',
                     course_id=course_id,
@@ -169,5 +158,5 @@ def _create_activities_per_new_comment(asset, comment):
                     object_id=parent.id,
                     asset_id=asset.id,
                     actor_id=comment.user_id,
-                    reciprocal_id=reciprocal_id,
+                    reciprocal_id=comment_activity_id,
                 )
@@ -0,0 +1,120 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy import ForeignKey, Integer, String, text
+from squiggy import db, std_commit
+from squiggy.lib.util import isoformat
+from squiggy.models.base import Base
+
+
+class PointsRecalculation(Base):
+    __tablename__ = 'points_recalculations'
+
+    # One row per course, the latest recalculation of its users' points. Any app server may claim a queued row.
+    course_id = db.Column('course_id', Integer, ForeignKey('courses.id'), nullable=False, primary_key=True)
+    finished_at = db.Column('finished_at', db.DateTime)
+    queued_at = db.Column('queued_at', db.DateTime, nullable=False)
+    started_at = db.Column('started_at', db.DateTime)
+    status = db.Column('status', String(255), nullable=False, default='queued')
+    users_total = db.Column('users_total', Integer)
+    users_updated = db.Column('users_updated', Integer, nullable=False, default=0)
+
+    @classmethod
+    def claim(cls, visibility_timeout):
+        # Longest waiting course, if any. Claims older than 'visibility_timeout' are abandoned, e.g. by a server restart.
+        sql = """
+            UPDATE points_recalculations r
+            SET status = 'running', started_at = now(), users_total = NULL, users_updated = 0, updated_at = now()
+            FROM (
+                SELECT course_id FROM points_recalculations
+                WHERE status = 'queued'
+                    OR (status = 'running' AND started_at < now() - make_interval(secs => :visibility_timeout))
+                ORDER BY queued_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ) due
+            WHERE r.course_id = due.course_id
+            RETURNING r.course_id, r.queued_at
+        """
+        row = db.session.execute(text(sql), {'visibility_timeout': visibility_timeout}).first()
+        std_commit()
+        return row and {
+            'courseId': row['course_id'],
+            'queuedAt': row['queued_at'],
+        }
+
+    @classmethod
+    def enqueue(cls, course_id):
+        sql = """
+            INSERT INTO points_recalculations (course_id, status, users_updated, queued_at, created_at, updated_at)
+            VALUES (:course_id, 'queued', 0, now(), now(), now())
+            ON CONFLICT (course_id) DO UPDATE SET
+                status = 'queued', users_total = NULL, users_updated = 0, queued_at = now(), started_at = NULL,
+                finished_at = NULL, updated_at = now()
+        """
+        db.session.execute(text(sql), {'course_id': course_id})
+        std_commit()
+        return cls.find_by_course_id(course_id)
+
+    @classmethod
+    def find_by_course_id(cls, course_id):
+        # Status is updated by raw SQL, so rows already loaded in this session are refreshed.
+        return cls.query.populate_existing().filter_by(course_id=course_id).first()
+
+    @classmethod
+    def finish(cls, course_id, queued_at, status):
+        # If the course was queued again since it was claimed, it stays in the queue.
+        sql = """
+            UPDATE points_recalculations SET status = :status, finished_at = now(), updated_at = now()
+            WHERE course_id = :course_id AND queued_at = :queued_at
+        """
+        db.session.execute(text(sql), {'course_id': course_id, 'queued_at': queued_at, 'status': status})
+        std_commit()
+
+    @classmethod
+    def update_progress(cls, course_id, queued_at, users_total, users_updated):
+        sql = """
+            UPDATE points_recalculations SET users_total = :users_total, users_updated = :users_updated, updated_at = now()
+            WHERE course_id = :course_id AND queued_at = :queued_at
+        """
+        params = {
+            'course_id': course_id,
+            'queued_at': queued_at,
+            'users_total': users_total,
+            'users_updated': users_updated,
+        }
+        db.session.execute(text(sql), params)
+        std_commit()
+
+    def to_api_json(self):
+        return {
+            'courseId': self.course_id,
+            'finishedAt': isoformat(self.finished_at),
+            'queuedAt': isoformat(self.queued_at),
+            'startedAt': isoformat(self.started_at),
+            'status': self.status,
+            'usersTotal': self.users_total,
+            'usersUpdated': self.users_updated,
+        }
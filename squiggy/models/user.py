@@ -162,6 +162,10 @@ class User(Base):
         where_clause = and_(cls.course_id == course_id, cls.canvas_user_id == canvas_user_id)
         return cls.query.filter(where_clause).one_or_none()
 
+    @classmethod
+    def get_user_ids_by_course_id(cls, course_id):
+        return [row.id for row in cls.query.with_entities(cls.id).filter_by(course_id=course_id).order_by(cls.id).all()]
+
     @classmethod
     def get_users_by_course_id(cls, course_id, sections=None):
         query = cls.query.filter(
@@ -26,18 +26,32 @@ ENHANCEMENTS, OR MODIFICATIONS.
 import re
 from uuid import uuid4
 
+from flask import current_app as app
 from sqlalchemy import text
 from squiggy import db, std_commit
-from squiggy.lib.aws import get_s3_signed_url, is_s3_preview_url
-from squiggy.lib.util import is_admin, is_observer, is_student, is_teaching, isoformat, utc_now
+from squiggy.lib.aws import get_s3_signed_urls, is_s3_preview_url
+from squiggy.lib.cache import TTLCache
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.search import TEXT_SEARCH_CONFIG, to_prefix_tsquery, tsquery_sql
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
+from squiggy.lib.util import is_admin, is_observer, is_student, is_teaching, isoformat, merge_patch, to_int, utc_now
+from squiggy.lib.viewport import prioritize_whiteboard_elements
+from squiggy.lib.whiteboard_state import whiteboard_state
 from squiggy.models.activity import Activity
 from squiggy.models.asset import Asset
 from squiggy.models.asset_whiteboard_element import AssetWhiteboardElement
 from squiggy.models.base import Base
 from squiggy.models.whiteboard_element import WhiteboardElement
-from squiggy.models.whiteboard_session import WhiteboardSession
+from squiggy.models.whiteboard_operation import WhiteboardOperation
+from squiggy.models.whiteboard_snapshot import WhiteboardSnapshot
 from squiggy.models.whiteboard_user import whiteboard_user_table
 
+# Per (user_id, whiteboard_id, include_deleted), whether the user can update the whiteboard.
+whiteboard_authorization_cache = TTLCache(name='whiteboard_authorization')
+
+# Matches the expression of index 'whiteboards_title_search_idx'.
+whiteboard_search_vector = f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(w.title, ''))"
+
 
 class Whiteboard(Base):
     __tablename__ = 'whiteboards'
@@ -89,6 +103,17 @@ class Whiteboard(Base):
     def can_update_whiteboard(cls, current_user, whiteboard_id, include_deleted=False):
         if current_user.is_admin or current_user.is_teaching:
             return True
+        whiteboard_id = to_int(whiteboard_id)
+        if whiteboard_id is None:
+            return False
+        return whiteboard_authorization_cache.get_or_load(
+            key=(current_user.id, whiteboard_id, include_deleted),
+            load=lambda: cls._can_update_whiteboard(current_user, whiteboard_id, include_deleted),
+            ttl_seconds=app.config['WHITEBOARD_AUTHORIZATION_CACHE_TTL'],
+        )
+
+    @classmethod
+    def _can_update_whiteboard(cls, current_user, whiteboard_id, include_deleted):
         args = {
             'user_id': current_user.id,
             'whiteboard_id': whiteboard_id,
@@ -113,7 +138,7 @@ class Whiteboard(Base):
         return bool(result and result['user_id'])
 
     @classmethod
-    def find_by_id(cls, current_user, whiteboard_id, include_deleted=True):
+    def find_by_id(cls, current_user, whiteboard_id, include_deleted=True, viewport=None):
         whiteboards = cls.get_whiteboards(
             current_user=current_user,
             include_deleted=include_deleted,
@@ -124,47 +149,33 @@ class Whiteboard(Base):
         whiteboard = whiteboards['results'][0] if whiteboards['total'] else None
         if not whiteboard:
             return None
-        whiteboard['whiteboardElements'] = _get_sorted_whiteboard_elements(whiteboard_id)
-        asset_ids = []
-        for whiteboard_element in whiteboard['whiteboardElements']:
-            asset_id = whiteboard_element['assetId']
-            if not asset_id:
-                element = whiteboard_element['element']
-                src = element.get('src')
-                if src and is_s3_preview_url(src):
-                    element['src'] = get_s3_signed_url(src)
-            elif asset_id not in asset_ids:
-                asset_ids.append(asset_id)
-
-        if asset_ids:
-            assets = Asset.get_assets(
-                current_user=current_user,
-                filters={'asset_ids': asset_ids},
-                include_hidden=True,
-                limit=100000,
-                offset=0,
-                order_by='id',
-            )
-            assets_by_id = dict((asset['id'], asset) for asset in assets['results'])
-            for whiteboard_element in [w for w in whiteboard['whiteboardElements'] if w['assetId']]:
-                asset_id = whiteboard_element['assetId']
-                asset = assets_by_id.get(asset_id)
-                if asset:
-                    asset_image_url = asset['imageUrl']
-                    element = whiteboard_element['element']
-                    if asset_image_url != element.get('src'):
-                        # Update preview image. Front-end will re-render the element.
-                        element['src'] = asset_image_url
-                        updated_element = WhiteboardElement.update(
-                            asset_id=asset_id,
-                            element=element,
-                            uuid=whiteboard_element['uuid'],
-                            whiteboard_id=whiteboard_id,
-                        )
-                        if updated_element:
-                            whiteboard_element['element'] = updated_element.element
+        if viewport:
+            # Only what is in view. The client gets the rest via get_whiteboard_element_chunks.
+            whiteboard_elements = _get_whiteboard_elements_in_viewport(viewport, whiteboard_id)
+        else:
+            whiteboard_elements = _get_sorted_whiteboard_elements(whiteboard_id)
+        whiteboard['whiteboardElements'] = cls.hydrate_whiteboard_elements(whiteboard_elements)
         return whiteboard
 
+    @classmethod
+    def get_whiteboard_element_chunks(cls, chunk_size, viewport, whiteboard_id, exclude_uuids=()):
+        # Whiteboard elements in prioritized chunks, per viewport. Chunks are hydrated as they are sent.
+        exclude_uuids = set(exclude_uuids or [])
+        whiteboard_elements = [w for w in _get_sorted_whiteboard_elements(whiteboard_id) if w['uuid'] not in exclude_uuids]
+        return prioritize_whiteboard_elements(
+            chunk_size=chunk_size,
+            viewport=viewport,
+            whiteboard_elements=whiteboard_elements,
+        )
+
+    @classmethod
+    def hydrate_whiteboard_elements(cls, whiteboard_elements):
+        # Sign S3 urls. No db access: asset images are reconciled when previews are done (see previews_controller).
+        elements = [w['element'] for w in whiteboard_elements if is_s3_preview_url(w['element'].get('src'))]
+        for element, signed_url in zip(elements, get_s3_signed_urls([e['src'] for e in elements])):
+            element['src'] = signed_url
+        return whiteboard_elements
+
     @classmethod
     def create(
         cls,
@@ -181,6 +192,9 @@ class Whiteboard(Base):
         )
         db.session.add(whiteboard)
         std_commit()
+        # History of the whiteboard starts empty.
+        WhiteboardSnapshot.create(version=0, whiteboard_elements=[], whiteboard_id=whiteboard.id)
+        whiteboard_authorization_cache.invalidate_where(1, whiteboard.id)
         return whiteboard.to_api_json()
 
     @classmethod
@@ -189,6 +203,7 @@ class Whiteboard(Base):
         if whiteboard:
             whiteboard.deleted_at = utc_now()
             std_commit()
+            whiteboard_authorization_cache.invalidate_where(1, whiteboard.id)
         return whiteboard
 
     @classmethod
@@ -210,6 +225,7 @@ class Whiteboard(Base):
             'keywords': ('%' + re.sub(r'\s+', '%', keywords.strip()) + '%') if keywords else None,
             'limit': limit,
             'offset': offset,
+            'tsquery': to_prefix_tsquery(keywords),
             'user_id': user_id,
             'whiteboard_id': whiteboard_id,
         }
@@ -225,7 +241,6 @@ class Whiteboard(Base):
         )
         join_clause = """
             LEFT JOIN whiteboard_users wu ON wu.whiteboard_id = w.id
-            LEFT JOIN whiteboard_sessions s ON s.user_id = wu.user_id AND s.whiteboard_id = w.id
             LEFT JOIN users u ON wu.user_id = u.id AND u.canvas_enrollment_state != 'inactive'
             LEFT JOIN activities act ON act.object_type = 'whiteboard' AND w.id = act.object_id
         """
@@ -233,23 +248,31 @@ class Whiteboard(Base):
         order_by_clause = {
             'collaborator': 'u.canvas_full_name, u.canvas_user_id',
             'recent': default_order_by,
+            # Order of the page, per rank below.
+            'relevance': 'array_position(CAST(:whiteboard_ids AS integer[]), w.id)' if params['tsquery'] else None,
         }.get(order_by) or default_order_by
 
-        # First, get whiteboard_ids
+        # First, get whiteboard_ids. Keyword searches can be ranked by relevance.
+        if order_by == 'relevance' and params['tsquery']:
+            select_clause = f'SELECT DISTINCT w.id, ts_rank({whiteboard_search_vector}, {tsquery_sql()}) AS search_rank'
+            page_order_by = 'search_rank DESC, w.id'
+        else:
+            select_clause = 'SELECT DISTINCT w.id'
+            page_order_by = 'w.id'
         sql = f"""
-            SELECT DISTINCT w.id
+            {select_clause}
             FROM whiteboards w
             {join_clause}
             {where_clause}
-            ORDER BY w.id LIMIT :limit OFFSET :offset
+            ORDER BY {page_order_by} LIMIT :limit OFFSET :offset
         """
-        all_whiteboard_ids = list({row['id'] for row in list(db.session.execute(sql, params))})
+        all_whiteboard_ids = [row['id'] for row in list(db.session.execute(sql, params))]
         params['whiteboard_ids'] = all_whiteboard_ids
 
         # Next, get search results per whiteboard_ids above.
         sql = f"""
             SELECT w.*, u.canvas_course_role, u.canvas_course_sections, u.canvas_enrollment_state, u.canvas_full_name,
-              u.canvas_image, u.canvas_user_id, u.id AS user_id, s.socket_id
+              u.canvas_image, u.canvas_user_id, u.id AS user_id
             FROM whiteboards w
             {join_clause}
             WHERE w.id = ANY(:whiteboard_ids)
@@ -258,6 +281,7 @@ class Whiteboard(Base):
         whiteboards_by_id = {}
         users_by_whiteboard_id = {}
         rows = list(db.session.execute(sql, params))
+        user_ids_online = whiteboard_presence.get_user_ids_online(all_whiteboard_ids)
 
         for row in rows:
             whiteboard_id = int(row['id'])
@@ -289,7 +313,7 @@ class Whiteboard(Base):
                     'canvasUserId': row['canvas_user_id'],
                     'isAdmin': is_admin(row),
                     'isObserver': is_observer(row),
-                    'isOnline': bool(row['socket_id']),
+                    'isOnline': user_id in user_ids_online.get(whiteboard_id, set()),
                     'isStudent': is_student(row),
                     'isTeaching': is_teaching(row),
                 }
@@ -326,27 +350,42 @@ class Whiteboard(Base):
         user_id = created_by.id
         course_id = created_by.course.id
         if user_id not in [user.id for user in whiteboard_users]:
-            remix_activity = Activity.create(
+            Activity.create_batch(
                 activity_type='whiteboard_remix',
                 course_id=course_id,
                 user_id=user_id,
                 object_type='asset',
                 object_id=asset_id,
                 asset_id=asset_id,
+                reciprocal_activity_type='get_whiteboard_remix',
+                reciprocal_user_ids=[u.id for u in whiteboard_users],
             )
-            for asset_user in whiteboard_users:
-                Activity.create(
-                    activity_type='get_whiteboard_remix',
-                    course_id=course_id,
-                    user_id=asset_user.id,
-                    object_type='asset',
-                    object_id=asset_id,
-                    asset_id=asset_id,
-                    actor_id=user_id,
-                    reciprocal_id=remix_activity.id,
-                )
         return whiteboard
 
+    @classmethod
+    def undo(cls, whiteboard_id, version=None):
+        # Revert the elements touched by an operation (default: the latest) to their state before it. The revert is itself
+        # an operation, so undo of an undo is a redo. Returns (restored whiteboard_elements, deleted uuids) or None.
+        whiteboard_id = int(whiteboard_id)
+        if version:
+            operation = WhiteboardOperation.find_by_version(version=version, whiteboard_id=whiteboard_id)
+        else:
+            operation = next(iter(WhiteboardOperation.get_history(whiteboard_id=whiteboard_id, limit=1)), None)
+        if not operation:
+            return None
+        previous = WhiteboardSnapshot.get_whiteboard_elements(version=operation.version - 1, whiteboard_id=whiteboard_id)
+        if previous is None:
+            return None
+        previous_by_uuid = {w['uuid']: w for w in previous}
+        uuids = operation.get_uuids()
+        deleted_uuids = [uuid for uuid in uuids if uuid not in previous_by_uuid]
+        restored = WhiteboardElement.restore(
+            deleted_uuids=deleted_uuids,
+            whiteboard_elements=[previous_by_uuid[uuid] for uuid in uuids if uuid in previous_by_uuid],
+            whiteboard_id=whiteboard_id,
+        )
+        return restored, deleted_uuids
+
     @classmethod
     def undelete(cls, whiteboard_id):
         whiteboard = cls.query.filter_by(id=whiteboard_id).first()
@@ -354,6 +393,7 @@ class Whiteboard(Base):
             whiteboard.deleted_at = None
             whiteboard.updated_at = utc_now()
             std_commit()
+            whiteboard_authorization_cache.invalidate_where(1, whiteboard.id)
         return whiteboard
 
     @classmethod
@@ -363,6 +403,7 @@ class Whiteboard(Base):
         whiteboard.users = users
         db.session.add(whiteboard)
         std_commit()
+        whiteboard_authorization_cache.invalidate_where(1, whiteboard.id)
         return whiteboard
 
     @classmethod
@@ -377,7 +418,7 @@ class Whiteboard(Base):
         return True
 
     def to_api_json(self):
-        user_ids_online = [session.user_id for session in WhiteboardSession.find(self.id)]
+        user_ids_online = whiteboard_presence.get_user_ids_online([self.id]).get(self.id, set())
 
         def _user_api_json(user):
             return {
@@ -414,7 +455,10 @@ def _get_whiteboards_where_clause(
         where_clause += ' AND w.course_id = :course_id'
     if not include_deleted:
         where_clause += ' AND w.deleted_at IS NULL'
-    if keywords:
+    if params.get('tsquery'):
+        where_clause += f' AND {whiteboard_search_vector} @@ {tsquery_sql()}'
+    elif keywords:
+        # No word to search on, e.g. punctuation only.
         where_clause += ' AND (w.title ILIKE :keywords)'
     if user_id:
         where_clause += ' AND u.id = :user_id'
@@ -438,7 +482,61 @@ def _get_whiteboards_where_clause(
     return where_clause
 
 
+def _apply_pending_edit(edit, whiteboard_element):
+    if 'patch' in edit:
+        whiteboard_element['element'] = {**merge_patch(whiteboard_element['element'], edit['patch']), 'uuid': whiteboard_element['uuid']}
+    else:
+        whiteboard_element['assetId'] = edit.get('assetId')
+        whiteboard_element['element'] = edit['element']
+
+
+def _get_pending_whiteboard_elements(whiteboard_id):
+    # Edits not yet saved: held by the coalescer for its current window, or in whiteboard_state.
+    return whiteboard_state.get_pending(whiteboard_id, buffered=socket_event_coalescer.get_pending(whiteboard_id))
+
+
+def _get_whiteboard_elements_in_viewport(viewport, whiteboard_id):
+    whiteboard_elements = WhiteboardElement.find_in_viewport(viewport=viewport, whiteboard_id=whiteboard_id)
+    asset_ids = list({w['assetId'] for w in whiteboard_elements if w['assetId']})
+    if asset_ids:
+        deleted_asset_ids = Asset.get_deleted_asset_ids(asset_ids)
+        whiteboard_elements = [w for w in whiteboard_elements if w['assetId'] not in deleted_asset_ids]
+    # Live edits not yet saved to the db take precedence. Elements moved into view arrive with the remaining chunks.
+    pending = _get_pending_whiteboard_elements(whiteboard_id)
+    for whiteboard_element in whiteboard_elements:
+        edit = pending.get(whiteboard_element['uuid']) if pending else None
+        if edit:
+            _apply_pending_edit(edit, whiteboard_element)
+    return whiteboard_elements
+
+
 def _get_sorted_whiteboard_elements(whiteboard_id):
-    whiteboard_elements = [e.to_api_json() for e in WhiteboardElement.find_by_whiteboard_id(whiteboard_id)]
+    whiteboard_elements = WhiteboardSnapshot.get_whiteboard_elements(whiteboard_id)
+    # No deleted assets allowed on whiteboards.
+    asset_ids = list({w['assetId'] for w in whiteboard_elements if w['assetId']})
+    if asset_ids:
+        deleted_asset_ids = Asset.get_deleted_asset_ids(asset_ids)
+        whiteboard_elements = [w for w in whiteboard_elements if w['assetId'] not in deleted_asset_ids]
     whiteboard_elements.sort(key=lambda w: w['zIndex'])
+    # Live edits not yet saved to the db take precedence. New elements go to the top of the stack.
+    pending = _get_pending_whiteboard_elements(whiteboard_id)
+    if pending:
+        for whiteboard_element in whiteboard_elements:
+            edit = pending.pop(whiteboard_element['uuid'], None)
+            if edit:
+                _apply_pending_edit(edit, whiteboard_element)
+        next_available_z_index = whiteboard_elements[-1]['zIndex'] + 1 if whiteboard_elements else 0
+        # Patches left over are of elements not saved, i.e., deleted.
+        for uuid, edit in [(uuid, edit) for uuid, edit in pending.items() if 'patch' not in edit]:
+            whiteboard_elements.append({
+                'id': None,
+                'assetId': edit.get('assetId'),
+                'createdAt': None,
+                'element': edit['element'],
+                'updatedAt': None,
+                'uuid': uuid,
+                'whiteboardId': int(whiteboard_id),
+                'zIndex': next_available_z_index,
+            })
+            next_available_z_index += 1
     return whiteboard_elements
@@ -23,15 +23,29 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from sqlalchemy import and_, ForeignKey, Integer
+import json
+
+from sqlalchemy import and_, Float, ForeignKey, Integer
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.sql import asc, text
 from squiggy import db, std_commit
-from squiggy.lib.util import isoformat
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.util import isoformat, merge_patch
+from squiggy.lib.viewport import get_bounding_box
 from squiggy.models.asset import Asset
 from squiggy.models.base import Base
-from squiggy.models.whiteboard_session import WhiteboardSession
+from squiggy.models.whiteboard_operation import WhiteboardOperation
+
+# Elements of unknown size get an infinite bounding box, i.e., they are in every viewport.
+BOUNDING_BOX_COLUMNS = """
+    COALESCE(r.min_x, '-Infinity'), COALESCE(r.min_y, '-Infinity'), COALESCE(r.max_x, 'Infinity'), COALESCE(r.max_y, 'Infinity')
+"""
+RETURNING_COLUMNS = 'e.id, e.asset_id, e.element, e.uuid, e.whiteboard_id, e.z_index, e.created_at, e.updated_at'
+# Below this gap between neighboring z_index values, doubles lose precision.
+Z_INDEX_MIN_GAP = 1e-9
+# Below this gap, the whiteboard is renumbered in the transaction which made the gap.
+Z_INDEX_REBALANCE_GAP = 1e-6
 
 
 class WhiteboardElement(Base):
@@ -42,14 +56,26 @@ class WhiteboardElement(Base):
     element = db.Column('element', JSONB, nullable=False)
     uuid = db.Column('uuid', db.String(255), nullable=False)
     whiteboard_id = db.Column('whiteboard_id', Integer, ForeignKey('whiteboards.id'), nullable=False)
-    z_index = db.Column('z_index', Integer, nullable=False)
+    z_index = db.Column('z_index', Float, nullable=False)
+    # Bounding box, indexed (GiST) for viewport queries.
+    min_x = db.Column('min_x', Float)
+    min_y = db.Column('min_y', Float)
+    max_x = db.Column('max_x', Float)
+    max_y = db.Column('max_y', Float)
 
-    __table_args__ = (db.UniqueConstraint(
-        'created_at',
-        'uuid',
-        'whiteboard_id',
-        name='whiteboard_elements_created_at_uuid_whiteboard_id_idx',
-    ),)
+    __table_args__ = (
+        db.UniqueConstraint(
+            'created_at',
+            'uuid',
+            'whiteboard_id',
+            name='whiteboard_elements_created_at_uuid_whiteboard_id_idx',
+        ),
+        db.UniqueConstraint(
+            'uuid',
+            'whiteboard_id',
+            name='whiteboard_elements_uuid_whiteboard_id_idx',
+        ),
+    )
 
     def __init__(
             self,
@@ -64,6 +90,7 @@ class WhiteboardElement(Base):
         self.uuid = uuid
         self.whiteboard_id = whiteboard_id
         self.z_index = z_index
+        self.set_bounding_box()
 
     @classmethod
     def find_all(cls, uuids, whiteboard_id):
@@ -75,25 +102,29 @@ class WhiteboardElement(Base):
         asset_ids = [r.asset_id for r in results if r.asset_id]
         # No deleted assets allowed on whiteboards.
         if asset_ids:
-            deleted_asset_ids = {r[0] for r in db.session.query(Asset.id).filter(Asset.id.in_(asset_ids), Asset.deleted_at.isnot(None)).all()}
+            deleted_asset_ids = Asset.get_deleted_asset_ids(asset_ids)
             if deleted_asset_ids:
                 results = [r for r in results if not r.asset_id or r.asset_id not in deleted_asset_ids]
         return results
 
     @classmethod
-    def get_id_per_uuid(cls, uuid):
-        query = text('SELECT id FROM whiteboard_elements WHERE uuid = :uuid')
-        result = db.session.execute(query, {'uuid': uuid}).first()
-        std_commit()
-        return result and result['id']
+    def find_in_viewport(cls, viewport, whiteboard_id):
+        sql = f"""
+            SELECT {RETURNING_COLUMNS} FROM whiteboard_elements e
+            WHERE e.whiteboard_id = :whiteboard_id
+                AND box(point(e.min_x, e.min_y), point(e.max_x, e.max_y)) && box(point(:left, :top), point(:right, :bottom))
+            ORDER BY e.z_index
+        """
+        rows = db.session.execute(text(sql), {**viewport, 'whiteboard_id': whiteboard_id}).all()
+        return [_row_to_api_json(row) for row in rows]
 
     @classmethod
     def get_asset_usages(cls, asset_id, live_usages_only=False):
+        results = cls.query.filter_by(asset_id=asset_id).all()
         if live_usages_only:
-            query = cls.query.filter_by(asset_id=asset_id).join(WhiteboardSession, cls.whiteboard_id == WhiteboardSession.whiteboard_id)
-        else:
-            query = cls.query.filter_by(asset_id=asset_id)
-        return [r.to_api_json() for r in query.all()]
+            user_ids_online = whiteboard_presence.get_user_ids_online({r.whiteboard_id for r in results})
+            results = [r for r in results if user_ids_online.get(r.whiteboard_id)]
+        return [r.to_api_json() for r in results]
 
     @classmethod
     def create(cls, element, uuid, whiteboard_id, z_index, asset_id=None):
@@ -108,6 +139,9 @@ class WhiteboardElement(Base):
             z_index=z_index,
         )
         db.session.add(whiteboard_element)
+        # Flush for id and timestamps. The element and its operation commit together.
+        db.session.flush()
+        WhiteboardOperation.append_upsert(whiteboard_elements=[whiteboard_element.to_api_json()], whiteboard_id=whiteboard_id)
         std_commit()
         return whiteboard_element
 
@@ -115,6 +149,7 @@ class WhiteboardElement(Base):
     def delete_all(cls, uuids, whiteboard_id):
         sql = 'DELETE FROM whiteboard_elements WHERE uuid = ANY(:uuids) AND whiteboard_id = :whiteboard_id'
         db.session.execute(text(sql), {'uuids': uuids, 'whiteboard_id': whiteboard_id})
+        WhiteboardOperation.append_delete(uuids=uuids, whiteboard_id=whiteboard_id)
         std_commit()
 
     @classmethod
@@ -126,43 +161,296 @@ class WhiteboardElement(Base):
             # Ensure consistent uuid.
             element['uuid'] = uuid
             whiteboard_element.element = element
+            whiteboard_element.set_bounding_box()
 
             db.session.add(whiteboard_element)
+            db.session.flush()
+            WhiteboardOperation.append_upsert(whiteboard_elements=[whiteboard_element.to_api_json()], whiteboard_id=whiteboard_id)
             std_commit()
             return whiteboard_element
 
+    @classmethod
+    def upsert_all(cls, whiteboard_elements, whiteboard_id, versions_by_uuid=None):
+        # Last write wins if the payload carries the same uuid more than once. Across writes, an element is written only
+        # if its version is newer than the stored one; elements without version (0) are written regardless and keep the
+        # stored version. Rows not written are left out of results. No commit.
+        versions_by_uuid = versions_by_uuid or {}
+        whiteboard_elements_by_uuid = {}
+        for whiteboard_element in whiteboard_elements:
+            element = whiteboard_element['element']
+            uuid = element['uuid']
+            whiteboard_elements_by_uuid[uuid] = {
+                'asset_id': whiteboard_element.get('assetId'),
+                'element': element,
+                'uuid': uuid,
+                'version': versions_by_uuid.get(uuid, 0),
+                **_get_bounding_box_record(element),
+            }
+        if not whiteboard_elements_by_uuid:
+            return [], set()
+
+        # One query sorts the payload into inserts and updates and finds the top of the z-index stack.
+        sql = """
+            SELECT
+                ARRAY(
+                    SELECT uuid FROM whiteboard_elements
+                    WHERE whiteboard_id = :whiteboard_id AND uuid = ANY(:uuids)
+                ) AS existing_uuids,
+                (SELECT MAX(z_index) FROM whiteboard_elements WHERE whiteboard_id = :whiteboard_id) AS max_z_index
+        """
+        params = {
+            'uuids': list(whiteboard_elements_by_uuid.keys()),
+            'whiteboard_id': whiteboard_id,
+        }
+        row = db.session.execute(text(sql), params).first()
+        existing_uuids = set(row['existing_uuids'] or [])
+        next_available_z_index = 0 if row['max_z_index'] is None else row['max_z_index'] + 1
+
+        records = []
+        for uuid, record in whiteboard_elements_by_uuid.items():
+            # Ensure consistent uuid.
+            record['element']['uuid'] = uuid
+            if uuid in existing_uuids:
+                # Placeholder only: the ON CONFLICT clause below leaves z_index of existing rows alone.
+                record['z_index'] = 0
+            else:
+                record['z_index'] = next_available_z_index
+                next_available_z_index += 1
+            records.append(record)
+
+        # One statement writes everything. Postgres sets xmax = 0 on freshly inserted rows.
+        sql = f"""
+            INSERT INTO whiteboard_elements AS e (
+                asset_id, element, uuid, version, whiteboard_id, z_index, min_x, min_y, max_x, max_y
+            )
+            SELECT r.asset_id, r.element, r.uuid, r.version, :whiteboard_id, r.z_index, {BOUNDING_BOX_COLUMNS}
+            FROM json_to_recordset(CAST(:records AS JSON)) AS r(
+                asset_id INTEGER, element JSON, uuid VARCHAR, version BIGINT, z_index DOUBLE PRECISION,
+                min_x DOUBLE PRECISION, min_y DOUBLE PRECISION, max_x DOUBLE PRECISION, max_y DOUBLE PRECISION
+            )
+            ON CONFLICT (uuid, whiteboard_id) DO UPDATE
+                SET asset_id = EXCLUDED.asset_id, element = EXCLUDED.element, updated_at = now(),
+                    version = GREATEST(e.version, EXCLUDED.version),
+                    min_x = EXCLUDED.min_x, min_y = EXCLUDED.min_y, max_x = EXCLUDED.max_x, max_y = EXCLUDED.max_y
+                WHERE EXCLUDED.version = 0 OR EXCLUDED.version > e.version
+            RETURNING {RETURNING_COLUMNS}, (e.xmax = 0) AS inserted
+        """
+        rows = db.session.execute(
+            text(sql),
+            {
+                'records': json.dumps(records),
+                'whiteboard_id': whiteboard_id,
+            },
+        ).all()
+        results = [_row_to_api_json(row) for row in rows]
+        if results:
+            WhiteboardOperation.append_upsert(whiteboard_elements=results, whiteboard_id=whiteboard_id)
+        inserted_uuids = {row['uuid'] for row in rows if row['inserted']}
+        return results, inserted_uuids
+
+    @classmethod
+    def patch_all(cls, patches_by_uuid, versions_by_uuid, whiteboard_id):
+        # Merge each patch (changed properties of the element, None to remove) into the stored element. Rows are locked
+        # from read to write, so concurrent patches of an element are all merged. As with upsert_all, a patch older than
+        # the stored version is not written, and neither is a patch of an element not in the db. No commit.
+        if not patches_by_uuid:
+            return []
+        sql = """
+            SELECT element, uuid, version FROM whiteboard_elements
+            WHERE whiteboard_id = :whiteboard_id AND uuid = ANY(:uuids)
+            ORDER BY id
+            FOR UPDATE
+        """
+        rows = db.session.execute(text(sql), {'uuids': list(patches_by_uuid.keys()), 'whiteboard_id': whiteboard_id}).all()
+        records = []
+        for row in rows:
+            uuid = row['uuid']
+            version = versions_by_uuid.get(uuid, 0)
+            if version and version <= row['version']:
+                continue
+            # Ensure consistent uuid.
+            element = {**merge_patch(row['element'], patches_by_uuid[uuid]), 'uuid': uuid}
+            records.append({
+                'element': element,
+                'uuid': uuid,
+                'version': version,
+                **_get_bounding_box_record(element),
+            })
+        if not records:
+            return []
+        sql = f"""
+            UPDATE whiteboard_elements e
+            SET element = r.element, updated_at = now(), version = GREATEST(e.version, r.version),
+                min_x = COALESCE(r.min_x, '-Infinity'), min_y = COALESCE(r.min_y, '-Infinity'),
+                max_x = COALESCE(r.max_x, 'Infinity'), max_y = COALESCE(r.max_y, 'Infinity')
+            FROM json_to_recordset(CAST(:records AS JSON)) AS r(
+                element JSON, uuid VARCHAR, version BIGINT,
+                min_x DOUBLE PRECISION, min_y DOUBLE PRECISION, max_x DOUBLE PRECISION, max_y DOUBLE PRECISION
+            )
+            WHERE e.whiteboard_id = :whiteboard_id AND e.uuid = r.uuid
+            RETURNING {RETURNING_COLUMNS}
+        """
+        rows = db.session.execute(
+            text(sql),
+            {
+                'records': json.dumps(records),
+                'whiteboard_id': whiteboard_id,
+            },
+        ).all()
+        results = [_row_to_api_json(row) for row in rows]
+        if results:
+            WhiteboardOperation.append_upsert(whiteboard_elements=results, whiteboard_id=whiteboard_id)
+        return results
+
+    @classmethod
+    def rebalance_z_indexes(cls, whiteboard_id):
+        # Renumber z_index 0, 1, 2, ... preserving order. Rows already in place are not written. No commit.
+        sql = f"""
+            UPDATE whiteboard_elements e SET z_index = r.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY z_index, id) - 1 AS position
+                FROM whiteboard_elements
+                WHERE whiteboard_id = :whiteboard_id
+            ) r
+            WHERE e.id = r.id AND e.z_index != r.position
+            RETURNING {RETURNING_COLUMNS}
+        """
+        rows = db.session.execute(text(sql), {'whiteboard_id': whiteboard_id}).all()
+        if rows:
+            WhiteboardOperation.append_upsert(whiteboard_elements=[_row_to_api_json(row) for row in rows], whiteboard_id=whiteboard_id)
+
+    @classmethod
+    def reconcile_asset_images(cls, asset_ids):
+        # Point src of elements of the given assets at the current image of their asset. Signatures (query string) are
+        # ignored when comparing. Returns updated elements (api_json) keyed by whiteboard_id.
+        if not asset_ids:
+            return {}
+        sql = f"""
+            UPDATE whiteboard_elements e
+            SET element = CAST(jsonb_set(CAST(e.element AS JSONB), '{{src}}', to_jsonb(a.image_url)) AS JSON), updated_at = now()
+            FROM assets a
+            WHERE e.id IN (
+                SELECT we.id FROM whiteboard_elements we
+                JOIN assets a ON a.id = we.asset_id
+                WHERE a.id = ANY(:asset_ids)
+                    AND a.image_url IS NOT NULL
+                    AND a.deleted_at IS NULL
+                    AND split_part(COALESCE(we.element->>'src', ''), '?', 1) != split_part(a.image_url, '?', 1)
+            )
+            AND a.id = e.asset_id
+            RETURNING {RETURNING_COLUMNS}
+        """
+        rows = db.session.execute(text(sql), {'asset_ids': asset_ids}).all()
+        whiteboard_elements_by_whiteboard_id = {}
+        for row in rows:
+            whiteboard_elements_by_whiteboard_id.setdefault(row['whiteboard_id'], []).append(_row_to_api_json(row))
+        for whiteboard_id, whiteboard_elements in whiteboard_elements_by_whiteboard_id.items():
+            WhiteboardOperation.append_upsert(whiteboard_elements=whiteboard_elements, whiteboard_id=whiteboard_id)
+        std_commit()
+        return whiteboard_elements_by_whiteboard_id
+
+    @classmethod
+    def restore(cls, whiteboard_elements, whiteboard_id, deleted_uuids=()):
+        # Write elements (api_json) as they were, z_index included, and delete those which did not exist. One transaction,
+        # one operation. Used by undo.
+        records = [
+            {
+                'asset_id': w['assetId'],
+                'element': {**w['element'], 'uuid': w['uuid']},
+                'uuid': w['uuid'],
+                'z_index': w['zIndex'],
+                **_get_bounding_box_record(w['element']),
+            } for w in whiteboard_elements
+        ]
+        if not records and not deleted_uuids:
+            return []
+        sql = f"""
+            INSERT INTO whiteboard_elements AS e (asset_id, element, uuid, whiteboard_id, z_index, min_x, min_y, max_x, max_y)
+            SELECT r.asset_id, r.element, r.uuid, :whiteboard_id, r.z_index, {BOUNDING_BOX_COLUMNS}
+            FROM json_to_recordset(CAST(:records AS JSON)) AS r(
+                asset_id INTEGER, element JSON, uuid VARCHAR, z_index DOUBLE PRECISION,
+                min_x DOUBLE PRECISION, min_y DOUBLE PRECISION, max_x DOUBLE PRECISION, max_y DOUBLE PRECISION
+            )
+            ON CONFLICT (uuid, whiteboard_id) DO UPDATE
+                SET asset_id = EXCLUDED.asset_id, element = EXCLUDED.element, z_index = EXCLUDED.z_index, updated_at = now(),
+                    min_x = EXCLUDED.min_x, min_y = EXCLUDED.min_y, max_x = EXCLUDED.max_x, max_y = EXCLUDED.max_y
+            RETURNING {RETURNING_COLUMNS}
+        """
+        rows = db.session.execute(
+            text(sql),
+            {
+                'records': json.dumps(records),
+                'whiteboard_id': whiteboard_id,
+            },
+        ).all() if records else []
+        if deleted_uuids:
+            db.session.execute(
+                text('DELETE FROM whiteboard_elements WHERE uuid = ANY(:uuids) AND whiteboard_id = :whiteboard_id'),
+                {'uuids': list(deleted_uuids), 'whiteboard_id': whiteboard_id},
+            )
+        results = [_row_to_api_json(row) for row in rows]
+        WhiteboardOperation.append_undo(deleted_uuids=deleted_uuids, whiteboard_elements=results, whiteboard_id=whiteboard_id)
+        std_commit()
+        return results
+
     @classmethod
     def update_z_indexes(cls, direction, uuids, whiteboard_id):
-        whiteboard_elements = cls.query.filter(cls.whiteboard_id == whiteboard_id).order_by(asc(cls.z_index)).all()
-        selected = list(filter(lambda w: w.uuid in uuids, whiteboard_elements))
-        others = list(filter(lambda w: w.uuid not in uuids, whiteboard_elements))
-        z_index = 0
-        if direction == 'bringForward':
-            # TODO: Implement this if customer convinces us to expand the layering feature.
-            pass
-        elif direction == 'bringToFront':
-            for whiteboard_element in others:
-                whiteboard_element.z_index = z_index
-                db.session.add(whiteboard_element)
-                z_index += 1
-            for whiteboard_element in selected:
-                whiteboard_element.z_index = z_index
-                db.session.add(whiteboard_element)
-                z_index += 1
-        elif direction == 'sendToBack':
-            for whiteboard_element in selected:
-                whiteboard_element.z_index = z_index
-                db.session.add(whiteboard_element)
-                z_index += 1
-            for whiteboard_element in others:
-                whiteboard_element.z_index = z_index
-                db.session.add(whiteboard_element)
-                z_index += 1
-        elif direction == 'sendBackwards':
-            # TODO: Implement this if customer convinces us to expand the layering feature.
-            pass
+        # Fractional z_index: selected elements are slotted between their new neighbors, keeping their relative order,
+        # and only their rows are written. If the slot was tight then the whiteboard is rebalanced before commit.
+        query = cls.query.filter(and_(cls.uuid.in_(uuids), cls.whiteboard_id == whiteboard_id)).order_by(asc(cls.z_index))
+        # A rebalance earlier in this transaction leaves loaded rows stale.
+        selected = query.populate_existing().all()
+        if not selected:
+            return
+        bounds = _get_z_index_bounds(
+            direction=direction,
+            highest=selected[-1].z_index,
+            lowest=selected[0].z_index,
+            uuids=[w.uuid for w in selected],
+            whiteboard_id=whiteboard_id,
+        )
+        if not bounds:
+            return
+        lower, upper = bounds
+        gap = (upper - lower) / (len(selected) + 1) if lower is not None and upper is not None else 1
+        if gap < Z_INDEX_MIN_GAP:
+            # Out of precision. Rebalance now and try again.
+            cls.rebalance_z_indexes(whiteboard_id)
+            return cls.update_z_indexes(direction=direction, uuids=uuids, whiteboard_id=whiteboard_id)
+
+        if lower is None and upper is None:
+            z_indexes = list(range(len(selected)))
+        elif upper is None:
+            z_indexes = [lower + index + 1 for index in range(len(selected))]
+        elif lower is None:
+            z_indexes = [upper - len(selected) + index for index in range(len(selected))]
+        else:
+            z_indexes = [lower + gap * (index + 1) for index in range(len(selected))]
+        sql = f"""
+            UPDATE whiteboard_elements e SET z_index = u.z_index, updated_at = now()
+            FROM unnest(CAST(:uuids AS VARCHAR[]), CAST(:z_indexes AS DOUBLE PRECISION[])) AS u(uuid, z_index)
+            WHERE e.whiteboard_id = :whiteboard_id AND e.uuid = u.uuid
+            RETURNING {RETURNING_COLUMNS}
+        """
+        rows = db.session.execute(
+            text(sql),
+            {
+                'uuids': [w.uuid for w in selected],
+                'whiteboard_id': whiteboard_id,
+                'z_indexes': z_indexes,
+            },
+        ).all()
+        WhiteboardOperation.append_upsert(whiteboard_elements=[_row_to_api_json(row) for row in rows], whiteboard_id=whiteboard_id)
+        if gap < Z_INDEX_REBALANCE_GAP:
+            cls.rebalance_z_indexes(whiteboard_id)
         std_commit()
-        return whiteboard_elements
+
+    def set_bounding_box(self):
+        bounding_box = get_bounding_box(self.element)
+        if bounding_box:
+            self.min_x, self.min_y, self.max_x, self.max_y = bounding_box
+        else:
+            self.min_x, self.min_y, self.max_x, self.max_y = float('-inf'), float('-inf'), float('inf'), float('inf')
 
     def to_api_json(self):
         # Correct any out-of-sync uuid surprises.
@@ -180,3 +468,50 @@ class WhiteboardElement(Base):
             'whiteboardId': self.whiteboard_id,
             'zIndex': self.z_index,
         }
+
+
+def _get_z_index_bounds(direction, highest, lowest, uuids, whiteboard_id):
+    # Returns (lower, upper) z_index between which the selection goes, where None means unbounded; or None if no move.
+    params = {
+        'highest': highest,
+        'lowest': lowest,
+        'uuids': uuids,
+        'whiteboard_id': whiteboard_id,
+    }
+    others = 'whiteboard_id = :whiteboard_id AND uuid != ALL(:uuids)'
+    if direction == 'bringToFront':
+        row = db.session.execute(text(f'SELECT MAX(z_index) AS z_index FROM whiteboard_elements WHERE {others}'), params).first()
+        return row['z_index'], None
+    elif direction == 'sendToBack':
+        row = db.session.execute(text(f'SELECT MIN(z_index) AS z_index FROM whiteboard_elements WHERE {others}'), params).first()
+        return None, row['z_index']
+    elif direction == 'bringForward':
+        # Move above the next element up, which is not selected.
+        sql = f'SELECT z_index FROM whiteboard_elements WHERE {others} AND z_index > :highest ORDER BY z_index LIMIT 2'
+        z_indexes = [row['z_index'] for row in db.session.execute(text(sql), params)]
+        return (z_indexes[0], z_indexes[1] if len(z_indexes) > 1 else None) if z_indexes else None
+    elif direction == 'sendBackwards':
+        # Move below the next element down, which is not selected.
+        sql = f'SELECT z_index FROM whiteboard_elements WHERE {others} AND z_index < :lowest ORDER BY z_index DESC LIMIT 2'
+        z_indexes = [row['z_index'] for row in db.session.execute(text(sql), params)]
+        return (z_indexes[1] if len(z_indexes) > 1 else None, z_indexes[0]) if z_indexes else None
+    else:
+        raise ValueError(f'Invalid direction: {direction}')
+
+
+def _get_bounding_box_record(element):
+    bounding_box = get_bounding_box(element)
+    return dict(zip(['min_x', 'min_y', 'max_x', 'max_y'], bounding_box or [None] * 4))
+
+
+def _row_to_api_json(row):
+    return {
+        'id': row['id'],
+        'assetId': row['asset_id'],
+        'createdAt': isoformat(row['created_at']),
+        'element': row['element'],
+        'updatedAt': isoformat(row['updated_at']),
+        'uuid': row['uuid'],
+        'whiteboardId': row['whiteboard_id'],
+        'zIndex': row['z_index'],
+    }
@@ -0,0 +1,149 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+
+from sqlalchemy import ForeignKey, Integer, text
+from sqlalchemy.dialects.postgresql import JSONB
+from squiggy import db
+from squiggy.lib.util import isoformat
+from squiggy.models.base import Base
+
+
+class WhiteboardOperation(Base):
+    __tablename__ = 'whiteboard_operations'
+
+    # Append-only log of changes to whiteboard elements. Each entry holds after-images: upserted elements, deleted uuids or,
+    # in the case of undo, both.
+    id = db.Column(db.Integer, nullable=False, primary_key=True)  # noqa: A003
+    operation_type = db.Column('operation_type', db.String(32), nullable=False)
+    payload = db.Column('payload', JSONB, nullable=False)
+    version = db.Column('version', Integer, nullable=False)
+    whiteboard_id = db.Column('whiteboard_id', Integer, ForeignKey('whiteboards.id'), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            'whiteboard_id',
+            'version',
+            name='whiteboard_operations_whiteboard_id_version_idx',
+        ),
+    )
+
+    def __init__(
+            self,
+            operation_type,
+            payload,
+            version,
+            whiteboard_id,
+    ):
+        self.operation_type = operation_type
+        self.payload = payload
+        self.version = version
+        self.whiteboard_id = whiteboard_id
+
+    @classmethod
+    def append(cls, operation_type, payload, whiteboard_id):
+        # No commit: the operation belongs to the transaction of the change it describes. The version counter lives on
+        # the whiteboard row, which serializes concurrent writers.
+        sql = """
+            WITH v AS (
+                UPDATE whiteboards SET version = version + 1 WHERE id = :whiteboard_id RETURNING version
+            )
+            INSERT INTO whiteboard_operations (operation_type, payload, version, whiteboard_id)
+            SELECT :operation_type, CAST(:payload AS JSONB), v.version, :whiteboard_id FROM v
+            RETURNING version
+        """
+        row = db.session.execute(
+            text(sql),
+            {
+                'operation_type': operation_type,
+                'payload': json.dumps(payload),
+                'whiteboard_id': whiteboard_id,
+            },
+        ).first()
+        return row and row['version']
+
+    @classmethod
+    def append_delete(cls, uuids, whiteboard_id):
+        return cls.append(operation_type='delete', payload={'uuids': list(uuids)}, whiteboard_id=whiteboard_id)
+
+    @classmethod
+    def append_undo(cls, deleted_uuids, whiteboard_elements, whiteboard_id):
+        return cls.append(
+            operation_type='undo',
+            payload={'uuids': list(deleted_uuids), 'whiteboardElements': whiteboard_elements},
+            whiteboard_id=whiteboard_id,
+        )
+
+    @classmethod
+    def append_upsert(cls, whiteboard_elements, whiteboard_id):
+        return cls.append(operation_type='upsert', payload={'whiteboardElements': whiteboard_elements}, whiteboard_id=whiteboard_id)
+
+    @classmethod
+    def delete_before(cls, version, whiteboard_id):
+        sql = 'DELETE FROM whiteboard_operations WHERE whiteboard_id = :whiteboard_id AND version < :version'
+        db.session.execute(text(sql), {'version': version, 'whiteboard_id': whiteboard_id})
+
+    @classmethod
+    def find_by_version(cls, version, whiteboard_id):
+        return cls.query.filter_by(version=version, whiteboard_id=whiteboard_id).first()
+
+    @classmethod
+    def find_range(cls, whiteboard_id, after_version, up_to_version=None):
+        query = cls.query.filter(cls.whiteboard_id == whiteboard_id, cls.version > after_version)
+        if up_to_version is not None:
+            query = query.filter(cls.version <= up_to_version)
+        return query.order_by(cls.version).all()
+
+    @classmethod
+    def get_current_version(cls, whiteboard_id):
+        row = db.session.execute(text('SELECT version FROM whiteboards WHERE id = :whiteboard_id'), {'whiteboard_id': whiteboard_id}).first()
+        return row['version'] if row else 0
+
+    @classmethod
+    def get_history(cls, whiteboard_id, limit=50):
+        return cls.query.filter_by(whiteboard_id=whiteboard_id).order_by(cls.version.desc()).limit(limit).all()
+
+    def get_uuids(self):
+        return [w['uuid'] for w in self.payload.get('whiteboardElements', [])] + self.payload.get('uuids', [])
+
+    def to_api_json(self):
+        return {
+            'createdAt': isoformat(self.created_at),
+            'operationType': self.operation_type,
+            'uuids': self.get_uuids(),
+            'version': self.version,
+            'whiteboardId': self.whiteboard_id,
+        }
+
+
+def replay_operations(whiteboard_elements_by_uuid, operations):
+    # Apply operations, in order, to whiteboard elements keyed by uuid. Modifies and returns the dict.
+    for operation in operations:
+        for uuid in operation.payload.get('uuids', []):
+            whiteboard_elements_by_uuid.pop(uuid, None)
+        for whiteboard_element in operation.payload.get('whiteboardElements', []):
+            whiteboard_elements_by_uuid[whiteboard_element['uuid']] = whiteboard_element
+    return whiteboard_elements_by_uuid
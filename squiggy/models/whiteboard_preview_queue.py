@@ -0,0 +1,124 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy import ForeignKey, Integer, text
+from squiggy import db, std_commit
+from squiggy.logger import logger
+from squiggy.models.base import Base
+
+
+class WhiteboardPreviewQueue(Base):
+    __tablename__ = 'whiteboard_preview_queue'
+
+    # One row per whiteboard due a preview image. Any app server may claim rows; a claim expires at 'locked_until'.
+    whiteboard_id = db.Column('whiteboard_id', Integer, ForeignKey('whiteboards.id'), nullable=False, primary_key=True)
+    attempts = db.Column('attempts', Integer, nullable=False, default=0)
+    locked_until = db.Column('locked_until', db.DateTime)
+    queued_at = db.Column('queued_at', db.DateTime, nullable=False)
+
+    @classmethod
+    def claim(cls, limit, max_attempts, quiet_seconds, visibility_timeout):
+        # Whiteboards unchanged for 'quiet_seconds', not claimed by others, longest waiting first.
+        sql = """
+            UPDATE whiteboard_preview_queue q
+            SET attempts = q.attempts + 1, locked_until = now() + make_interval(secs => :visibility_timeout), updated_at = now()
+            FROM (
+                SELECT whiteboard_id FROM whiteboard_preview_queue
+                WHERE queued_at <= now() - make_interval(secs => :quiet_seconds)
+                    AND (locked_until IS NULL OR locked_until < now())
+                    AND attempts < :max_attempts
+                ORDER BY queued_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            ) due
+            WHERE q.whiteboard_id = due.whiteboard_id
+            RETURNING q.whiteboard_id, q.attempts, q.queued_at
+        """
+        params = {
+            'limit': limit,
+            'max_attempts': max_attempts,
+            'quiet_seconds': quiet_seconds,
+            'visibility_timeout': visibility_timeout,
+        }
+        # Claims abandoned on the final attempt, e.g. by a server restart, are dropped.
+        db.session.execute(
+            text('DELETE FROM whiteboard_preview_queue WHERE attempts >= :max_attempts AND locked_until < now()'),
+            {'max_attempts': max_attempts},
+        )
+        rows = db.session.execute(text(sql), params).all()
+        std_commit()
+        return [
+            {
+                'attempts': row['attempts'],
+                'queuedAt': row['queued_at'],
+                'whiteboardId': row['whiteboard_id'],
+            } for row in sorted(rows, key=lambda r: r['queued_at'])
+        ]
+
+    @classmethod
+    def complete(cls, queued_at, whiteboard_id):
+        # If the whiteboard changed since it was claimed, it goes back in the queue.
+        sql = 'DELETE FROM whiteboard_preview_queue WHERE whiteboard_id = :whiteboard_id AND queued_at = :queued_at'
+        result = db.session.execute(text(sql), {'queued_at': queued_at, 'whiteboard_id': whiteboard_id})
+        if not result.rowcount:
+            sql = """
+                UPDATE whiteboard_preview_queue SET attempts = 0, locked_until = NULL, updated_at = now()
+                WHERE whiteboard_id = :whiteboard_id
+            """
+            db.session.execute(text(sql), {'whiteboard_id': whiteboard_id})
+        std_commit()
+
+    @classmethod
+    def enqueue(cls, whiteboard_id):
+        # No commit: the whiteboard is queued in the transaction which changed it.
+        sql = """
+            INSERT INTO whiteboard_preview_queue (whiteboard_id, attempts, queued_at, created_at, updated_at)
+            VALUES (:whiteboard_id, 0, now(), now(), now())
+            ON CONFLICT (whiteboard_id) DO UPDATE SET attempts = 0, queued_at = now(), updated_at = now()
+        """
+        db.session.execute(text(sql), {'whiteboard_id': whiteboard_id})
+
+    @classmethod
+    def fail(cls, max_attempts, retry_seconds, whiteboard_id):
+        # Retry with linear backoff, then give up.
+        sql = """
+            DELETE FROM whiteboard_preview_queue
+            WHERE whiteboard_id = :whiteboard_id AND attempts >= :max_attempts
+            RETURNING whiteboard_id
+        """
+        if db.session.execute(text(sql), {'max_attempts': max_attempts, 'whiteboard_id': whiteboard_id}).first():
+            logger.error(f'Whiteboard {whiteboard_id} gets no preview after {max_attempts} attempts.')
+        else:
+            sql = """
+                UPDATE whiteboard_preview_queue
+                SET locked_until = now() + make_interval(secs => :retry_seconds * attempts), updated_at = now()
+                WHERE whiteboard_id = :whiteboard_id
+            """
+            db.session.execute(text(sql), {'retry_seconds': retry_seconds, 'whiteboard_id': whiteboard_id})
+        std_commit()
+
+    @classmethod
+    def get_depth(cls):
+        return db.session.execute(text('SELECT COUNT(*) FROM whiteboard_preview_queue')).scalar()
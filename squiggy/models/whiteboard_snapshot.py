@@ -0,0 +1,164 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import zlib
+
+from flask import current_app as app
+from sqlalchemy import ForeignKey, Integer, LargeBinary, text
+from squiggy import db, std_commit
+from squiggy.models.base import Base
+from squiggy.models.whiteboard_operation import replay_operations, WhiteboardOperation
+
+
+class WhiteboardSnapshot(Base):
+    __tablename__ = 'whiteboard_snapshots'
+
+    # Compressed JSON of all elements of a whiteboard as of a version of its operation log.
+    whiteboard_id = db.Column('whiteboard_id', Integer, ForeignKey('whiteboards.id'), nullable=False, primary_key=True)
+    version = db.Column('version', Integer, nullable=False, primary_key=True)
+    data = db.Column('data', LargeBinary, nullable=False)
+
+    def __init__(
+            self,
+            data,
+            version,
+            whiteboard_id,
+    ):
+        self.data = data
+        self.version = version
+        self.whiteboard_id = whiteboard_id
+
+    @classmethod
+    def create(cls, version, whiteboard_elements, whiteboard_id):
+        cls._insert(version=version, whiteboard_elements=whiteboard_elements, whiteboard_id=whiteboard_id)
+        std_commit()
+
+    @classmethod
+    def compact(cls, whiteboard_id):
+        # Snapshot the latest version, then prune. Called by housekeeping only: loads never write.
+        whiteboard_id = int(whiteboard_id)
+        snapshot = cls.find_latest(whiteboard_id=whiteboard_id)
+        operations = WhiteboardOperation.find_range(
+            after_version=snapshot.version if snapshot else 0,
+            whiteboard_id=whiteboard_id,
+        )
+        if not operations:
+            return
+        whiteboard_elements_by_uuid = {w['uuid']: w for w in snapshot.to_whiteboard_elements()} if snapshot else {}
+        replay_operations(whiteboard_elements_by_uuid, operations)
+        cls._insert(
+            version=operations[-1].version,
+            whiteboard_elements=list(whiteboard_elements_by_uuid.values()),
+            whiteboard_id=whiteboard_id,
+        )
+        cls._prune(whiteboard_id)
+        std_commit()
+
+    @classmethod
+    def find_latest(cls, whiteboard_id, max_version=None):
+        query = cls.query.filter(cls.whiteboard_id == whiteboard_id)
+        if max_version is not None:
+            query = query.filter(cls.version <= max_version)
+        return query.order_by(cls.version.desc()).first()
+
+    @classmethod
+    def get_whiteboard_elements(cls, whiteboard_id, version=None):
+        # Elements (api_json) as of the given version, default is latest: a snapshot read plus a replay of the log. Read-only.
+        whiteboard_id = int(whiteboard_id)
+        snapshot = cls.find_latest(whiteboard_id=whiteboard_id, max_version=version)
+        if snapshot:
+            snapshot_version = snapshot.version
+            whiteboard_elements_by_uuid = {w['uuid']: w for w in snapshot.to_whiteboard_elements()}
+        elif version is None:
+            # Every whiteboard gets a snapshot when created, or by migration. Without one, the log is the whole history.
+            snapshot_version = 0
+            whiteboard_elements_by_uuid = {}
+        else:
+            # History before the oldest snapshot is gone.
+            return None
+        operations = WhiteboardOperation.find_range(
+            after_version=snapshot_version,
+            up_to_version=version,
+            whiteboard_id=whiteboard_id,
+        )
+        replay_operations(whiteboard_elements_by_uuid, operations)
+        return list(whiteboard_elements_by_uuid.values())
+
+    @classmethod
+    def get_whiteboard_ids_due(cls, limit):
+        # Whiteboards whose operation log has grown by a snapshot interval, or more, since their latest snapshot.
+        sql = """
+            SELECT w.id FROM whiteboards w
+            WHERE w.version - COALESCE((SELECT MAX(s.version) FROM whiteboard_snapshots s WHERE s.whiteboard_id = w.id), 0) >= :interval
+            ORDER BY w.id
+            LIMIT :limit
+        """
+        params = {
+            'interval': app.config['WHITEBOARD_SNAPSHOT_INTERVAL'],
+            'limit': limit,
+        }
+        return [row['id'] for row in db.session.execute(text(sql), params)]
+
+    @classmethod
+    def _insert(cls, version, whiteboard_elements, whiteboard_id):
+        sql = """
+            INSERT INTO whiteboard_snapshots (data, version, whiteboard_id)
+            VALUES (:data, :version, :whiteboard_id)
+            ON CONFLICT (whiteboard_id, version) DO NOTHING
+        """
+        params = {
+            'data': zlib.compress(json.dumps(whiteboard_elements).encode()),
+            'version': version,
+            'whiteboard_id': whiteboard_id,
+        }
+        db.session.execute(text(sql), params)
+
+    @classmethod
+    def _prune(cls, whiteboard_id):
+        # Keep a limited number of snapshots, and the operation log back to the oldest of them, for history and undo.
+        sql = """
+            SELECT version FROM whiteboard_snapshots
+            WHERE whiteboard_id = :whiteboard_id
+            ORDER BY version DESC
+            OFFSET :offset LIMIT 1
+        """
+        params = {
+            'offset': app.config['WHITEBOARD_SNAPSHOTS_RETAINED'] - 1,
+            'whiteboard_id': whiteboard_id,
+        }
+        row = db.session.execute(text(sql), params).first()
+        if row:
+            oldest_version = row['version']
+            db.session.execute(
+                text('DELETE FROM whiteboard_snapshots WHERE whiteboard_id = :whiteboard_id AND version < :version'),
+                {'version': oldest_version, 'whiteboard_id': whiteboard_id},
+            )
+            WhiteboardOperation.delete_before(version=oldest_version + 1, whiteboard_id=whiteboard_id)
+
+    def to_whiteboard_elements(self):
+        # Snapshots written by the 20230324 migration hold uncompressed JSON.
+        data = bytes(self.data)
+        return json.loads(data if data[:1] == b'[' else zlib.decompress(data))
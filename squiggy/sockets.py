@@ -23,13 +23,17 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from flask import request
+from flask import current_app as app, request
 from flask_login import current_user, login_required
 from flask_socketio import emit, join_room, leave_room
-from squiggy.api.api_util import get_socket_io_room, SOCKET_IO_NAMESPACE, upsert_whiteboard_elements
+from squiggy.api.api_util import get_socket_io_coalesced_room, get_socket_io_high_fidelity_room, get_socket_io_room
+from squiggy.api.api_util import patch_whiteboard_elements, stream_whiteboard_elements, upsert_whiteboard_elements
+from squiggy.lib.presence import whiteboard_presence
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
+from squiggy.lib.socket_io_util import SOCKET_IO_NAMESPACE
 from squiggy.lib.util import isoformat, utc_now
+from squiggy.lib.whiteboard_state import whiteboard_state
 from squiggy.logger import initialize_background_logger
-from squiggy.models.whiteboard_session import WhiteboardSession
 
 
 def register_sockets(socketio):
@@ -44,13 +48,19 @@ def register_sockets(socketio):
         socket_id = request.sid
         whiteboard_id = data.get('whiteboardId')
         logger.debug(f'socketio_join: {data}')
-        WhiteboardSession.update_updated_at(
+        whiteboard_presence.touch(
             socket_id=socket_id,
             user_id=current_user.user_id,
             whiteboard_id=whiteboard_id,
         )
         room = get_socket_io_room(whiteboard_id)
         join_room(room, sid=socket_id)
+        # Upserts of elements being edited arrive either as they happen or coalesced, never both.
+        if data.get('highFidelity'):
+            join_room(get_socket_io_high_fidelity_room(whiteboard_id), sid=socket_id)
+        else:
+            join_room(get_socket_io_coalesced_room(whiteboard_id), sid=socket_id)
+        whiteboard_state.join(socket_id=socket_id, whiteboard_id=whiteboard_id)
         emit(
             'join',
             current_user.user_id,
@@ -68,9 +78,14 @@ def register_sockets(socketio):
         whiteboard_id = data.get('whiteboardId')
         logger.debug(f'socketio_leave: user_id = {current_user}, whiteboard_id = {whiteboard_id}')
         socket_id = request.sid
-        WhiteboardSession.delete_all([socket_id], older_than_minutes=1440)
+        whiteboard_presence.remove(socket_id)
         room = get_socket_io_room(whiteboard_id)
         leave_room(room, sid=socket_id)
+        leave_room(get_socket_io_coalesced_room(whiteboard_id), sid=socket_id)
+        leave_room(get_socket_io_high_fidelity_room(whiteboard_id), sid=socket_id)
+        # Pending edits of this whiteboard are saved to the db.
+        socket_event_coalescer.flush(whiteboard_id)
+        whiteboard_state.leave(socket_id)
         emit(
             'leave',
             current_user.user_id,
@@ -103,6 +118,8 @@ def register_sockets(socketio):
     @socketio.on('disconnect')
     def socketio_disconnect():
         logger.debug('socketio_disconnect')
+        whiteboard_presence.remove(request.sid)
+        whiteboard_state.leave(request.sid)
 
     @socketio.on('upsert_whiteboard_element')
     @login_required
@@ -114,6 +131,31 @@ def register_sockets(socketio):
             socket_id=socket_id,
             whiteboard_elements=whiteboard_elements,
             whiteboard_id=whiteboard_id,
+            coalesce=bool(app.config['SOCKET_IO_COALESCE_WINDOW']),
+            write_behind=app.config['WHITEBOARD_STATE_WRITE_BEHIND'],
+        )
+
+    @socketio.on('patch_whiteboard_elements')
+    @login_required
+    def socketio_patch_whiteboard_elements(data):
+        # The acknowledgement carries the sequence number of the broadcast.
+        return patch_whiteboard_elements(
+            socket_id=request.sid,
+            patches=data.get('patches'),
+            whiteboard_id=data.get('whiteboardId'),
+            coalesce=bool(app.config['SOCKET_IO_COALESCE_WINDOW']),
+            write_behind=app.config['WHITEBOARD_STATE_WRITE_BEHIND'],
+        )
+
+    @socketio.on('stream_whiteboard_elements')
+    @login_required
+    def socketio_stream_whiteboard_elements(data):
+        # Chunks are emitted as 'whiteboard_elements_chunk'. Client may exclude elements it already has.
+        return stream_whiteboard_elements(
+            socket_id=request.sid,
+            exclude_uuids=data.get('excludeUuids'),
+            viewport=data.get('viewport'),
+            whiteboard_id=data.get('whiteboardId'),
         )
 
     @socketio.on_error()
@@ -31,3 +31,10 @@ export function upsertWhiteboardElements(socketId: string, whiteboardElements: a
     {socketId, whiteboardElements, whiteboardId}
   )
 }
+
+export function patchWhiteboardElements(socketId: string, patches: any[], whiteboardId: number) {
+  return axios.post(
+    `${utils.apiBaseUrl()}/api/whiteboard_elements/patch`,
+    {patches, socketId, whiteboardId}
+  )
+}
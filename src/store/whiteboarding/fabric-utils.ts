@@ -6,7 +6,12 @@ import Vue from 'vue'
 import {io} from 'socket.io-client'
 import {fabric} from 'fabric'
 import {v4 as uuidv4} from 'uuid'
-import {deleteWhiteboardElement, updateWhiteboardElementsOrder, upsertWhiteboardElements} from '@/api/whiteboard-elements'
+import {
+  deleteWhiteboardElement,
+  patchWhiteboardElements,
+  updateWhiteboardElementsOrder,
+  upsertWhiteboardElements
+} from '@/api/whiteboard-elements'
 
 const p = Vue.prototype
 
@@ -314,7 +319,7 @@ const $_addCanvasListeners = (state: any) => {
           return {assetId: o.assetId, element: o, uuid: o.uuid}
         })
         changeZOrder('bringToFront', objects, state)
-        $_broadcastUpsert(whiteboardElements, state).then(() => {
+        $_broadcastPatch(whiteboardElements, state).then(() => {
           _.each(p.$canvas.getObjects(), $_ensureWithinCanvas)
           store.dispatch('whiteboarding/setIsFitToScreen', true).then(_.noop)
         })
@@ -590,6 +595,36 @@ const $_addSocketListeners = (state: any) => {
     $_log('socket.on update_whiteboard')
   })
 
+  p.$socket.on('patch_whiteboard_elements', (data: any) => {
+    const promises: any[] = []
+    const whiteboardElements: any[] = []
+    _.each(data.patches, (patch: any) => {
+      const uuid = patch.uuid
+      const synced: any = _.find(state.whiteboard.whiteboardElements, ['uuid', uuid])
+      const existing: any = $_getCanvasElement(uuid)
+      // Patches of the same element can arrive out of order, via different servers. Skip those older than the last one
+      // applied. Elements we do not have arrive with the next load.
+      if (data.sequence > (p.$patchSequences[uuid] || 0) && synced && existing) {
+        p.$patchSequences[uuid] = data.sequence
+        const element = _.assignIn({}, synced.element, patch.element)
+        _.each(patch.element, (value: any, key: string) => {
+          if (value === null) {
+            delete element[key]
+          }
+        })
+        const whiteboardElement = {assetId: synced.assetId, element, uuid}
+        promises.push($_updateCanvasElement(existing, whiteboardElement, state).then(() => whiteboardElements.push(whiteboardElement)))
+      }
+    })
+    Promise.all(promises).then(() => {
+      $_log(`socket.on patch_whiteboard_elements: sequence = ${data.sequence}, uuids = ${_.map(whiteboardElements, 'uuid')}`)
+      store.dispatch('whiteboarding/onWhiteboardElementsUpsert', whiteboardElements).then(() => {
+        p.$canvas.requestRenderAll()
+        setCanvasDimensions(state)
+      })
+    })
+  })
+
   p.$socket.on('upsert_whiteboard_elements', (data: any) => {
     const promises: any[] = []
     const whiteboardElements: any[] = []
@@ -598,22 +633,14 @@ const $_addSocketListeners = (state: any) => {
         const element = whiteboardElement.element
         const uuid = whiteboardElement.uuid
         const existing: any = $_getCanvasElement(uuid)
+        // The store keeps the last synced copy of every element, from which we compute patches.
+        whiteboardElements.push({
+          assetId: whiteboardElement.assetId,
+          element,
+          uuid
+        })
         if (existing) {
-          // Deactivate the current group if any of the updated elements are in the current group
-          $_deactivateGroupIfOverlap(uuid)
-          updatePreviewImage(element, state, uuid).then((modified: boolean) => {
-            modified ||= $_assignIn(existing, element)
-            if (modified) {
-              $_assignIn(existing, element)
-              $_ensureWithinCanvas(existing)
-              whiteboardElements.push({
-                assetId: whiteboardElement.assetId,
-                element,
-                uuid
-              })
-            }
-            resolve()
-          })
+          $_updateCanvasElement(existing, whiteboardElement, state).then(resolve)
         } else {
           $_deserializeElement(state, element).then((e: any) => {
             // Add the element to the whiteboard canvas and move it to its appropriate index
@@ -710,6 +737,41 @@ const $_broadcastDelete = (uuids: string[], state: any) => {
   $_invokeWithSocketConnectRetry('whiteboard element delete', apiCall, state)
 }
 
+const $_broadcastPatch = (whiteboardElements: any[], state: any) => {
+  $_log('Patch whiteboard elements')
+  // Send only the properties which changed since the last sync of each element. Elements not yet synced are upserted.
+  const patches: any[] = []
+  const patched: any[] = []
+  const upserts: any[] = []
+  _.each(whiteboardElements, (whiteboardElement: any) => {
+    const synced: any = _.find(state.whiteboard.whiteboardElements, ['uuid', whiteboardElement.uuid])
+    if (synced && synced.assetId === whiteboardElement.assetId) {
+      const element = $_getChangedProperties(synced.element, whiteboardElement.element)
+      if (!_.isEmpty(element)) {
+        patches.push({element, uuid: whiteboardElement.uuid})
+        patched.push(whiteboardElement)
+      }
+    } else {
+      upserts.push(whiteboardElement)
+    }
+  })
+  const promises: any[] = []
+  if (patches.length) {
+    promises.push(new Promise<void>(resolve => {
+      const whiteboardId = state.whiteboard.id
+      const apiCall = () => patchWhiteboardElements(p.$socket.id, patches, whiteboardId).then((data: any) => {
+        _.each(data.patches, (patch: any) => p.$patchSequences[patch.uuid] = data.sequence)
+        store.dispatch('whiteboarding/onWhiteboardElementsUpsert', patched).then(resolve)
+      })
+      $_invokeWithSocketConnectRetry('whiteboard elements patch', apiCall, state)
+    }))
+  }
+  if (upserts.length) {
+    promises.push($_broadcastUpsert(upserts, state))
+  }
+  return Promise.all(promises)
+}
+
 const $_broadcastUpsert = (whiteboardElements: any[], state: any) => {
   $_log('Upsert whiteboard elements')
   return new Promise<void>(resolve => {
@@ -819,6 +881,17 @@ const $_getCanvasElement = (uuid: string) => {
   return element
 }
 
+const $_getChangedProperties = (synced: any, element: any) => {
+  // Properties of element which differ from the synced copy, with null for those removed.
+  const changed: any = {}
+  _.each(_.union(_.keys(synced), _.keys(element)), (key: string) => {
+    if (!_.isEqual(synced[key], element[key])) {
+      changed[key] = _.isUndefined(element[key]) ? null : element[key]
+    }
+  })
+  return changed
+}
+
 const $_getDaysUntilRetirement = () => {
   const now = new Date()
   const freedom = new Date('09/12/2024')
@@ -896,7 +969,7 @@ const $_initFabricPrototypes = (state: any) => {
         }
         element.uuid = element.uuid || uuidv4()
         const whiteboardElements = $_translateIntoWhiteboardElements([element])
-        $_broadcastUpsert(whiteboardElements, state).then(_.noop)
+        $_broadcastPatch(whiteboardElements, state).then(_.noop)
       } else {
         const uuid = element.get('uuid')
         p.$canvas.remove(element)
@@ -911,6 +984,8 @@ const $_initFabricPrototypes = (state: any) => {
 const $_initSocket = (state: any) => {
   $_log('Init socket')
   const baseUrl = _.replace(_.trim(apiUtils.apiBaseUrl()), /^http/, 'ws')
+  // Sequence number, per element uuid, of the last patch applied
+  p.$patchSequences = {}
   p.$socket = io(baseUrl, {
     forceNew: true,
     query: {
@@ -956,7 +1031,9 @@ const $_join = (state: any) => {
   return new Promise<void>(resolve => {
     $_log('Join')
     store.dispatch('whiteboarding/onJoin', p.$currentUser.id).then(() => {
-      p.$socket.emit('join', {whiteboardId: state.whiteboard.id})
+      // With 'highFidelity' in the URL, we get every upsert of other users as it happens. Otherwise, the server coalesces them.
+      const highFidelity = new URLSearchParams(window.location.search).has('highFidelity')
+      p.$socket.emit('join', {highFidelity, whiteboardId: state.whiteboard.id})
       resolve()
     })
   })
@@ -1099,6 +1176,24 @@ const $_tryReconnect = (state: any) => {
   })
 }
 
+const $_updateCanvasElement = (existing: any, whiteboardElement: any, state: any) => {
+  // Apply an update from another user to the element on our canvas
+  return new Promise<void>(resolve => {
+    const element = whiteboardElement.element
+    const uuid = whiteboardElement.uuid
+    // Deactivate the current group if any of the updated elements are in the current group
+    $_deactivateGroupIfOverlap(uuid)
+    updatePreviewImage(element, state, uuid).then((modified: boolean) => {
+      modified ||= $_assignIn(existing, element)
+      if (modified) {
+        $_assignIn(existing, element)
+        $_ensureWithinCanvas(existing)
+      }
+      resolve()
+    })
+  })
+}
+
 const $_zoom = (delta: number) => {
   const originalZoom = p.$canvas.getZoom()
   let newZoom = originalZoom * (0.999 ** delta)
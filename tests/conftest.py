@@ -35,8 +35,13 @@ import pytest  # noqa
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 from squiggy import std_commit
+from squiggy.lib.asset_views import asset_view_buffer
+from squiggy.lib.aws import s3_client_registry
+from squiggy.lib.cache import caches
 from squiggy.lib.login_session import LoginSession
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
 from squiggy.lib.util import is_student
+from squiggy.lib.whiteboard_state import whiteboard_state
 from squiggy.models.asset import Asset
 from squiggy.models.category import Category
 from squiggy.models.comment import Comment
@@ -168,6 +173,22 @@ def fake_sts(app):
     mock_sts().stop()
 
 
+@pytest.fixture(scope='function', autouse=True)
+def fresh_s3_client():
+    """Start each test with no cached S3 client, since moto mocks only clients created while mocking."""
+    s3_client_registry.clear()
+
+
+@pytest.fixture(scope='function', autouse=True)
+def fresh_caches():
+    """Start each test with empty caches and no pending asset views or edits, since each test rolls back the rows concerned."""
+    for cache in caches.values():
+        cache.clear()
+    asset_view_buffer.clear()
+    socket_event_coalescer.clear()
+    whiteboard_state.clear()
+
+
 @pytest.fixture(scope='function')
 def mock_asset(app, db_session):
     course = Course.find_by_canvas_course_id(
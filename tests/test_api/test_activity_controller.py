@@ -25,7 +25,9 @@ ENHANCEMENTS, OR MODIFICATIONS.
 
 import json
 
-from squiggy.models.activity_type import DEFAULT_ACTIVITY_TYPE_CONFIGURATION
+from squiggy.lib.points_recalculation import recalculate_queued_points
+from squiggy.models.activity import Activity
+from squiggy.models.activity_type import activity_type_configuration_cache, DEFAULT_ACTIVITY_TYPE_CONFIGURATION
 from squiggy.models.user import User
 
 
@@ -44,6 +46,12 @@ def api_update_configuration(client, updates=None, expected_status_code=200):
     assert response.status_code == expected_status_code
 
 
+def api_get_points_recalculation(client, expected_status_code=200):
+    response = client.get('/api/activities/points/recalculation')
+    assert response.status_code == expected_status_code
+    return response.json
+
+
 class TestGetActivityConfiguration:
     """API to get activity configuration for a course."""
 
@@ -139,6 +147,9 @@ class TestUpdateActivityConfiguration:
                 assert config['points'] == default_config['points']
                 assert config['enabled'] == default_config['enabled']
 
+        # Points are recalculated in the background.
+        assert User.find_by_id(1).points == old_points
+        assert recalculate_queued_points() == 1
         assert User.find_by_id(1).points == old_points - 6
 
         # Reset to default.
@@ -149,8 +160,47 @@ class TestUpdateActivityConfiguration:
                 {'type': 'get_asset_comment', 'enabled': True, 'points': 1},
             ],
         )
+        recalculate_queued_points()
         assert User.find_by_id(1).points == old_points
 
+    def test_cached_configuration(self, client, fake_auth):
+        """Configuration is cached per course until the next update."""
+        teacher = User.find_by_canvas_user_id(9876543)
+        fake_auth.login(teacher.id)
+        api_get_configuration(client)
+        hits = activity_type_configuration_cache.stats()['hits']
+        api_get_configuration(client)
+        assert activity_type_configuration_cache.stats()['hits'] == hits + 1
+        api_update_configuration(client, updates=[{'type': 'asset_like', 'enabled': False, 'points': 4}])
+        asset_like = next(c for c in api_get_configuration(client) if c['type'] == 'asset_like')
+        assert asset_like['enabled'] is False
+        assert asset_like['points'] == 4
+
+    def test_points_recalculation_status(self, client, fake_auth):
+        """Reports progress of the course-wide recalculation of points."""
+        teacher = User.find_by_canvas_user_id(9876543)
+        fake_auth.login(teacher.id)
+        api_update_configuration(client, updates=[{'type': 'asset_like', 'enabled': True, 'points': 4}])
+        status = api_get_points_recalculation(client)
+        assert status['status'] == 'queued'
+        assert status['usersUpdated'] == 0
+        recalculate_queued_points()
+        status = api_get_points_recalculation(client)
+        assert status['status'] == 'done'
+        assert status['usersTotal'] == status['usersUpdated'] > 0
+        assert status['finishedAt']
+
+    def test_points_per_new_activity(self, client, fake_auth):
+        """New activities score per the updated configuration, in agreement with a full recalculation."""
+        teacher = User.find_by_canvas_user_id(9876543)
+        fake_auth.login(teacher.id)
+        api_update_configuration(client, updates=[{'type': 'asset_like', 'enabled': True, 'points': 4}])
+        points = User.find_by_id(teacher.id).points
+        Activity.create(activity_type='asset_like', course_id=teacher.course_id, user_id=teacher.id, object_type='asset')
+        assert User.find_by_id(teacher.id).points == points + 4
+        Activity.recalculate_points(course_id=teacher.course_id, user_ids=[teacher.id])
+        assert User.find_by_id(teacher.id).points == points + 4
+
 
 class TestActivityCsvDownload:
 
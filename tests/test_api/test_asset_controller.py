@@ -30,12 +30,14 @@ from random import randrange
 from moto import mock_s3
 import responses
 from squiggy import std_commit
+from squiggy.lib.asset_views import asset_view_buffer
 from squiggy.lib.util import is_student, is_teaching
 from squiggy.models.activity import Activity
 from squiggy.models.asset import Asset
+from squiggy.models.comment import Comment
 from squiggy.models.course import Course
 from squiggy.models.user import User
-from tests.util import mock_s3_bucket
+from tests.util import mock_s3_bucket, override_config
 
 unauthorized_user_id = '666'
 
@@ -71,25 +73,47 @@ class TestGetAsset:
         asset = _api_get_asset(asset_id=mock_asset.id, client=client)
         assert asset['id'] == mock_asset.id
 
-    def test_increment_asset_view_count(self, client, fake_auth, mock_asset):
+    def test_increment_asset_view_count(self, app, client, fake_auth, mock_asset):
         course = Course.find_by_id(mock_asset.course_id)
         instructors = list(filter(lambda u: is_teaching(u), course.users))
-        # Instructor 1 increments view count.
+        # Instructors 1 and 2 increment view count, once views are recorded.
         fake_auth.login(instructors[0].id)
-        asset = _api_get_asset(asset_id=mock_asset.id, client=client)
-        assert asset['views'] == 1
-        # Instructor 2 increments view count.
+        _api_get_asset(asset_id=mock_asset.id, client=client)
         fake_auth.login(instructors[1].id)
-        asset = _api_get_asset(asset_id=mock_asset.id, client=client)
-        assert asset['views'] == 2
-        # Repeat views increment,
+        _api_get_asset(asset_id=mock_asset.id, client=client)
+        assert asset_view_buffer.flush() == 2
+        # Repeat view within the dedup window does not increment.
         fake_auth.login(instructors[0].id)
         asset = _api_get_asset(asset_id=mock_asset.id, client=client)
-        assert asset['views'] == 3
+        assert asset['views'] == 2
+        assert asset_view_buffer.flush() == 0
+        # Repeat views increment if there is no dedup window.
+        with override_config(app, 'ASSET_VIEW_DEDUP_WINDOW_SECONDS', 0):
+            _api_get_asset(asset_id=mock_asset.id, client=client)
+        assert asset_view_buffer.flush() == 1
         # Views by asset owners do not increment.
         fake_auth.login(mock_asset.created_by)
         asset = _api_get_asset(asset_id=mock_asset.id, client=client)
         assert asset['views'] == 3
+        assert asset_view_buffer.flush() == 0
+
+    def test_failed_asset_views_are_retried(self, app, mock_asset):
+        """Views which fail to record are retried, then dropped and countable again."""
+        course = Course.find_by_id(mock_asset.course_id)
+        instructor = next(u for u in course.users if is_teaching(u))
+        # No such user.
+        assert asset_view_buffer.add(asset_id=mock_asset.id, course_id=course.id, user_id=0) is True
+        with override_config(app, 'ASSET_VIEW_FLUSH_MAX_ATTEMPTS', 2):
+            assert asset_view_buffer.flush() == 0
+            assert [v['attempts'] for v in asset_view_buffer.pending] == [1]
+            assert asset_view_buffer.add(asset_id=mock_asset.id, course_id=course.id, user_id=instructor.id) is True
+            # The view of no such user fails its batch once more, and is dropped. Its batch-mate is retried.
+            assert asset_view_buffer.flush() == 0
+            assert [v['userId'] for v in asset_view_buffer.pending] == [instructor.id]
+            assert asset_view_buffer.flush() == 1
+        assert asset_view_buffer.add(asset_id=mock_asset.id, course_id=course.id, user_id=0) is True
+        assert asset_view_buffer.add(asset_id=mock_asset.id, course_id=course.id, user_id=instructor.id) is False
+        asset_view_buffer.clear()
 
     def test_view_protected_asset(self, client, fake_auth, mock_asset, mock_asset_course):
         """Student in an asset-siloed course cannot view asset created by student in other section."""
@@ -168,8 +192,10 @@ class TestGetAssets:
             client,
             asset_type=None,
             category_id=None,
+            cursor=None,
             expected_status_code=200,
             group_id=None,
+            include_total=True,
             keywords=None,
             limit=20,
             offset=0,
@@ -180,7 +206,9 @@ class TestGetAssets:
         params = {
             'assetType': asset_type,
             'categoryId': category_id,
+            'cursor': cursor,
             'groupId': group_id,
+            'includeTotal': include_total,
             'keywords': keywords,
             'limit': limit,
             'offset': offset,
@@ -258,6 +286,71 @@ class TestGetAssets:
             ):
                 assert key in asset['users'][0]
 
+    def test_pagination(self, authorized_user_id, client, fake_auth):
+        """Total count is the same on every page, including past the last."""
+        fake_auth.login(authorized_user_id)
+        total = self._api_get_assets(client)['total']
+        page_1 = self._api_get_assets(client, limit=1)
+        page_2 = self._api_get_assets(client, limit=1, offset=1)
+        assert page_1['total'] == page_2['total'] == total
+        assert page_1['results'][0]['id'] > page_2['results'][0]['id']
+        api_json = self._api_get_assets(client, offset=total)
+        assert api_json['results'] == []
+        assert api_json['total'] == total
+
+    def test_cursor_pagination(self, authorized_user_id, client, fake_auth):
+        """Pages by cursor, for every sort, match a single page of all results."""
+        fake_auth.login(authorized_user_id)
+        for order_by in ['recent', 'likes', 'views', 'comments']:
+            expected = [a['id'] for a in self._api_get_assets(client, limit=100, order_by=order_by)['results']]
+            asset_ids = []
+            cursor = None
+            while True:
+                api_json = self._api_get_assets(client, cursor=cursor, include_total=False, limit=2, order_by=order_by)
+                assert api_json['total'] is None
+                asset_ids += [a['id'] for a in api_json['results']]
+                cursor = api_json['nextCursor']
+                if not cursor:
+                    break
+            assert asset_ids == expected
+
+    def test_relevance_cursor_pagination(self, authorized_user_id, client, fake_auth):
+        """Pages by cursor, sorted by relevance, match a single page of all results, including assets of equal rank."""
+        fake_auth.login(authorized_user_id)
+        asset_ids = [a['id'] for a in self._api_get_assets(client, limit=6)['results']]
+        for index, asset_id in enumerate(asset_ids):
+            Comment.create(asset=Asset.find_by_id(asset_id), user_id=authorized_user_id, body=' '.join(['chlorophyll'] * (1 + index % 3)))
+        expected = [a['id'] for a in self._api_get_assets(client, keywords='chlorophyll', limit=100, order_by='relevance')['results']]
+        assert sorted(expected) == sorted(asset_ids)
+        paged_asset_ids = []
+        cursor = None
+        while True:
+            api_json = self._api_get_assets(client, cursor=cursor, include_total=False, keywords='chlorophyll', limit=2, order_by='relevance')
+            paged_asset_ids += [a['id'] for a in api_json['results']]
+            cursor = api_json['nextCursor']
+            if not cursor:
+                break
+        assert paged_asset_ids == expected
+
+    def test_invalid_cursor(self, authorized_user_id, client, fake_auth):
+        """Rejects cursor of another sort, or no cursor at all."""
+        fake_auth.login(authorized_user_id)
+        cursor = self._api_get_assets(client, limit=1, order_by='likes')['nextCursor']
+        self._api_get_assets(client, cursor=cursor, expected_status_code=400, order_by='recent')
+        self._api_get_assets(client, cursor='bm90IGEgY3Vyc29y', expected_status_code=400)
+
+    def test_keyword_search(self, authorized_user_id, client, fake_auth, mock_asset):
+        """Keywords match, by prefix, words in the comments of an asset."""
+        Comment.create(asset=mock_asset, user_id=authorized_user_id, body='Photosynthesis in chloroplasts')
+        fake_auth.login(authorized_user_id)
+        for order_by in ['recent', 'relevance']:
+            api_json = self._api_get_assets(client, keywords='photosynth CHLORO', order_by=order_by)
+            assert [a['id'] for a in api_json['results']] == [mock_asset.id]
+            assert api_json['total'] == 1
+            assert 'searchVector' not in api_json['results'][0]
+        api_json = self._api_get_assets(client, keywords='photosynthetic')
+        assert api_json['results'] == []
+
     def test_teacher_assets_protected_per_section(self, authorized_user_id, client, fake_auth, mock_asset_course):
         """Teacher in an asset-siloed course can see all assets for the course."""
         mock_asset_course.protects_assets_per_section = True
@@ -857,6 +950,20 @@ class TestLikeAsset:
         assert User.find_by_id(different_user.id).points == asset_liker_points + 1
         self._api_remove_like_asset(asset_id=mock_asset.id, client=client, expected_status_code=200)
 
+    def test_like_asset_reciprocal_activities(self, client, fake_auth, mock_asset):
+        """Each asset owner gets a 'get_asset_like' activity, reciprocal to the like."""
+        course_users = Course.find_by_id(mock_asset.course_id).users
+        different_user = next(user for user in course_users if user not in mock_asset.users)
+        fake_auth.login(different_user.id)
+        self._api_like_asset(asset_id=mock_asset.id, client=client, expected_status_code=200)
+        like = Activity.query.filter_by(activity_type='asset_like', asset_id=mock_asset.id, user_id=different_user.id).one()
+        get_likes = Activity.query.filter_by(activity_type='get_asset_like', asset_id=mock_asset.id).all()
+        assert sorted(a.user_id for a in get_likes) == sorted(u.id for u in mock_asset.users)
+        for get_like in get_likes:
+            assert get_like.actor_id == different_user.id
+            assert get_like.reciprocal_id == like.id
+        assert User.find_by_id(different_user.id).last_activity is not None
+
     def test_student_like_asset_protected_per_section(self, client, fake_auth, mock_asset, mock_asset_course,
                                                       mock_asset_users):
         """Student in an asset-siloed course cannot like asset created by student in other section."""
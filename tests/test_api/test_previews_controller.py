@@ -26,6 +26,11 @@ ENHANCEMENTS, OR MODIFICATIONS.
 from datetime import datetime
 
 from squiggy.lib.previews import generate_preview_service_signature
+from squiggy.lib.util import is_teaching
+from squiggy.models.course import Course
+from squiggy.models.whiteboard_element import WhiteboardElement
+from squiggy.models.whiteboard_operation import WhiteboardOperation
+from squiggy.models.whiteboard_snapshot import WhiteboardSnapshot
 
 
 class TestPreviews:
@@ -88,3 +93,33 @@ class TestPreviews:
         assert mock_asset.preview_metadata['imageWidth'] == 200
         assert mock_asset.preview_metadata['imageHeight'] == 100
         assert mock_asset.preview_metadata['updatedAt'] is not None
+
+    def test_whiteboard_elements_get_asset_image(self, client, fake_auth, mock_whiteboard):
+        """Whiteboard elements of the asset get the new image, without waiting for a whiteboard load."""
+        asset_element = next(w for w in mock_whiteboard['whiteboardElements'] if w['assetId'])
+        image_url = 'https://imgur.com/gallery/TraFgSm'
+        preview_result_payload = {
+            'id': asset_element['assetId'],
+            'status': 'done',
+            'image': image_url,
+            'thumbnail': 'https://imgur.com/gallery/QZmb5KU',
+            'metadata': '{"image_width": 300}',
+        }
+        self._api_post_preview_callback(client, generate_preview_service_signature(), preview_result_payload)
+        usages = WhiteboardElement.get_asset_usages(asset_element['assetId'])
+        assert [w['element']['src'] for w in usages] == [image_url]
+        assert usages[0]['element']['width'] == 300
+
+        # Loading the whiteboard writes nothing: not the element, not the operation log, not a snapshot.
+        whiteboard_id = mock_whiteboard['id']
+        course = Course.find_by_id(mock_whiteboard['courseId'])
+        instructor = next(u for u in course.users if is_teaching(u))
+        updated_at = usages[0]['updatedAt']
+        version = WhiteboardOperation.get_current_version(whiteboard_id)
+        snapshot_version = WhiteboardSnapshot.find_latest(whiteboard_id).version
+        fake_auth.login(instructor.id)
+        response = client.get(f'/api/whiteboard/{whiteboard_id}')
+        assert response.status_code == 200
+        assert WhiteboardElement.get_asset_usages(asset_element['assetId'])[0]['updatedAt'] == updated_at
+        assert WhiteboardOperation.get_current_version(whiteboard_id) == version
+        assert WhiteboardSnapshot.find_latest(whiteboard_id).version == snapshot_version
@@ -68,3 +68,8 @@ class TestStatusController:
         db.session.execute(f'DELETE FROM courses WHERE id = {course.id}')
         db.session.execute('DELETE FROM background_jobs')
         std_commit(allow_test_environment=True)
+
+    def test_metrics_anonymous(self, client):
+        """Denies anonymous user."""
+        response = client.get('/api/status/metrics')
+        assert response.status_code == 401
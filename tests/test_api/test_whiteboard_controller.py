@@ -32,13 +32,13 @@ from flask import current_app as app
 from flask_login import logout_user
 from squiggy import db, std_commit
 from squiggy.lib.login_session import LoginSession
+from squiggy.lib.presence import whiteboard_presence
 from squiggy.lib.util import is_admin, is_teaching
 from squiggy.models.activity import Activity
 from squiggy.models.course import Course
 from squiggy.models.user import User
 from squiggy.models.whiteboard import Whiteboard
 from squiggy.models.whiteboard_element import WhiteboardElement
-from squiggy.models.whiteboard_session import WhiteboardSession
 from tests.util import mock_s3_bucket
 
 unauthorized_user_id = '666'
@@ -82,6 +82,31 @@ class TestGetWhiteboard:
         asset = _api_get_whiteboard(client=client, whiteboard_id=mock_whiteboard['id'])
         assert asset['id'] == mock_whiteboard['id']
 
+    def test_invalid_viewport(self, client, fake_auth, mock_whiteboard):
+        """Rejects invalid viewport."""
+        fake_auth.login(mock_whiteboard['users'][0]['id'])
+        response = client.get(f'/api/whiteboard/{mock_whiteboard["id"]}?viewport=0,0,-1,100')
+        assert response.status_code == 400
+
+    def test_viewport(self, client, fake_auth, mock_whiteboard):
+        """Only elements in view, plus elements of unknown size, are returned."""
+        whiteboard_id = mock_whiteboard['id']
+        uuid = str(uuid4())
+        WhiteboardElement.create(
+            element={'height': 10, 'left': 5000, 'top': 5000, 'type': 'rect', 'width': 10},
+            uuid=uuid,
+            whiteboard_id=whiteboard_id,
+            z_index=10,
+        )
+        std_commit(allow_test_environment=True)
+        fake_auth.login(mock_whiteboard['users'][0]['id'])
+        response = client.get(f'/api/whiteboard/{whiteboard_id}?viewport=0,0,1000,1000')
+        assert response.status_code == 200
+        uuids = [w['uuid'] for w in response.json['whiteboardElements']]
+        assert uuids == [w['uuid'] for w in mock_whiteboard['whiteboardElements']]
+        response = client.get(f'/api/whiteboard/{whiteboard_id}?viewport=4990,4990,100,100')
+        assert uuid in [w['uuid'] for w in response.json['whiteboardElements']]
+
     def test_teacher_view_whiteboard(self, client, fake_auth, mock_whiteboard):
         """Teacher can view whiteboard."""
         course = Course.find_by_canvas_course_id(
@@ -139,12 +164,14 @@ class TestGetWhiteboards:
             client,
             expected_status_code=200,
             include_deleted=False,
+            keywords=None,
             limit=None,
             offset=None,
             order_by=None,
     ):
         params = {
             'includeDeleted': include_deleted,
+            'keywords': keywords,
             'limit': limit,
             'offset': offset,
             'orderBy': order_by,
@@ -212,7 +239,7 @@ class TestGetWhiteboards:
             # Simulate a visit to /whiteboard page
             socket_id = str(randint(1, 9999999))
             whiteboard_id = whiteboard['id']
-            WhiteboardSession.update_updated_at(
+            whiteboard_presence.touch(
                 socket_id=socket_id,
                 user_id=user.id,
                 whiteboard_id=whiteboard_id,
@@ -233,6 +260,16 @@ class TestGetWhiteboards:
             else:
                 assert len(whiteboards_deleted) == 0
 
+    def test_keyword_search(self, client, fake_auth):
+        """Keywords match the start of words in whiteboard title."""
+        course, student, whiteboard = _create_student_whiteboard()
+        fake_auth.login(student.id)
+        for order_by in ['recent', 'relevance']:
+            api_json = self._api_get_whiteboards(client=client, keywords='cyber', order_by=order_by)
+            assert [w['id'] for w in api_json['results']] == [whiteboard['id']]
+        api_json = self._api_get_whiteboards(client=client, keywords='culture')
+        assert api_json['results'] == []
+
     def test_creator_changes_section(self, client, fake_auth):
         """Student in an asset-siloed course who changes section takes their whiteboards with them."""
         course, student_1, whiteboard = _create_student_whiteboard()
@@ -380,6 +417,28 @@ class TestExportAsAsset:
             )
 
 
+class TestExportAsPng:
+
+    @staticmethod
+    def _api_export_as_png(client, whiteboard_id, expected_status_code=200):
+        response = client.get(f'/api/whiteboard/{whiteboard_id}/download/png')
+        assert response.status_code == expected_status_code
+        return response
+
+    def test_anonymous(self, client, mock_whiteboard):
+        """Denies anonymous user."""
+        self._api_export_as_png(client, expected_status_code=401, whiteboard_id=mock_whiteboard['id'])
+
+    def test_download(self, app, client, fake_auth, mock_whiteboard):
+        """Streams PNG as attachment."""
+        fake_auth.login(mock_whiteboard['users'][0]['id'])
+        response = self._api_export_as_png(client, whiteboard_id=mock_whiteboard['id'])
+        assert response.mimetype == 'image/png'
+        assert response.headers['Content-disposition'].startswith('attachment; filename="Mock_Whiteboard_of_users_')
+        with open(f"{app.config['BASE_DIR']}/fixtures/mock_whiteboard.png", mode='rb') as f:
+            assert response.data == f.read()
+
+
 class TestUndeleteWhiteboard:
 
     @staticmethod
@@ -424,6 +483,72 @@ class TestUndeleteWhiteboard:
             )
 
 
+class TestUndo:
+
+    @staticmethod
+    def _api_undo(client, whiteboard_id, expected_status_code=200, version=None):
+        response = client.post(
+            f'/api/whiteboard/{whiteboard_id}/undo',
+            data=json.dumps({'socketId': _get_mock_socket_id(), 'version': version}),
+            content_type='application/json',
+        )
+        assert response.status_code == expected_status_code
+        return json.loads(response.data)
+
+    def test_anonymous(self, client, mock_whiteboard):
+        """Denies anonymous user."""
+        self._api_undo(client, whiteboard_id=mock_whiteboard['id'], expected_status_code=401)
+
+    def test_unauthorized(self, client, fake_auth, mock_whiteboard):
+        """Denies unauthorized user."""
+        fake_auth.login(unauthorized_user_id)
+        self._api_undo(client, whiteboard_id=mock_whiteboard['id'], expected_status_code=401)
+
+    def test_invalid_input(self, authorized_user_id, client, fake_auth, mock_whiteboard):
+        """Rejects a history limit or undo version which is not an integer; clamps the limit."""
+        fake_auth.login(authorized_user_id)
+        whiteboard_id = mock_whiteboard['id']
+        assert client.get(f'/api/whiteboard/{whiteboard_id}/history?limit=foo').status_code == 400
+        response = client.get(f'/api/whiteboard/{whiteboard_id}/history?limit=-5')
+        assert response.status_code == 200
+        assert len(response.json) == 1
+        for version in ['foo', 0, -1]:
+            self._api_undo(client, whiteboard_id=whiteboard_id, expected_status_code=400, version=version)
+
+    def test_history_and_undo(self, authorized_user_id, client, fake_auth, mock_whiteboard):
+        """Undo reverts the latest operation; undo of the undo brings it back."""
+        fake_auth.login(authorized_user_id)
+        whiteboard_id = mock_whiteboard['id']
+        whiteboard_element = mock_whiteboard['whiteboardElements'][-1]
+        uuid = whiteboard_element['uuid']
+        WhiteboardElement.delete_all(uuids=[uuid], whiteboard_id=whiteboard_id)
+        std_commit(allow_test_environment=True)
+
+        history = client.get(f'/api/whiteboard/{whiteboard_id}/history').json
+        assert history[0]['operationType'] == 'delete'
+        assert history[0]['uuids'] == [uuid]
+        assert uuid not in [w['uuid'] for w in client.get(f'/api/whiteboard/{whiteboard_id}').json['whiteboardElements']]
+
+        api_json = self._api_undo(client, whiteboard_id=whiteboard_id)
+        assert [w['uuid'] for w in api_json['whiteboardElements']] == [uuid]
+        # The undo is one operation.
+        undo_history = client.get(f'/api/whiteboard/{whiteboard_id}/history').json
+        assert undo_history[0]['operationType'] == 'undo'
+        assert undo_history[0]['uuids'] == [uuid]
+        assert undo_history[0]['version'] == history[0]['version'] + 1
+        restored = next(w for w in client.get(f'/api/whiteboard/{whiteboard_id}').json['whiteboardElements'] if w['uuid'] == uuid)
+        assert restored['element']['text'] == whiteboard_element['element']['text']
+        assert restored['zIndex'] == whiteboard_element['zIndex']
+
+        api_json = self._api_undo(client, whiteboard_id=whiteboard_id)
+        assert api_json['deletedUuids'] == [uuid]
+        assert api_json['whiteboardElements'] == []
+        redo_history = client.get(f'/api/whiteboard/{whiteboard_id}/history').json
+        assert redo_history[0]['operationType'] == 'undo'
+        assert redo_history[0]['version'] == undo_history[0]['version'] + 1
+        assert uuid not in [w['uuid'] for w in client.get(f'/api/whiteboard/{whiteboard_id}').json['whiteboardElements']]
+
+
 class TestGetEligibleCollaborators:
 
     @classmethod
@@ -23,17 +23,21 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from copy import deepcopy
 import json
 from random import randint
 from uuid import uuid4
 
 from moto import mock_s3
 from squiggy import std_commit
+from squiggy.lib.socket_event_coalescer import socket_event_coalescer
 from squiggy.lib.util import is_admin, is_student, is_teaching
+from squiggy.lib.whiteboard_state import whiteboard_state
 from squiggy.models.activity import Activity
 from squiggy.models.asset import Asset
 from squiggy.models.course import Course
-from tests.util import mock_s3_bucket
+from squiggy.models.whiteboard_element import WhiteboardElement
+from tests.util import mock_s3_bucket, override_config
 
 
 def _api_get_whiteboard(client, whiteboard_id, expected_status_code=200):
@@ -85,6 +89,17 @@ class TestUpsertWhiteboardElement:
             whiteboard_id=mock_whiteboard['id'],
         )
 
+    def test_invalid_whiteboard_id(self, client, fake_auth, mock_whiteboard):
+        """Denies request without a valid whiteboard id."""
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        for whiteboard_id in [None, 'foo']:
+            self._api_upsert_whiteboard_element(
+                client=client,
+                expected_status_code=401,
+                whiteboard_elements=[_mock_whiteboard_element()],
+                whiteboard_id=whiteboard_id,
+            )
+
     @mock_s3
     def test_authorized_create(self, app, client, fake_auth, mock_whiteboard):
         """Authorized creates whiteboard elements."""
@@ -102,6 +117,14 @@ class TestUpsertWhiteboardElement:
                 whiteboard_elements=[mock_whiteboard_element],
                 whiteboard_id=whiteboard_id,
             )
+            # Not yet saved, but loads see it.
+            api_json = _api_get_whiteboard(client, whiteboard_id)
+            assert next((e for e in api_json['whiteboardElements'] if e['uuid'] == uuid), None)
+            assert not list(filter(
+                lambda a: a.activity_type == 'whiteboard_add_asset',
+                Activity.find_by_object_id(object_type='whiteboard', object_id=whiteboard_id),
+            ))
+            _flush_pending_edits(whiteboard_id)
             api_json = _api_get_whiteboard(client, whiteboard_id)
             whiteboard_element = next((e for e in api_json['whiteboardElements'] if e['uuid'] == uuid), None)
             assert whiteboard_element
@@ -154,6 +177,7 @@ class TestUpsertWhiteboardElement:
                 whiteboard_elements=mock_whiteboard['whiteboardElements'],
                 whiteboard_id=whiteboard_id,
             )
+            _flush_pending_edits(whiteboard_id)
             std_commit(allow_test_environment=True)
 
             api_json = _api_get_whiteboard(client, whiteboard_id)
@@ -163,6 +187,180 @@ class TestUpsertWhiteboardElement:
             assert updated_whiteboard_element
             assert updated_whiteboard_element['element']['fill'] == updated_fill
 
+    @mock_s3
+    def test_authorized_create_and_update(self, app, client, fake_auth, mock_whiteboard):
+        """Inserts and updates of a single payload are written together; new elements go to the top of the stack."""
+        existing = mock_whiteboard['whiteboardElements'][0]
+        existing['element']['fill'] = 'rgb(255,0,0)'
+        max_z_index = max(w['zIndex'] for w in mock_whiteboard['whiteboardElements'])
+        new_elements = [_mock_whiteboard_element(asset_id=None, text=f'Tempus fugit {index}') for index in range(2)]
+
+        with mock_s3_bucket(app):
+            fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+            whiteboard_id = mock_whiteboard['id']
+            results = self._api_upsert_whiteboard_element(
+                client=client,
+                whiteboard_elements=[new_elements[0], existing, new_elements[1]],
+                whiteboard_id=whiteboard_id,
+            )
+            assert len(results) == 3
+            assert _flush_pending_edits(whiteboard_id) == 3
+            std_commit(allow_test_environment=True)
+
+            api_json = _api_get_whiteboard(client, whiteboard_id)
+            whiteboard_elements_by_uuid = {w['uuid']: w for w in api_json['whiteboardElements']}
+            assert len(whiteboard_elements_by_uuid) == len(mock_whiteboard['whiteboardElements']) + 2
+            assert whiteboard_elements_by_uuid[existing['uuid']]['zIndex'] == existing['zIndex']
+            assert whiteboard_elements_by_uuid[existing['uuid']]['element']['fill'] == 'rgb(255,0,0)'
+            assert whiteboard_elements_by_uuid[new_elements[0]['uuid']]['zIndex'] == max_z_index + 1
+            assert whiteboard_elements_by_uuid[new_elements[1]['uuid']]['zIndex'] == max_z_index + 2
+
+    @mock_s3
+    def test_stale_edits_are_not_saved(self, app, client, fake_auth, mock_whiteboard):
+        """A save is not undone by older edits, superseded in memory or written late."""
+        whiteboard_element = mock_whiteboard['whiteboardElements'][0]
+        whiteboard_id = mock_whiteboard['id']
+        with mock_s3_bucket(app):
+            fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+            older = deepcopy(whiteboard_element)
+            older['element']['fill'] = 'rgb(1,1,1)'
+            older_version = whiteboard_state.reserve_versions(count=1, whiteboard_id=whiteboard_id)[0]
+            whiteboard_state.apply(
+                course_id=mock_whiteboard['courseId'],
+                user_id=_get_authorized_user_id(mock_whiteboard),
+                versions=[older_version],
+                whiteboard_elements=[older],
+                whiteboard_id=whiteboard_id,
+            )
+            whiteboard_element['element']['fill'] = 'rgb(2,2,2)'
+            self._api_upsert_whiteboard_element(
+                client=client,
+                whiteboard_elements=[whiteboard_element],
+                whiteboard_id=whiteboard_id,
+            )
+            # The newer edit replaced the older copy in memory.
+            assert _flush_pending_edits(whiteboard_id) == 1
+            # A late write of an older version is rejected.
+            results, _ = WhiteboardElement.upsert_all(
+                versions_by_uuid={whiteboard_element['uuid']: older_version},
+                whiteboard_elements=[older],
+                whiteboard_id=whiteboard_id,
+            )
+            assert results == []
+            std_commit(allow_test_environment=True)
+
+            api_json = _api_get_whiteboard(client, whiteboard_id)
+            saved = next(w for w in api_json['whiteboardElements'] if w['uuid'] == whiteboard_element['uuid'])
+            assert saved['element']['fill'] == 'rgb(2,2,2)'
+
+
+class TestPatchWhiteboardElements:
+
+    @classmethod
+    def _api_patch_whiteboard_elements(
+            cls,
+            client,
+            patches,
+            whiteboard_id,
+            expected_status_code=200,
+    ):
+        params = {
+            'patches': patches,
+            'socketId': _get_mock_socket_id(),
+            'whiteboardId': whiteboard_id,
+        }
+        response = client.post(
+            '/api/whiteboard_elements/patch',
+            data=json.dumps(params),
+            content_type='application/json',
+        )
+        assert response.status_code == expected_status_code
+        return response.json
+
+    def test_anonymous(self, client, mock_whiteboard):
+        """Denies anonymous user."""
+        self._api_patch_whiteboard_elements(
+            client=client,
+            expected_status_code=401,
+            patches=[{'element': {'left': 10}, 'uuid': mock_whiteboard['whiteboardElements'][0]['uuid']}],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+
+    def test_unauthorized(self, client, fake_auth, mock_whiteboard):
+        """Denies unauthorized user."""
+        fake_auth.login(_get_non_collaborator_user_id(mock_whiteboard))
+        self._api_patch_whiteboard_elements(
+            client=client,
+            expected_status_code=401,
+            patches=[{'element': {'left': 10}, 'uuid': mock_whiteboard['whiteboardElements'][0]['uuid']}],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+
+    def test_invalid_patch(self, client, fake_auth, mock_whiteboard):
+        """A patch changes properties of an element, not its type."""
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        uuid = mock_whiteboard['whiteboardElements'][0]['uuid']
+        for patch in [{}, {'type': 'circle'}, {'text': ' '}]:
+            self._api_patch_whiteboard_elements(
+                client=client,
+                expected_status_code=400,
+                patches=[{'element': patch, 'uuid': uuid}],
+                whiteboard_id=mock_whiteboard['id'],
+            )
+
+    @mock_s3
+    def test_authorized(self, app, client, fake_auth, mock_whiteboard):
+        """Changed properties are merged into the element, pending or saved; sequence numbers increase."""
+        whiteboard_element = mock_whiteboard['whiteboardElements'][0]
+        uuid = whiteboard_element['uuid']
+        whiteboard_id = mock_whiteboard['id']
+        with mock_s3_bucket(app):
+            fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+            first = self._api_patch_whiteboard_elements(
+                client=client,
+                patches=[{'element': {'left': 42, 'top': 24}, 'uuid': uuid}],
+                whiteboard_id=whiteboard_id,
+            )
+            second = self._api_patch_whiteboard_elements(
+                client=client,
+                patches=[{'element': {'fill': None, 'left': 43}, 'uuid': uuid}],
+                whiteboard_id=whiteboard_id,
+            )
+            assert first['patches'] == [{'element': {'left': 42, 'top': 24}, 'uuid': uuid}]
+            assert second['sequence'] > first['sequence']
+
+            # Not yet saved, but loads see it.
+            for flush in [False, True]:
+                if flush:
+                    assert _flush_pending_edits(whiteboard_id) == 1
+                    std_commit(allow_test_environment=True)
+                api_json = _api_get_whiteboard(client, whiteboard_id)
+                patched = next(w for w in api_json['whiteboardElements'] if w['uuid'] == uuid)
+                assert patched['element']['left'] == 43
+                assert patched['element']['top'] == 24
+                assert 'fill' not in patched['element']
+                assert patched['element']['type'] == whiteboard_element['element']['type']
+                assert patched['zIndex'] == whiteboard_element['zIndex']
+
+    @mock_s3
+    def test_write_through(self, app, client, fake_auth, mock_whiteboard):
+        """Without write-behind, patches are merged into the db row at once."""
+        whiteboard_element = mock_whiteboard['whiteboardElements'][0]
+        whiteboard_id = mock_whiteboard['id']
+        with mock_s3_bucket(app):
+            fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+            with override_config(app, 'SOCKET_IO_COALESCE_WINDOW', 0), override_config(app, 'WHITEBOARD_STATE_WRITE_BEHIND', False):
+                self._api_patch_whiteboard_elements(
+                    client=client,
+                    patches=[{'element': {'left': 7}, 'uuid': whiteboard_element['uuid']}, {'element': {'top': 8}, 'uuid': str(uuid4())}],
+                    whiteboard_id=whiteboard_id,
+                )
+            assert _flush_pending_edits(whiteboard_id) == 0
+            std_commit(allow_test_environment=True)
+            saved = WhiteboardElement.find_all(uuids=[whiteboard_element['uuid']], whiteboard_id=whiteboard_id)[0]
+            assert saved.element['left'] == 7
+            assert saved.element['type'] == whiteboard_element['element']['type']
+
 
 class TestDeleteWhiteboardElements:
 
@@ -327,6 +525,90 @@ class TestOrderWhiteboardElements:
             whiteboard=mock_whiteboard,
         )
 
+    def test_bring_element_forward(self, client, fake_auth, mock_whiteboard):
+        """Authorized user can 'bringForward' a whiteboard element, one step up."""
+        uuids = [w['uuid'] for w in sorted(mock_whiteboard['whiteboardElements'], key=lambda w: w['zIndex'])]
+        assert len(uuids) > 1
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        self._api_order_whiteboard_elements(
+            client=client,
+            direction='bringForward',
+            uuids=[uuids[0]],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+        api_json = _api_get_whiteboard(client, mock_whiteboard['id'])
+        assert [w['uuid'] for w in api_json['whiteboardElements']] == [uuids[1], uuids[0]] + uuids[2:]
+
+    def test_send_element_backwards(self, client, fake_auth, mock_whiteboard):
+        """Authorized user can 'sendBackwards' a whiteboard element, one step down."""
+        uuids = [w['uuid'] for w in sorted(mock_whiteboard['whiteboardElements'], key=lambda w: w['zIndex'])]
+        assert len(uuids) > 1
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        self._api_order_whiteboard_elements(
+            client=client,
+            direction='sendBackwards',
+            uuids=[uuids[-1]],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+        api_json = _api_get_whiteboard(client, mock_whiteboard['id'])
+        assert [w['uuid'] for w in api_json['whiteboardElements']] == uuids[:-2] + [uuids[-1], uuids[-2]]
+
+    def test_tight_gap_is_rebalanced(self, client, fake_auth, mock_whiteboard):
+        """A move into a slot narrower than Z_INDEX_REBALANCE_GAP renumbers the whiteboard in the same request."""
+        uuids = self._set_tight_z_indexes(gap=4e-7, whiteboard=mock_whiteboard)
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        self._api_order_whiteboard_elements(
+            client=client,
+            direction='bringForward',
+            uuids=[uuids[0]],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+        whiteboard_elements = _api_get_whiteboard(client, mock_whiteboard['id'])['whiteboardElements']
+        assert [w['uuid'] for w in whiteboard_elements] == [uuids[1], uuids[0]] + uuids[2:]
+        assert [w['zIndex'] for w in whiteboard_elements] == list(range(len(uuids)))
+
+    def test_out_of_precision_is_retried(self, client, fake_auth, mock_whiteboard):
+        """A move into a slot narrower than Z_INDEX_MIN_GAP rebalances first, then slots the element."""
+        uuids = self._set_tight_z_indexes(gap=1e-10, whiteboard=mock_whiteboard)
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        self._api_order_whiteboard_elements(
+            client=client,
+            direction='bringForward',
+            uuids=[uuids[0]],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+        whiteboard_elements = _api_get_whiteboard(client, mock_whiteboard['id'])['whiteboardElements']
+        assert [w['uuid'] for w in whiteboard_elements] == [uuids[1], uuids[0]] + uuids[2:]
+        z_indexes = {w['uuid']: w['zIndex'] for w in whiteboard_elements}
+        assert z_indexes[uuids[1]] == 1
+        assert z_indexes[uuids[0]] == 1.5
+        assert z_indexes[uuids[2]] == 2
+
+    def test_invalid_direction(self, client, fake_auth, mock_whiteboard):
+        """Rejects unknown direction."""
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        self._api_order_whiteboard_elements(
+            client=client,
+            direction='sideways',
+            expected_status_code=400,
+            uuids=[mock_whiteboard['whiteboardElements'][0]['uuid']],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+
+    @classmethod
+    def _set_tight_z_indexes(cls, gap, whiteboard):
+        # Renumber 0, 1, 2, ... then squeeze the third element up against the second. Returns uuids in z_index order.
+        whiteboard_elements = sorted(whiteboard['whiteboardElements'], key=lambda w: w['zIndex'])
+        assert len(whiteboard_elements) > 2
+        z_indexes = [float(index) for index in range(len(whiteboard_elements))]
+        z_indexes[2] = z_indexes[1] + gap
+        WhiteboardElement.restore(
+            whiteboard_elements=[{**w, 'zIndex': z_index} for w, z_index in zip(whiteboard_elements, z_indexes)],
+            whiteboard_id=whiteboard['id'],
+        )
+        std_commit(allow_test_environment=True)
+        return [w['uuid'] for w in whiteboard_elements]
+
     def _verify_whiteboard_element_order(
             self,
             client,
@@ -362,6 +644,12 @@ class TestOrderWhiteboardElements:
             assert uuids == (selected_uuids + other_uuids)
 
 
+def _flush_pending_edits(whiteboard_id):
+    # Upserts wait in the coalescer, then in whiteboard_state, on their way to the db. Returns the count saved.
+    socket_event_coalescer.flush(whiteboard_id)
+    return whiteboard_state.flush(whiteboard_id)
+
+
 def _get_authorized_user_id(whiteboard):
     student = next((u for u in whiteboard['users'] if is_student(u) and u['canvasEnrollmentState'] == 'active'), None)
     assert student
@@ -386,14 +674,14 @@ def _get_non_collaborator_user_id(whiteboard):
     return user.id
 
 
-def _mock_whiteboard_element():
+def _mock_whiteboard_element(asset_id=1, text=''):
     uuid = str(uuid4())
     return {
-        'assetId': 1,
+        'assetId': asset_id,
         'element': {
             'fill': 'rgb(0,0,0)',
             'fontSize': 14,
-            'text': '',
+            'text': text,
             'type': 'text',
             'uuid': uuid,
         },
@@ -24,8 +24,11 @@ ENHANCEMENTS, OR MODIFICATIONS.
 """
 
 from datetime import datetime
+from urllib.parse import parse_qs, urlparse
 
-from squiggy.lib.aws import get_s3_signed_url, is_s3_preview_url
+from squiggy.lib.aws import get_s3_signed_url, get_s3_signed_urls, is_s3_object, is_s3_preview_url
+from squiggy.lib.aws import s3_client_registry, S3ClientRegistry, signed_url_cache
+from tests.util import mock_s3_bucket, override_config
 
 
 class TestAws:
@@ -40,3 +43,34 @@ class TestAws:
     def test_recognizes_valid_presigned_url(self):
         presigned = f'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/deadd00d?Expires={int(datetime.utcnow().timestamp()) + 4000}'
         assert get_s3_signed_url(presigned) == presigned
+
+    def test_signed_url_is_reused_within_window(self, app):
+        url = 'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/deadd00d.png'
+        other_url = 'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/abba1974.png'
+        signed_url_cache.clear()
+        hits = signed_url_cache.stats()['hits']
+        with override_config(app, 'S3_SIGNED_URL_WINDOW_SECONDS', 86400):
+            signed_url = get_s3_signed_url(url)
+            assert get_s3_signed_urls([url, other_url, None]) == [signed_url, get_s3_signed_url(other_url), None]
+        assert signed_url_cache.stats()['hits'] - hits == 2
+        # Expiry is the end of the window plus minimum life, regardless of when the url was signed.
+        expires = int(parse_qs(urlparse(signed_url).query)['Expires'][0])
+        assert expires % 86400 == 3600
+
+    def test_client_is_reused_until_credentials_change(self, app):
+        registry = S3ClientRegistry()
+        client = registry.get_client()
+        assert registry.get_client() is client
+        with override_config(app, 'AWS_SECRET_ACCESS_KEY', 'rotated secret'):
+            assert registry.get_client() is not client
+        assert registry.stats()['clientCreations'] == 2
+
+    def test_request_metrics(self, app):
+        before = s3_client_registry.stats()
+        with mock_s3_bucket(app):
+            assert not is_s3_object(app.config['S3_BUCKET'], 'no/such/key')
+            assert not is_s3_object(app.config['S3_BUCKET'], 'no/such/key')
+            after = s3_client_registry.stats()
+        assert after['clientCreations'] - before['clientCreations'] == 1
+        assert after['requests'] - before['requests'] == 2
+        assert after['requestSecondsMedian'] is not None
@@ -0,0 +1,78 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from time import sleep
+
+from squiggy.lib.cache import get_cache_stats, TTLCache
+
+
+class TestTTLCache:
+    """Thread-safe cache with expiry."""
+
+    def test_hits_and_misses(self, app):
+        cache = TTLCache(name='test_hits_and_misses')
+        loads = []
+
+        def _load():
+            loads.append(1)
+            return False
+
+        for _ in range(3):
+            assert cache.get_or_load(key=(1, 2, False), load=_load, ttl_seconds=60) is False
+        assert len(loads) == 1
+        stats = get_cache_stats()['test_hits_and_misses']
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+
+    def test_get(self, app):
+        cache = TTLCache(name='test_get')
+        assert cache.get('foo') is None
+        cache.put(key='foo', value=0, ttl_seconds=60)
+        assert cache.get('foo', default=-1) == 0
+        assert cache.stats()['hitRate'] == 0.5
+
+    def test_expiry(self, app):
+        cache = TTLCache(name='test_expiry')
+        cache.put(key='foo', value='bar', ttl_seconds=0.01)
+        sleep(0.02)
+        assert cache.get_or_load(key='foo', load=lambda: 'baz', ttl_seconds=60) == 'baz'
+
+    def test_evicts_least_recently_used(self, app):
+        cache = TTLCache(max_size=2, name='test_evicts_least_recently_used')
+        cache.put(key='a', value=1, ttl_seconds=60)
+        cache.put(key='b', value=2, ttl_seconds=60)
+        cache.get_or_load(key='a', load=lambda: None, ttl_seconds=60)
+        cache.put(key='c', value=3, ttl_seconds=60)
+        assert list(cache.entries.keys()) == ['a', 'c']
+        assert cache.stats()['evictions'] == 1
+
+    def test_invalidate_where(self, app):
+        cache = TTLCache(name='test_invalidate_where')
+        for key in [(1, 10, False), (2, 10, True), (1, 11, False)]:
+            cache.put(key=key, value=True, ttl_seconds=60)
+        cache.invalidate_where(1, 10)
+        assert list(cache.entries.keys()) == [(1, 11, False)]
+        cache.invalidate((1, 11, False))
+        assert cache.stats()['size'] == 0
@@ -0,0 +1,55 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from squiggy.lib.presence import LocalPresence
+
+
+class TestLocalPresence:
+    """In-process presence backend."""
+
+    def test_touch_and_remove(self, app):
+        presence = LocalPresence()
+        presence.touch(socket_id='socket-1', user_id=1, whiteboard_id=10)
+        presence.touch(socket_id='socket-2', user_id=2, whiteboard_id=10)
+        presence.touch(socket_id='socket-3', user_id=1, whiteboard_id=11)
+        assert presence.get_user_ids_online([10, 11, 12]) == {10: {1, 2}, 11: {1}, 12: set()}
+
+        presence.remove('socket-2')
+        assert presence.get_user_ids_online([10]) == {10: {1}}
+
+    def test_socket_moves_to_other_whiteboard(self, app):
+        presence = LocalPresence()
+        presence.touch(socket_id='socket-1', user_id=1, whiteboard_id=10)
+        presence.touch(socket_id='socket-1', user_id=1, whiteboard_id=11)
+        assert presence.get_user_ids_online([10, 11]) == {10: set(), 11: {1}}
+
+    def test_expired(self, app):
+        presence = LocalPresence()
+        presence.touch(socket_id='socket-1', user_id=1, whiteboard_id=10)
+        user_id, whiteboard_id, last_seen = presence.sessions['socket-1']
+        presence.sessions['socket-1'] = (user_id, whiteboard_id, last_seen - (app.config['WHITEBOARD_SESSION_EXPIRATION_MINUTES'] * 60) - 1)
+        assert presence.get_user_ids_online([10]) == {10: set()}
+        presence.prune()
+        assert presence.sessions == {}
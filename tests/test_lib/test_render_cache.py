@@ -0,0 +1,101 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+from time import time
+
+import pytest
+from squiggy.lib.aws import put_binary_data_to_s3, put_chunks_to_s3
+from squiggy.lib.render_cache import get_render_key, get_s3_render_key, RenderCache
+from tests.util import mock_s3_bucket, mock_whiteboard_element, override_config
+
+SIGNED_SRC = 'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/deadd00d.png?Expires={expires}&Signature={signature}'
+
+
+@pytest.fixture()
+def render_cache(app, tmp_path):
+    with override_config(app, 'WHITEBOARD_RENDER_CACHE_DIR', str(tmp_path)):
+        yield RenderCache()
+
+
+class TestRenderCache:
+    """Whiteboard PNGs by content hash."""
+
+    def test_render_key_ignores_url_signature_and_list_order(self):
+        first = [
+            mock_whiteboard_element(element_type='image', uuid='a', z_index=0, src=SIGNED_SRC.format(expires=1, signature='x')),
+            mock_whiteboard_element(element_type='image', uuid='b', z_index=1),
+        ]
+        second = [
+            mock_whiteboard_element(element_type='image', uuid='b', z_index=1),
+            mock_whiteboard_element(element_type='image', uuid='a', z_index=0, src=SIGNED_SRC.format(expires=2, signature='y')),
+        ]
+        assert get_render_key(first) == get_render_key(second)
+        # Stacking order is rendered, so it counts.
+        second[1]['zIndex'] = 2
+        assert get_render_key(first) != get_render_key(second)
+
+    def test_disk_evicts_least_recently_used(self, app, render_cache, tmp_path):
+        with override_config(app, 'WHITEBOARD_RENDER_CACHE_MAX_BYTES', 25):
+            render_cache.put(png=b'0123456789', render_key='a')
+            render_cache.put(png=b'0123456789', render_key='b')
+            _set_last_used(tmp_path, render_key='a', seconds_ago=20)
+            _set_last_used(tmp_path, render_key='b', seconds_ago=10)
+            assert render_cache.get('a', check_s3=False) == b'0123456789'
+            render_cache.put(png=b'0123456789', render_key='c')
+            assert render_cache.get('b', check_s3=False) is None
+            assert render_cache.get('a', check_s3=False) is not None
+            assert render_cache.get('c', check_s3=False) is not None
+        stats = render_cache.stats()
+        assert stats['diskHits'] == 3
+        assert stats['evictions'] == 1
+        assert stats['misses'] == 1
+
+    def test_s3_tier(self, app, render_cache):
+        with mock_s3_bucket(app):
+            assert render_cache.get('d') is None
+            put_binary_data_to_s3(app.config['S3_BUCKET'], get_s3_render_key('d'), b'PNG', 'image/png')
+            assert render_cache.get('d') == b'PNG'
+            # Now on disk, too.
+            assert render_cache.get('d', check_s3=False) == b'PNG'
+        assert render_cache.stats()['s3Hits'] == 1
+
+    def test_partial_png_is_not_cached(self, app, render_cache, tmp_path):
+        def _failed_render():
+            yield b'PN'
+            raise RuntimeError('Render worker exited')
+
+        with mock_s3_bucket(app):
+            with pytest.raises(RuntimeError):
+                put_chunks_to_s3(app.config['S3_BUCKET'], get_s3_render_key('e'), render_cache.put_chunks(_failed_render(), 'e'), 'image/png')
+            assert render_cache.get('e') is None
+            assert os.listdir(tmp_path) == []
+            assert put_chunks_to_s3(app.config['S3_BUCKET'], get_s3_render_key('f'), render_cache.put_chunks([b'PN', b'G'], 'f'), 'image/png')
+            assert render_cache.get('f', check_s3=False) == b'PNG'
+
+
+def _set_last_used(directory, render_key, seconds_ago):
+    timestamp = time() - seconds_ago
+    os.utime(os.path.join(directory, f'{render_key}.png'), (timestamp, timestamp))
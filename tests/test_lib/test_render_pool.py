@@ -0,0 +1,103 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+
+import pytest
+from squiggy.lib.render_pool import RenderError, RenderPool
+from tests.util import mock_whiteboard_element, override_config
+
+# Stand-in for whiteboard_render_worker.js: same protocol, no Fabric. The PNG is 'PNG:{element count}:{pid}', one frame
+# per character.
+MOCK_RENDER_WORKER = """
+const write = (data) => {
+  const frame = Buffer.alloc(4 + data.length)
+  frame.writeUInt32BE(data.length, 0)
+  data.copy(frame, 4)
+  process.stdout.write(frame)
+}
+let buffer = Buffer.alloc(0)
+process.stdin.on('data', (data) => {
+  buffer = Buffer.concat([buffer, data])
+  while (buffer.length >= 4 && buffer.length >= 4 + buffer.readUInt32BE(0)) {
+    const length = buffer.readUInt32BE(0)
+    const request = JSON.parse(buffer.subarray(4, 4 + length).toString('utf8'))
+    buffer = buffer.subarray(4 + length)
+    const elements = request.whiteboardElements || []
+    const failed = elements.some(e => e.element.type === 'boom')
+    const png = request.type === 'render' && !failed ? `PNG:${elements.length}:${process.pid}` : ''
+    png.split('').forEach(c => write(Buffer.from(c)))
+    write(Buffer.alloc(0))
+    write(Buffer.from(JSON.stringify({id: request.id, status: failed ? 'error' : 'ok', error: failed ? 'boom' : null})))
+  }
+})
+"""
+
+
+@pytest.fixture()
+def render_pool(app, tmp_path):
+    os.makedirs(tmp_path / 'scripts' / 'node_js')
+    with open(tmp_path / 'scripts' / 'node_js' / 'whiteboard_render_worker.js', 'w') as f:
+        f.write(MOCK_RENDER_WORKER)
+    with override_config(app, 'BASE_DIR', str(tmp_path)), override_config(app, 'WHITEBOARD_RENDER_WORKER_MAX_RENDERS', 2):
+        pool = RenderPool()
+        yield pool
+        pool.shutdown()
+
+
+class TestRenderPool:
+    """Pool of long-lived render workers."""
+
+    def test_worker_is_reused_then_restarted(self, render_pool):
+        pngs = [render_pool.render([mock_whiteboard_element()] * count).decode() for count in range(3)]
+        assert [png.split(':')[1] for png in pngs] == ['0', '1', '2']
+        pids = [png.split(':')[2] for png in pngs]
+        assert pids[0] == pids[1]
+        assert pids[2] != pids[1]
+        stats = render_pool.stats()
+        assert stats['renders'] == 3
+        assert stats['restarts'] == 1
+        assert stats['starts'] == 2
+
+    def test_failed_render_discards_worker(self, render_pool):
+        with pytest.raises(RenderError):
+            render_pool.render([mock_whiteboard_element(element_type='boom')])
+        assert render_pool.stats()['errors'] == 1
+        assert render_pool.stats()['idleWorkers'] == 0
+        assert render_pool.render([]).startswith(b'PNG:0:')
+
+    def test_stream(self, render_pool):
+        chunks = list(render_pool.render_stream([mock_whiteboard_element()]))
+        assert chunks[0:3] == [b'P', b'N', b'G']
+        assert render_pool.stats()['idleWorkers'] == 1
+        # A consumer that stops early leaves the worker mid-response, so it is not reused.
+        stream = render_pool.render_stream([mock_whiteboard_element()])
+        assert next(stream) == b'P'
+        stream.close()
+        stats = render_pool.stats()
+        assert stats['idleWorkers'] == 0
+        assert stats['renders'] == 1
+        pid = b''.join(chunks).decode().split(':')[2]
+        assert render_pool.render([]).decode().split(':')[2] != pid
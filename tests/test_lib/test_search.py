@@ -23,22 +23,18 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-import os
-import weakref
+from squiggy.lib.search import to_prefix_tsquery
 
 
-class FileRemover(object):
+class TestSearch:
+    """Keywords to tsquery."""
 
-    def __init__(self):
-        self.weak_references = dict()
+    def test_every_word_is_a_prefix(self):
+        assert to_prefix_tsquery('Photo  SYNTHESIS') == 'photo:* & synthesis:*'
 
-    def clean_up_when_done(self, response, file_path):
-        wr = weakref.ref(response, self._do_cleanup)
-        self.weak_references[wr] = file_path
+    def test_punctuation_is_dropped(self):
+        assert to_prefix_tsquery("o'brien: (notes) & drafts_2!") == 'o:* & brien:* & notes:* & drafts:* & 2:*'
 
-    def _do_cleanup(self, wr):
-        file_path = self.weak_references[wr]
-        os.remove(file_path)
-
-
-file_remover = FileRemover()
+    def test_no_words(self):
+        assert to_prefix_tsquery(None) is None
+        assert to_prefix_tsquery(' !? ') is None
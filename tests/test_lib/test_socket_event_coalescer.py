@@ -0,0 +1,134 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from squiggy.lib.socket_event_coalescer import SocketEventCoalescer
+from squiggy.lib.whiteboard_state import whiteboard_state
+from squiggy.models.whiteboard_element import WhiteboardElement
+from tests.util import mock_whiteboard_element, override_config
+
+
+class TestSocketEventCoalescer:
+    """Per-room coalescing of socket.io upserts."""
+
+    def test_latest_upsert_wins(self):
+        coalescer = SocketEventCoalescer()
+        for text in ['a', 'ab', 'abc']:
+            coalescer.add(
+                actor=(1, 2),
+                room='whiteboard-3',
+                socket_id='socket-1',
+                whiteboard_elements=[mock_whiteboard_element('uuid-1', text=text)],
+                whiteboard_id=3,
+            )
+        pending = coalescer.pending[3]
+        assert list(pending.keys()) == ['uuid-1']
+        assert pending['uuid-1']['whiteboardElement']['element']['text'] == 'abc'
+        assert coalescer.sessions[3] == {'socket-1': 2}
+
+    def test_discard(self):
+        coalescer = SocketEventCoalescer()
+        coalescer.add(
+            actor=(1, 2),
+            room='whiteboard-3',
+            socket_id='socket-1',
+            whiteboard_elements=[mock_whiteboard_element('uuid-1'), mock_whiteboard_element('uuid-2')],
+            whiteboard_id=3,
+        )
+        coalescer.discard(uuids=['uuid-1'], whiteboard_id=3)
+        assert list(coalescer.pending[3].keys()) == ['uuid-2']
+
+    def test_patches_are_merged(self):
+        """Patches of an element are merged, as is a patch of an element upserted in the same window."""
+        coalescer = SocketEventCoalescer()
+        for patch in [{'left': 1, 'top': 2}, {'fill': None, 'left': 3}]:
+            coalescer.add_patches(
+                actor=(1, 2),
+                patches=[{'element': patch, 'uuid': 'uuid-1'}],
+                room='whiteboard-3-coalesced',
+                socket_id='socket-1',
+                whiteboard_id=3,
+            )
+        coalescer.add(
+            actor=(1, 2),
+            room='whiteboard-3-coalesced',
+            socket_id='socket-1',
+            whiteboard_elements=[mock_whiteboard_element('uuid-2', fill='red', left=0)],
+            whiteboard_id=3,
+        )
+        coalescer.add_patches(
+            actor=(1, 2),
+            patches=[{'element': {'fill': None, 'left': 5}, 'uuid': 'uuid-2'}],
+            room='whiteboard-3-coalesced',
+            socket_id='socket-1',
+            whiteboard_id=3,
+        )
+        pending = coalescer.get_pending(3)
+        # None removes the property when the patch is saved.
+        assert pending['uuid-1']['patch'] == {'fill': None, 'left': 3, 'top': 2}
+        assert pending['uuid-2']['whiteboardElement']['element'] == {'left': 5, 'type': 'text', 'uuid': 'uuid-2'}
+        broadcasts = coalescer._broadcast(coalescer.pending[3], 3)
+        assert len(broadcasts) == 1
+        room, socket_id, whiteboard_elements, patches = broadcasts[0]
+        assert [w['element']['left'] for w in whiteboard_elements] == [5]
+        assert patches == [{'element': {'fill': None, 'left': 3, 'top': 2}, 'uuid': 'uuid-1'}]
+
+    def test_flush(self, app, mock_whiteboard):
+        """Saves the latest upserts of the window and broadcasts them to the room, once per sender."""
+        coalescer = SocketEventCoalescer()
+        whiteboard_id = mock_whiteboard['id']
+        for socket_id, uuid in [('socket-1', 'uuid-1'), ('socket-2', 'uuid-2'), ('socket-2', 'uuid-3')]:
+            coalescer.add(
+                actor=(mock_whiteboard['courseId'], mock_whiteboard['createdBy']),
+                room=f'whiteboard-{whiteboard_id}-coalesced',
+                socket_id=socket_id,
+                whiteboard_elements=[mock_whiteboard_element(uuid)],
+                whiteboard_id=whiteboard_id,
+            )
+        # Whiteboard loads see upserts not yet flushed.
+        pending = whiteboard_state.get_pending(whiteboard_id, buffered=coalescer.get_pending(whiteboard_id))
+        assert sorted(pending.keys()) == ['uuid-1', 'uuid-2', 'uuid-3']
+
+        broadcasts = coalescer._broadcast(coalescer.pending[whiteboard_id], whiteboard_id)
+        assert sorted((socket_id, len(w), len(p)) for _, socket_id, w, p in broadcasts) == [('socket-1', 1, 0), ('socket-2', 2, 0)]
+        with override_config(app, 'WHITEBOARD_STATE_WRITE_BEHIND', False):
+            assert coalescer.flush(whiteboard_id) == 3
+        assert coalescer.pending == {}
+        saved = WhiteboardElement.find_all(uuids=['uuid-1', 'uuid-2', 'uuid-3'], whiteboard_id=whiteboard_id)
+        assert len(saved) == 3
+
+    def test_failed_save_is_retried(self, app):
+        """Upserts which fail to save are requeued, and are not broadcast again."""
+        coalescer = SocketEventCoalescer()
+        coalescer.add(
+            actor=(1, 2),
+            room='whiteboard-0-coalesced',
+            socket_id='socket-1',
+            whiteboard_elements=[mock_whiteboard_element('uuid-1')],
+            whiteboard_id=0,
+        )
+        with override_config(app, 'WHITEBOARD_STATE_WRITE_BEHIND', False):
+            # No such whiteboard.
+            assert coalescer.flush(0) == 0
+        assert coalescer.pending[0]['uuid-1']['broadcast'] is True
@@ -0,0 +1,74 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import pytest
+from squiggy.lib.viewport import get_bounding_box, parse_viewport, prioritize_whiteboard_elements
+from tests.util import mock_whiteboard_element
+
+
+class TestViewport:
+    """Bounding boxes of Fabric objects and prioritized chunks of whiteboard elements."""
+
+    def test_bounding_box_of_centered_element(self):
+        assert get_bounding_box({'height': 20, 'left': 100, 'top': 50, 'width': 40}) == (80, 40, 120, 60)
+
+    def test_bounding_box_of_rotated_scaled_element(self):
+        element = {
+            'angle': 90,
+            'height': 20,
+            'left': 0,
+            'originX': 'left',
+            'originY': 'top',
+            'scaleX': 2,
+            'top': 0,
+            'width': 40,
+        }
+        bounding_box = [round(value, 6) for value in get_bounding_box(element)]
+        assert bounding_box == [-20, 0, 0, 80]
+
+    def test_bounding_box_unknown(self):
+        assert get_bounding_box({'type': 'text'}) is None
+
+    def test_parse_viewport(self):
+        assert parse_viewport('10,20,100,50') == {'bottom': 70, 'left': 10, 'right': 110, 'top': 20}
+        assert parse_viewport({'height': 50, 'left': 10, 'top': 20, 'width': 100})['right'] == 110
+        for invalid in ['10,20', '10,20,0,50', 'a,b,c,d', None]:
+            with pytest.raises(ValueError):
+                parse_viewport(invalid)
+
+    def test_visible_first_then_nearest(self):
+        whiteboard_elements = [
+            mock_whiteboard_element('far', height=10, left=5000, top=50, width=10, z_index=0),
+            mock_whiteboard_element('near', height=10, left=500, top=50, width=10, z_index=1),
+            mock_whiteboard_element('visible', height=10, left=50, top=50, width=10, z_index=2),
+            mock_whiteboard_element('unknown', height=10, left=None, top=50, width=10, z_index=3),
+            mock_whiteboard_element('nearer', height=10, left=300, top=50, width=10, z_index=4),
+        ]
+        chunks = prioritize_whiteboard_elements(
+            chunk_size=2,
+            viewport=parse_viewport('0,0,100,100'),
+            whiteboard_elements=whiteboard_elements,
+        )
+        assert [[w['uuid'] for w in chunk] for chunk in chunks] == [['visible', 'unknown'], ['near', 'nearer'], ['far']]
@@ -0,0 +1,84 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from squiggy.lib.whiteboard_housekeeping import get_whiteboard_housekeeping_stats, WhiteboardHousekeeping
+from squiggy.models.whiteboard_operation import WhiteboardOperation
+from squiggy.models.whiteboard_preview_queue import WhiteboardPreviewQueue
+from squiggy.models.whiteboard_snapshot import WhiteboardSnapshot
+from tests.util import override_config
+
+
+class TestWhiteboardHousekeeping:
+    """Queue of whiteboards due a preview image."""
+
+    def test_claim_and_complete(self, app, mock_whiteboard):
+        whiteboard_id = mock_whiteboard['id']
+        WhiteboardHousekeeping.queue_for_preview_image(str(whiteboard_id))
+        assert get_whiteboard_housekeeping_stats()['queueDepth'] == 1
+        # Within the quiet period, the whiteboard is not due.
+        assert _claim(quiet_seconds=3600) == []
+
+        claims = _claim()
+        assert [c['whiteboardId'] for c in claims] == [whiteboard_id]
+        assert claims[0]['attempts'] == 1
+        # Claimed whiteboards are hidden from other servers.
+        assert _claim() == []
+
+        WhiteboardPreviewQueue.complete(queued_at=claims[0]['queuedAt'], whiteboard_id=whiteboard_id)
+        assert WhiteboardPreviewQueue.get_depth() == 0
+
+    def test_retry_then_give_up(self, app, mock_whiteboard):
+        whiteboard_id = mock_whiteboard['id']
+        WhiteboardPreviewQueue.enqueue(whiteboard_id)
+        claims = _claim()
+        assert len(claims) == 1
+        WhiteboardPreviewQueue.fail(max_attempts=2, retry_seconds=60, whiteboard_id=whiteboard_id)
+        # One attempt left, after a delay.
+        assert WhiteboardPreviewQueue.get_depth() == 1
+        assert _claim() == []
+
+        WhiteboardPreviewQueue.fail(max_attempts=1, retry_seconds=60, whiteboard_id=whiteboard_id)
+        assert WhiteboardPreviewQueue.get_depth() == 0
+
+    def test_compact_operation_log(self, app, mock_whiteboard):
+        """Whiteboards get a snapshot once their operation log passes the interval."""
+        whiteboard_id = mock_whiteboard['id']
+        whiteboard_elements = WhiteboardSnapshot.get_whiteboard_elements(whiteboard_id)
+        with override_config(app, 'WHITEBOARD_SNAPSHOT_INTERVAL', 1):
+            assert whiteboard_id in WhiteboardSnapshot.get_whiteboard_ids_due(limit=10000)
+            WhiteboardSnapshot.compact(whiteboard_id)
+            assert whiteboard_id not in WhiteboardSnapshot.get_whiteboard_ids_due(limit=10000)
+        snapshot = WhiteboardSnapshot.find_latest(whiteboard_id)
+        assert snapshot.version == WhiteboardOperation.get_current_version(whiteboard_id)
+        assert snapshot.to_whiteboard_elements() == whiteboard_elements
+
+
+def _claim(quiet_seconds=0):
+    return WhiteboardPreviewQueue.claim(
+        limit=10,
+        max_attempts=3,
+        quiet_seconds=quiet_seconds,
+        visibility_timeout=300,
+    )
@@ -0,0 +1,138 @@
+"""
+Copyright ©2023. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from squiggy.lib.whiteboard_state import WhiteboardStateStore, WORKER_ID
+from tests.util import mock_whiteboard_element
+
+
+class TestWhiteboardState:
+    """In-memory state of whiteboard edits, not yet saved."""
+
+    def test_latest_edit_wins(self):
+        store = WhiteboardStateStore()
+        store.apply(course_id=1, user_id=2, whiteboard_elements=[mock_whiteboard_element('a', text='first')], whiteboard_id=3)
+        store.apply(course_id=1, user_id=4, whiteboard_elements=[mock_whiteboard_element('a', text='second')], whiteboard_id=3)
+        pending = store.get_pending(3)
+        assert list(pending.keys()) == ['a']
+        assert pending['a']['element']['text'] == 'second'
+        # Creator of the element keeps the credit.
+        assert store.dirty[3]['a']['actor'] == (1, 2)
+
+    def test_discard(self):
+        store = WhiteboardStateStore()
+        store.apply(
+            course_id=1,
+            user_id=2,
+            whiteboard_elements=[mock_whiteboard_element('a'), mock_whiteboard_element('b')],
+            whiteboard_id=3,
+        )
+        store.discard(uuids=['a'], whiteboard_id=3)
+        assert list(store.get_pending(3).keys()) == ['b']
+
+    def test_peer_edits(self):
+        store = WhiteboardStateStore()
+        store.handle_peer_message({
+            'edits': [{'version': 7, 'whiteboardElement': mock_whiteboard_element('a', text='peer')}],
+            'origin': 'peer',
+            'type': 'apply',
+            'whiteboardId': 3,
+        })
+        assert store.get_pending(3)['a']['element']['text'] == 'peer'
+        # Stale 'saved' message does not clear a newer version.
+        store.handle_peer_message({'origin': 'peer', 'type': 'saved', 'versions': {'a': 6}, 'whiteboardId': 3})
+        assert 'a' in store.get_pending(3)
+        store.handle_peer_message({'origin': 'peer', 'type': 'saved', 'versions': {'a': 7}, 'whiteboardId': 3})
+        assert store.get_pending(3) == {}
+
+    def test_ignores_own_messages(self):
+        store = WhiteboardStateStore()
+        store.handle_peer_message({
+            'edits': [{'version': 1, 'whiteboardElement': mock_whiteboard_element('a')}],
+            'origin': WORKER_ID,
+            'type': 'apply',
+            'whiteboardId': 3,
+        })
+        assert store.get_pending(3) == {}
+
+    def test_newest_version_wins(self):
+        store = WhiteboardStateStore()
+        older, newer = store.reserve_versions(count=2, whiteboard_id=3)
+        assert older < newer
+        store.apply(course_id=1, user_id=2, versions=[newer], whiteboard_elements=[mock_whiteboard_element('a', text='newer')], whiteboard_id=3)
+        store.apply(course_id=1, user_id=2, versions=[older], whiteboard_elements=[mock_whiteboard_element('a', text='older')], whiteboard_id=3)
+        assert store.get_pending(3)['a']['element']['text'] == 'newer'
+        # A peer's copy is pending too, but it is older.
+        store.handle_peer_message({
+            'edits': [{'version': older, 'whiteboardElement': mock_whiteboard_element('a', text='peer')}],
+            'origin': 'peer',
+            'type': 'apply',
+            'whiteboardId': 3,
+        })
+        assert store.get_pending(3)['a']['element']['text'] == 'newer'
+
+    def test_patches(self):
+        store = WhiteboardStateStore()
+        store.apply(course_id=1, user_id=2, whiteboard_elements=[mock_whiteboard_element('a', fill='red', left=0)], whiteboard_id=3)
+        store.apply_patches(
+            course_id=1,
+            user_id=4,
+            patches=[{'element': {'fill': None, 'left': 5}, 'uuid': 'a'}, {'element': {'top': 1}, 'uuid': 'b'}],
+            whiteboard_id=3,
+        )
+        pending = store.get_pending(3)
+        assert pending['a']['element'] == {'left': 5, 'type': 'text', 'uuid': 'a'}
+        assert store.dirty[3]['a']['actor'] == (1, 2)
+        # Only changed properties of 'b' are known. They are merged into the saved element.
+        assert pending['b'] == {'patch': {'top': 1}}
+
+    def test_peer_patches_in_any_order(self):
+        store = WhiteboardStateStore()
+        older, newer = store.reserve_versions(count=2, whiteboard_id=3)
+        for version, patch in [(newer, {'left': 2}), (older, {'left': 1, 'top': 1})]:
+            store.handle_peer_message({
+                'edits': [{'patch': patch, 'uuid': 'a', 'version': version}],
+                'origin': 'peer',
+                'type': 'apply',
+                'whiteboardId': 3,
+            })
+        assert store.get_pending(3)['a'] == {'patch': {'left': 2, 'top': 1}}
+
+    def test_saved_elsewhere(self):
+        store = WhiteboardStateStore()
+        store.apply(course_id=1, user_id=2, whiteboard_elements=[mock_whiteboard_element('a'), mock_whiteboard_element('b')], whiteboard_id=3)
+        # A direct save of 'a', e.g., by a REST request, is newer than the copy held in memory.
+        version = store.reserve_versions(count=1, whiteboard_id=3)[0]
+        store.forget_saved(versions_by_uuid={'a': version}, whiteboard_id=3)
+        assert list(store.get_pending(3).keys()) == ['b']
+
+    def test_leave(self):
+        store = WhiteboardStateStore()
+        store.join(socket_id='s1', whiteboard_id=3)
+        store.join(socket_id='s2', whiteboard_id=3)
+        store.apply(course_id=1, user_id=2, whiteboard_elements=[mock_whiteboard_element('a')], whiteboard_id=3)
+        # Edits stay in memory while sockets remain.
+        store.leave('s1')
+        assert 'a' in store.get_pending(3)
+        assert store.socket_ids_per_whiteboard_id[3] == {'s2'}
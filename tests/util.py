@@ -27,15 +27,21 @@ from contextlib import contextmanager
 
 import boto3
 import moto
+from squiggy.lib.aws import s3_client_registry
 
 
 @contextmanager
 def mock_s3_bucket(app):
-    with moto.mock_s3():
-        bucket = app.config['S3_BUCKET']
-        s3 = boto3.resource('s3', app.config['S3_REGION'])
-        s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': app.config['S3_REGION']})
-        yield s3
+    # Clients created outside the mock do not see it.
+    s3_client_registry.clear()
+    try:
+        with moto.mock_s3():
+            bucket = app.config['S3_BUCKET']
+            s3 = boto3.resource('s3', app.config['S3_REGION'])
+            s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': app.config['S3_REGION']})
+            yield s3
+    finally:
+        s3_client_registry.clear()
 
 
 @contextmanager
@@ -47,3 +53,14 @@ def override_config(app, key, value):
         yield
     finally:
         app.config[key] = old_value
+
+
+def mock_whiteboard_element(uuid=None, element_type='text', z_index=None, **element):
+    """Whiteboard element as the client sends it. Element properties with value None are left out."""
+    element = {'type': element_type, 'uuid': uuid, **element}
+    return {
+        'assetId': None,
+        'element': {key: value for key, value in element.items() if value is not None},
+        'uuid': uuid,
+        'zIndex': z_index,
+    }